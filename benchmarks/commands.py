@@ -0,0 +1,103 @@
+"""
+End to end benchmark of the Commands over a synthetic home with a local bare remote.
+
+Every repetition creates a new home, so the commands are measured in the same state every time:
+
+- show_list: list untracked dotfiles
+- show_status: status after changing the tracked files
+- add: add one more dotfile to the repo
+- commit: commit the changes and push them to the remote
+- populate: populate all tracked files into the home where they were replaced by the plain files (like on a new host,
+  so every file is moved to the backup)
+
+    $ python -m benchmarks.commands --dotfiles 1000 --tracked 100 --repeat 5 --output commands.json
+"""
+import json
+import sys
+from argparse import ArgumentParser
+from shutil import rmtree
+from statistics import median
+from tempfile import mkdtemp
+from time import perf_counter
+
+from git import Repo
+
+from benchmarks.synthetic import HomeSpec
+from benchmarks.synthetic import change_tracked
+from benchmarks.synthetic import make_commands
+from benchmarks.synthetic import make_home
+from benchmarks.synthetic import replace_links
+
+METRICS = ['show_list', 'show_status', 'add', 'commit', 'populate']
+
+
+def timed(function, *args):
+    """
+    Run the function (and exhaust the generator it returns). Return time in seconds.
+    """
+    start = perf_counter()
+    result = function(*args)
+    if hasattr(result, '__next__'):
+        for _ in result:
+            pass
+    return perf_counter() - start
+
+
+def measure(spec):
+    """
+    Measure all the commands once. Return seconds for every metric.
+    """
+    root = mkdtemp()
+    try:
+        home_path, _, paths = make_home(root, spec)
+        change_tracked(home_path, paths[:spec.tracked])
+        result = dict(
+            show_list=timed(make_commands(home_path).show_list),
+            show_status=timed(make_commands(home_path).show_status),
+            add=timed(make_commands(home_path).add, paths[-1]),
+            commit=timed(make_commands(home_path).commit, 'benchmark'),
+        )
+
+        replace_links(paths[:spec.tracked], spec.file_size)
+        result['populate'] = timed(make_commands(home_path).populate)
+        return result
+    finally:
+        rmtree(root)
+
+
+def run_benchmark(spec, repeat):
+    """
+    Measure the commands. Median of the repetitions is reported, with all the samples.
+    """
+    samples = [measure(spec) for _ in range(repeat)]
+    return dict(
+        spec=spec.to_dict(),
+        python=sys.version.split()[0],
+        git=Repo.GitCommandWrapperType().version_info,
+        results={name: median(sample[name] for sample in samples) for name in METRICS},
+        samples={name: [sample[name] for sample in samples] for name in METRICS},
+    )
+
+
+def main():
+    parser = ArgumentParser(description='cs commands benchmark')
+    parser.add_argument('--dotfiles', type=int, default=100, help='number of dotfiles in the home')
+    parser.add_argument('--depth', type=int, default=2, help='depth of the dot folders')
+    parser.add_argument('--ignore-patterns', type=int, default=10, help='number of the ignore patterns')
+    parser.add_argument('--tracked', type=int, default=20, help='number of the tracked dotfiles')
+    parser.add_argument('--file-size', type=int, default=1024, help='size of every file in bytes')
+    parser.add_argument('--repeat', type=int, default=3, help='number of measurements')
+    parser.add_argument('--output', help='write results to this file instead of stdout')
+    args = parser.parse_args()
+
+    spec = HomeSpec(args.dotfiles, args.depth, args.ignore_patterns, args.tracked, args.file_size)
+    results = json.dumps(run_benchmark(spec, args.repeat), indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(results)
+    else:
+        print(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""
+Performance regression gate. Run the commands benchmark (benchmarks.commands) with the spec of the baseline file and
+fail when any command is slower than the baseline by more than its tolerance.
+
+    $ python -m benchmarks.gate --baseline benchmarks/baseline.json
+    $ python -m benchmarks.gate --baseline benchmarks/baseline.json --update
+
+Timings of the baseline are absolute, so the baseline has to be written (--update) on the machine which runs the gate
+(the CI runner).
+
+Every command is measured --repeat times. Outliers (further than --outlier-mads median absolute deviations from the
+median) are rejected and the median of the rest is compared. Tolerances are relative, for example 0.25 allows the
+command to be 25% slower. They are stored in the baseline file:
+
+    {"tolerances": {"default": 0.25, "commit": 0.5}, "results": {...}, "spec": {...}}
+"""
+import json
+import sys
+from argparse import ArgumentParser
+from os.path import exists
+from statistics import median
+
+from benchmarks.commands import METRICS
+from benchmarks.commands import measure
+from benchmarks.synthetic import HomeSpec
+
+DEFAULT_TOLERANCE = 0.25
+# scale of the median absolute deviation, so it estimates the standard deviation for the normal distribution
+MAD_SCALE = 1.4826
+
+
+def reject_outliers(samples, mads=3.0):
+    """
+    Remove samples further than given number of median absolute deviations from the median.
+    """
+    center = median(samples)
+    deviation = median(abs(sample - center) for sample in samples) * MAD_SCALE
+    if not deviation:
+        return list(samples)
+    return [sample for sample in samples if abs(sample - center) <= mads * deviation]
+
+
+def collect(spec, repeat, mads, warmup=1):
+    """
+    Measure the commands. Return the median of samples without outliers and number of rejected samples. First runs
+    (imports, caches of the git) are not counted.
+    """
+    for _ in range(warmup):
+        measure(spec)
+    samples = [measure(spec) for _ in range(repeat)]
+    results = {}
+    rejected = {}
+    for name in METRICS:
+        values = [sample[name] for sample in samples]
+        kept = reject_outliers(values, mads)
+        results[name] = median(kept)
+        rejected[name] = len(values) - len(kept)
+    return results, rejected
+
+
+def compare(baseline, results):
+    """
+    Compare results with the baseline. Return list of rows: (metric, baseline, current, change, tolerance, status).
+    Status is "ok", "slower" (regression) or "faster" (improvement bigger than the tolerance).
+    """
+    tolerances = baseline.get('tolerances', {})
+    rows = []
+    for name in METRICS:
+        expected = baseline['results'][name]
+        current = results[name]
+        tolerance = tolerances.get(name, tolerances.get('default', DEFAULT_TOLERANCE))
+        change = current / expected - 1
+        if change > tolerance:
+            status = 'slower'
+        elif change < -tolerance:
+            status = 'faster'
+        else:
+            status = 'ok'
+        rows.append((name, expected, current, change, tolerance, status))
+    return rows
+
+
+def format_rows(rows, rejected):
+    """
+    Format comparison as a table.
+    """
+    lines = ['{:<12} {:>10} {:>10} {:>8} {:>7} {:>8}  {}'.format(
+        'command', 'baseline', 'current', 'change', 'limit', 'outliers', 'status')]
+    for name, expected, current, change, tolerance, status in rows:
+        lines.append('{:<12} {:>8.2f}ms {:>8.2f}ms {:>+7.1%} {:>+6.0%} {:>8}  {}'.format(
+            name,
+            expected * 1000,
+            current * 1000,
+            change,
+            tolerance,
+            rejected[name],
+            status.upper() if status == 'slower' else status,
+        ))
+    return '\n'.join(lines)
+
+
+def load_baseline(path):
+    with open(path) as file:
+        return json.load(file)
+
+
+def write_baseline(path, spec, results, tolerances):
+    with open(path, 'w') as file:
+        data = dict(spec=spec.to_dict(), results=results, tolerances=tolerances)
+        file.write(json.dumps(data, indent=2, sort_keys=True))
+        file.write('\n')
+
+
+def main():
+    parser = ArgumentParser(description='cs performance regression gate')
+    parser.add_argument('--baseline', default='benchmarks/baseline.json', help='baseline file')
+    parser.add_argument('--update', action='store_true', help='write current results to the baseline file')
+    parser.add_argument('--repeat', type=int, default=7, help='number of measurements')
+    parser.add_argument('--warmup', type=int, default=1, help='number of not counted runs')
+    parser.add_argument('--outlier-mads', type=float, default=3.0, help='outlier rejection threshold')
+    args = parser.parse_args()
+
+    baseline = load_baseline(args.baseline) if exists(args.baseline) else {}
+    spec = HomeSpec(**baseline.get('spec', {}))
+    results, rejected = collect(spec, args.repeat, args.outlier_mads, args.warmup)
+
+    if args.update or not baseline:
+        tolerances = baseline.get('tolerances', {'default': DEFAULT_TOLERANCE})
+        write_baseline(args.baseline, spec, results, tolerances)
+        print('Baseline written to {}'.format(args.baseline))
+        return
+
+    rows = compare(baseline, results)
+    print(format_rows(rows, rejected))
+    slower = [row[0] for row in rows if row[5] == 'slower']
+    if slower:
+        print()
+        print('Performance regression in: {}'.format(', '.join(slower)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Setup cost of a command (opening the repo and checking if the branch is initialized) for repos with many refs.
+
+    $ python -m benchmarks.setup_cost --refs 0 1000 10000 --repeat 20
+"""
+import json
+from argparse import ArgumentParser
+from os.path import join
+from statistics import median
+from tempfile import mkdtemp
+from time import perf_counter
+
+from confsave.app import Application
+
+
+def make_app(repo_path):
+    app = Application()
+    app.update_settings(repo_path=repo_path, home_path=mkdtemp())
+    return app
+
+
+def make_repo(refs):
+    """
+    Create initialized repo with given number of tags. Tags are written to packed-refs, like after git gc.
+    """
+    repo_path = join(mkdtemp(), 'repo')
+    app = make_app(repo_path)
+    app.repo.init_git_repo()
+    app.repo.init_branch()
+    head = app.repo.git.head.commit.hexsha
+    with open(join(app.repo.git.git_dir, 'packed-refs'), 'w') as file:
+        file.write('# pack-refs with: peeled fully-peeled sorted\n')
+        for index in range(refs):
+            file.write('{} refs/tags/tag{:08d}\n'.format(head, index))
+    return repo_path
+
+
+def measure(repo_path):
+    """
+    Time setup of a single command, like a fresh cs process does.
+    """
+    app = make_app(repo_path)
+    start = perf_counter()
+    app.repo.init_git_repo()
+    opened = perf_counter()
+    app.repo.init_branch()
+    end = perf_counter()
+    app.repo.git.close()
+    return dict(init_git_repo=opened - start, init_branch=end - opened, total=end - start)
+
+
+def run_benchmark(refs_counts, repeat):
+    results = {}
+    for refs in refs_counts:
+        repo_path = make_repo(refs)
+        samples = [measure(repo_path) for _ in range(repeat)]
+        results[str(refs)] = {
+            name: median(sample[name] for sample in samples)
+            for name in ['init_git_repo', 'init_branch', 'total']
+        }
+    return results
+
+
+def main():
+    parser = ArgumentParser(description='cs setup cost benchmark')
+    parser.add_argument('--refs', type=int, nargs='+', default=[0, 1000, 10000], help='numbers of refs in the repo')
+    parser.add_argument('--repeat', type=int, default=20, help='number of measurements for every repo')
+    parser.add_argument('--output', help='write results to this file instead of stdout')
+    args = parser.parse_args()
+
+    results = json.dumps(run_benchmark(args.refs, args.repeat), indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(results)
+    else:
+        print(results)
+
+
+if __name__ == '__main__':
+    main()
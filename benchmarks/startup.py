@@ -0,0 +1,110 @@
+"""
+Startup benchmark of the cs command.
+
+Run every command path in a fresh interpreter with -X importtime and record the wall time, the time spent on imports
+and the number of imported modules. Results are written as JSON.
+
+    $ python -m benchmarks.startup --repeat 5 --output startup.json
+"""
+import json
+import sys
+from argparse import ArgumentParser
+from os import environ
+from os.path import abspath
+from os.path import dirname
+from os.path import join
+from statistics import median
+from subprocess import PIPE
+from subprocess import run
+from tempfile import mkdtemp
+from time import perf_counter
+
+ROOT = dirname(dirname(abspath(__file__)))
+RUN_CS = 'from confsave.cmd import run; run()'
+
+
+def get_command_paths(home_path):
+    """
+    Command paths to measure. Repo and home are temporary, so the benchmark never touches the user's configs.
+    """
+    paths = [
+        '--repo-path', join(home_path, '.confsave'),
+        '--home-path', home_path,
+    ]
+    return [
+        ('help', ['--help']),
+        ('validation_error', ['--add', join(home_path, 'not-existing')]),
+        ('list', ['--list'] + paths),
+        ('status', ['--status'] + paths),
+    ]
+
+
+def parse_importtime(stderr):
+    """
+    Parse -X importtime output. Return (total import time in seconds, number of imported modules).
+    """
+    total = 0
+    modules = 0
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        modules += 1
+        if not name[1:].startswith(' '):
+            # only top level imports, nested ones are already in the cumulative time
+            total += int(cumulative)
+    return total / 1000000.0, modules
+
+
+def measure(args):
+    """
+    Run cs with given arguments in a fresh interpreter.
+    """
+    env = dict(environ, PYTHONPATH=ROOT)
+    start = perf_counter()
+    process = run(
+        [sys.executable, '-X', 'importtime', '-c', RUN_CS] + args,
+        stdout=PIPE,
+        stderr=PIPE,
+        universal_newlines=True,
+        env=env,
+        cwd=ROOT,
+    )
+    wall = perf_counter() - start
+    imports, modules = parse_importtime(process.stderr)
+    return dict(wall=wall, imports=imports, modules=modules, returncode=process.returncode)
+
+
+def run_benchmark(repeat):
+    """
+    Measure all the command paths. Median of the repetitions is reported.
+    """
+    home_path = mkdtemp()
+    results = {}
+    for name, args in get_command_paths(home_path):
+        samples = [measure(args) for _ in range(repeat)]
+        results[name] = dict(
+            wall=median(sample['wall'] for sample in samples),
+            imports=median(sample['imports'] for sample in samples),
+            modules=samples[-1]['modules'],
+            returncode=samples[-1]['returncode'],
+        )
+    return results
+
+
+def main():
+    parser = ArgumentParser(description='cs startup benchmark')
+    parser.add_argument('--repeat', type=int, default=5, help='number of runs of every command path')
+    parser.add_argument('--output', help='write results to this file instead of stdout')
+    args = parser.parse_args()
+
+    results = json.dumps(run_benchmark(args.repeat), indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(results)
+    else:
+        print(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Synthetic home directories for the benchmarks.
+"""
+from os import makedirs
+from os import unlink
+from os import walk
+from os.path import isdir
+from os.path import join
+
+from git import Repo
+
+from confsave.app import Application
+from confsave.commands import Commands
+
+
+class HomeSpec(object):
+    """
+    Size of the synthetic home:
+
+    - dotfiles: number of dotfiles (and dot folders) in the home
+    - depth: every second dotfile is a folder with a file nested this deep (0 means only files)
+    - ignore_patterns: number of patterns in the .cs_ignore (none of them matches, so all are checked)
+    - tracked: number of dotfiles added to the repo
+    - file_size: size of every file in bytes
+    """
+
+    def __init__(self, dotfiles=100, depth=2, ignore_patterns=10, tracked=20, file_size=1024):
+        self.dotfiles = dotfiles
+        self.depth = depth
+        self.ignore_patterns = ignore_patterns
+        # one dotfile is always left for the add command
+        self.tracked = min(tracked, dotfiles - 1)
+        self.file_size = file_size
+
+    def to_dict(self):
+        return dict(vars(self))
+
+
+def make_commands(home_path):
+    """
+    Create Commands with own Application, like a fresh cs process does.
+    """
+    app = Application()
+    app.update_settings(repo_path=join(home_path, '.confsave'), home_path=home_path)
+    return Commands(app)
+
+
+def write_file(path, size):
+    with open(path, 'wb') as file:
+        file.write(b'x' * size)
+
+
+def make_dotfiles(home_path, spec):
+    """
+    Create dotfiles in the home. Return their paths.
+    """
+    paths = []
+    for index in range(spec.dotfiles):
+        path = join(home_path, '.dot{:05d}'.format(index))
+        if spec.depth and index % 2:
+            folder = join(path, *['level{}'.format(level) for level in range(spec.depth - 1)])
+            makedirs(folder)
+            write_file(join(folder, 'config'), spec.file_size)
+        else:
+            write_file(path, spec.file_size)
+        paths.append(path)
+    return paths
+
+
+def make_home(root, spec):
+    """
+    Create home with dotfiles, the repo tracking spec.tracked of them and the bare remote with everything pushed.
+    Return (home path, remote path, dotfiles paths).
+    """
+    home_path = join(root, 'home')
+    remote_path = join(root, 'remote.git')
+    makedirs(home_path)
+    paths = make_dotfiles(home_path, spec)
+    Repo.init(remote_path, bare=True)
+
+    commands = make_commands(home_path)
+    for path in paths[:spec.tracked]:
+        commands.add(path)
+    commands.set_repo(remote_path)
+    with open(commands.app.get_cs_ignore_path(), 'w') as file:
+        file.write('\n'.join('.ignored{:04d}*'.format(index) for index in range(spec.ignore_patterns)))
+    commands.commit('synthetic home')
+    return home_path, remote_path, paths
+
+
+def change_tracked(home_path, paths):
+    """
+    Append to all files of the given tracked paths (in the repo), so they show up in the status.
+    """
+    repo_path = join(home_path, '.confsave')
+    for path in paths:
+        target = join(repo_path, path[len(home_path) + 1:])
+        files = [join(root, name) for root, _, names in walk(target) for name in names] if isdir(target) else [target]
+        for name in files:
+            with open(name, 'ab') as file:
+                file.write(b'changed')
+
+
+def replace_links(paths, size):
+    """
+    Replace symlinks to the repo with plain files.
+    """
+    for path in paths:
+        unlink(path)
+        write_file(path, size)
@@ -0,0 +1,53 @@
+"""
+Python API of the confsave. Commands are returning result objects (or generators of them) instead of printing, so
+confsave can be used without running the cs command:
+
+    from confsave.api import get_commands
+
+    commands = get_commands(home_path='/home/user')
+    for result in commands.populate():
+        print(result.path, result.backup_path)
+"""
+from confsave.app import Application
+from confsave.commands import Commands
+from confsave.commands import PathNotInUserPath
+from confsave.instrumentation import Aggregator
+from confsave.instrumentation import Observer
+from confsave.instrumentation import register
+from confsave.instrumentation import unregister
+from confsave.lock import LockTimeout
+from confsave.results import AddResult
+from confsave.results import BundleResult
+from confsave.results import LinkResult
+from confsave.results import RepoCreated
+from confsave.results import StatusEntry
+from confsave.results import UntrackedPath
+from confsave.results import WatchState
+
+__all__ = [
+    'AddResult',
+    'Aggregator',
+    'Application',
+    'BundleResult',
+    'Commands',
+    'LinkResult',
+    'LockTimeout',
+    'Observer',
+    'PathNotInUserPath',
+    'RepoCreated',
+    'StatusEntry',
+    'UntrackedPath',
+    'WatchState',
+    'get_commands',
+    'register',
+    'unregister',
+]
+
+
+def get_commands(**settings):
+    """
+    Create Commands for a new Application. Settings are the same as the arguments of Application.update_settings.
+    """
+    app = Application()
+    app.update_settings(**settings)
+    return Commands(app)
@@ -1,9 +1,9 @@
 from os.path import abspath
 from os.path import expanduser
 from os.path import join
-from datetime import datetime
 
-from confsave.repo import LocalRepo
+from confsave.backups import BackupSession
+from confsave.instrumentation import span
 
 
 class Application(object):
@@ -12,20 +12,108 @@ class Application(object):
         REPO_PATH = '~/.confsave'
         HOME_PATH = '~'
         BACKUP_NAME = 'backup'
+        BACKUP_KEEP_LAST = None
+        BACKUP_MAX_AGE = None
+        BACKUP_MAX_SIZE = None
         CONFIG_FILENAME = '.confsave.yaml'
+        CONFIG_CACHE = 'confsave-config.cache'
+        CONFIG_JOURNAL = 'confsave.journal'
+        JOURNAL_LIMIT = 100
+        METRICS_STATE = 'confsave.metrics.json'
+        PROFILE_FILE = 'confsave.profile'
+        PROFILES_DIR = 'profiles'
+        RENDERED_DIR = 'rendered'
+        RENDER_INDEX = 'confsave.rendered.json'
+        VARIABLES_FILE = '.confsave.vars'
         GIT_IGNORE = '.gitignore'
         CS_IGNORE = '.cs_ignore'
+        SHARED_OBJECTS_PATH = None
+        DAEMON_SOCKET = '~/.confsave.sock'
+        LOCK_TIMEOUT = 60.0
+
+    DEFAULT_PROFILE = 'default'
 
     def __init__(self):
         self.settings = self.Settings()
-        self.repo = LocalRepo(self)
+        self._repo = None
+        self._lock = None
+        self._profile = None
+        self.backup_session = None
 
-    def get_repo_path(self):
+    @property
+    def repo(self):
+        """
+        Local repo. It is created on first use, so the git and yaml modules are imported only by the commands which need
+        them.
+        """
+        if self._repo is None:
+            with span('import'):
+                from confsave.repo import LocalRepo
+            self._repo = LocalRepo(self)
+        return self._repo
+
+    def get_main_repo_path(self):
         """
-        path to a local repo
+        path to the local repo with the default profile (the other profiles are worktrees in its .git folder)
         """
         return abspath(expanduser(self.settings.REPO_PATH))
 
+    def get_repo_path(self):
+        """
+        path to the working tree of the active profile
+        """
+        profile = self.get_profile()
+        if profile is None:
+            return self.get_main_repo_path()
+        return self.get_profile_path(profile)
+
+    def get_git_dir(self):
+        """
+        path to the git folder of the active profile (worktrees have own git folders in the main .git folder)
+        """
+        profile = self.get_profile()
+        if profile is None:
+            return join(self.get_main_repo_path(), '.git')
+        return join(self.get_main_repo_path(), '.git', 'worktrees', profile)
+
+    def get_profile_path(self, profile):
+        """
+        path to the worktree of the profile
+        """
+        return join(self.get_main_repo_path(), '.git', self.settings.PROFILES_DIR, profile)
+
+    def get_profile_state_path(self):
+        """
+        path to the file with the name of the active profile
+        """
+        return join(self.get_main_repo_path(), '.git', self.settings.PROFILE_FILE)
+
+    def get_profile(self):
+        """
+        name of the active profile or None for the default one
+        """
+        if self._profile is None:
+            self.load_profile()
+        return None if self._profile == self.DEFAULT_PROFILE else self._profile
+
+    def load_profile(self):
+        """
+        Read the active profile stored in the repo (it could be switched by other cs process since the last read).
+        """
+        try:
+            with open(self.get_profile_state_path()) as file:
+                self._profile = file.read().strip() or self.DEFAULT_PROFILE
+        except FileNotFoundError:
+            self._profile = self.DEFAULT_PROFILE
+
+    def set_profile(self, profile):
+        """
+        Store the active profile in the repo.
+        """
+        from confsave.journal import atomic_write
+        atomic_write(self.get_profile_state_path(), (profile + '\n').encode('utf8'))
+        self._profile = profile
+
     def get_home_path(self):
         """
         path to a user home directory
@@ -38,12 +126,63 @@ class Application(object):
         """
         return join(self.get_repo_path(), self.settings.CONFIG_FILENAME)
 
+    def start_backup_session(self):
+        """
+        Start new backup session. All backups made until the next session is started will be stored in one folder.
+        """
+        self.backup_session = BackupSession(self.settings.BACKUP_NAME)
+        return self.backup_session
+
+    def get_config_cache_path(self):
+        """
+        path to the binary cache of the config file (stored in the .git folder, so it is never commited) or None if the
+        cache is disabled
+        """
+        if self.settings.CONFIG_CACHE:
+            return join(self.get_git_dir(), self.settings.CONFIG_CACHE)
+        return None
+
+    def get_journal_path(self):
+        """
+        path to the journal of the tracked paths changes (stored in the .git folder, so it is never commited)
+        """
+        return join(self.get_git_dir(), self.settings.CONFIG_JOURNAL)
+
+    def get_metrics_state_path(self):
+        """
+        path to the state of the metrics exporter (stored in the .git folder, so it is never commited)
+        """
+        return join(self.get_git_dir(), self.settings.METRICS_STATE)
+
+    def get_rendered_path(self):
+        """
+        path to the rendered templates of the active profile (stored in the .git folder, so they are never commited)
+        """
+        return join(self.get_git_dir(), self.settings.RENDERED_DIR)
+
+    def get_render_index_path(self):
+        """
+        path to the index of the rendered templates (keys of the rendered outputs)
+        """
+        return join(self.get_git_dir(), self.settings.RENDER_INDEX)
+
+    def get_variables_path(self):
+        """
+        path to the host variables of the templates (in the user home directory)
+        """
+        return join(self.get_home_path(), self.settings.VARIABLES_FILE)
+
+    def get_backup_session(self):
+        """
+        Get current backup session (start one if needed).
+        """
+        return self.backup_session or self.start_backup_session()
+
     def get_backup_path(self):
         """
-        path to a backup dir
+        path to a backup dir of the current backup session
         """
-        name = self.settings.BACKUP_NAME + '_' + datetime.now().strftime('%y_%m_%d')
-        return join(self.get_repo_path(), name)
+        return join(self.get_repo_path(), self.get_backup_session().name)
 
     def get_gitignore_path(self):
         """
@@ -57,12 +196,64 @@ class Application(object):
         """
         return join(self.get_repo_path(), self.settings.CS_IGNORE)
 
-    def update_settings(self, repo_path=None, home_path=None, config_filename=None, backup_name=None):
+    def get_shared_object_store(self):
+        """
+        host-wide shared object store or None if not configured
+        """
+        if self.settings.SHARED_OBJECTS_PATH:
+            from confsave.objectstore import SharedObjectStore
+            return SharedObjectStore(self.settings.SHARED_OBJECTS_PATH)
+        return None
+
+    def get_daemon_socket_path(self):
+        """
+        path to the unix socket of the cs daemon
+        """
+        return abspath(expanduser(self.settings.DAEMON_SOCKET))
+
+    def get_lock_path(self):
+        """
+        path to the lock file of the local repo (next to the repo, so it can be taken before the repo is created)
+        """
+        return self.get_main_repo_path() + '.lock'
+
+    def get_lock(self):
+        """
+        Get lock of the local repo. The same lock object is used for the same path, so the lock is reentrant.
+        """
+        path = self.get_lock_path()
+        if self._lock is None or self._lock.path != path:
+            from confsave.lock import RepoLock
+            self._lock = RepoLock(path)
+        self._lock.timeout = self.settings.LOCK_TIMEOUT
+        return self._lock
+
+    def reset_settings(self):
+        """
+        Restore default settings.
+        """
+        self.settings = self.Settings()
+        self._profile = None
+
+    def update_settings(
+        self,
+        repo_path=None,
+        home_path=None,
+        config_filename=None,
+        backup_name=None,
+        backup_keep_last=None,
+        backup_max_age=None,
+        backup_max_size=None,
+        shared_objects_path=None,
+        lock_timeout=None,
+    ):
         """
         Update settings values.
         """
         if repo_path:
             self.settings.REPO_PATH = repo_path
+            # the active profile is stored in the repo
+            self._profile = None
 
         if home_path:
             self.settings.HOME_PATH = home_path
@@ -73,4 +264,17 @@ class Application(object):
         if backup_name:
             self.settings.BACKUP_NAME = backup_name
 
+        if backup_keep_last is not None:
+            self.settings.BACKUP_KEEP_LAST = backup_keep_last
+
+        if backup_max_age is not None:
+            self.settings.BACKUP_MAX_AGE = backup_max_age
+
+        if backup_max_size is not None:
+            self.settings.BACKUP_MAX_SIZE = backup_max_size
+
+        if shared_objects_path:
+            self.settings.SHARED_OBJECTS_PATH = shared_objects_path
 
+        if lock_timeout is not None:
+            self.settings.LOCK_TIMEOUT = lock_timeout
@@ -0,0 +1,108 @@
+import tarfile
+from os import chmod
+from os import mkdir
+from os import symlink
+from os import umask
+from os import sep
+from os.path import dirname
+from os.path import isdir
+from os.path import islink
+from os.path import join
+from os.path import normpath
+from os.path import realpath
+from shutil import copyfileobj
+
+from confsave.instrumentation import span
+from confsave.models import Endpoint
+
+
+class UnsafeArchiveMember(Exception):
+    pass
+
+
+class ArchiveImporter(object):
+    """
+    Import tar archive created by the export command into the user directory. Members are read one by one from the
+    stream, so the archive is never loaded into the memory. Existing files are moved to the backup, like in populate.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.links = set()
+        self.umask = 0o022
+
+    def import_archive(self, fileobj):
+        """
+        Import all members of the archive. Yield (endpoint, result) for every imported member. Modes of the members are
+        masked by the umask of the process (git archive makes files writable by the group).
+        """
+        self.links = set()
+        self.umask = get_umask()
+        with tarfile.open(fileobj=fileobj, mode='r|*') as archive:
+            for member in archive:
+                endpoint = Endpoint(self.app, self._get_member_path(member))
+                self._check_parent(member, endpoint)
+                yield endpoint, self._import_member(archive, member, endpoint)
+                if member.issym():
+                    self.links.add(endpoint.path)
+
+    def _get_member_path(self, member):
+        """
+        Get path of the member in the user directory. Raise UnsafeArchiveMember if it points outside of it.
+        """
+        name = normpath(member.name)
+        if name.startswith('/') or name == '..' or name.startswith('../'):
+            raise UnsafeArchiveMember(member.name)
+        return join(self.app.get_home_path(), name)
+
+    def _check_parent(self, member, endpoint):
+        """
+        Raise UnsafeArchiveMember if the member would be written through a symlink made by this import or if its
+        folder (with all the symlinks resolved) is outside of the user directory (and of the repo).
+        """
+        home = self.app.get_home_path()
+        folder = dirname(endpoint.path)
+        while folder.startswith(home + sep):
+            if folder in self.links:
+                raise UnsafeArchiveMember(member.name)
+            folder = dirname(folder)
+
+        folder = realpath(dirname(endpoint.path))
+        roots = [realpath(home), realpath(self.app.get_main_repo_path())]
+        if not any(folder == root or folder.startswith(root + sep) for root in roots):
+            raise UnsafeArchiveMember(member.name)
+
+    def _import_member(self, archive, member, endpoint):
+        result = dict(populated=False, backuped=False)
+        if member.isdir() and isdir(endpoint.path) and not islink(endpoint.path):
+            return result
+
+        if endpoint.is_existing() or endpoint.is_link():
+            endpoint._backup_local_file()
+            result['backuped'] = True
+
+        endpoint.make_folders(self.app.get_home_path())
+        if member.isdir():
+            with span('fs.mkdir', path=endpoint.path):
+                mkdir(endpoint.path)
+        elif member.issym():
+            with span('fs.symlink', path=endpoint.path):
+                symlink(member.linkname, endpoint.path)
+        elif member.isfile():
+            with open(endpoint.path, 'wb') as file:
+                copyfileobj(archive.extractfile(member), file)
+        else:
+            return result
+        if not member.issym():
+            chmod(endpoint.path, member.mode & ~self.umask)
+        result['populated'] = True
+        return result
+
+
+def get_umask():
+    """
+    Get umask of the process (it can be read only by setting it).
+    """
+    mask = umask(0)
+    umask(mask)
+    return mask
@@ -0,0 +1,104 @@
+from copy import copy
+from datetime import datetime
+from os.path import join
+from os.path import getmtime
+from time import time
+
+from confsave.disk import get_folder_size
+
+DAY = 24 * 60 * 60
+
+
+class BackupSession(object):
+    """
+    Backup session of a single run. The timestamp is fixed when the session is created, so all the backups made by one
+    command are stored in the same folder.
+    """
+    TIME_FORMAT = '%y_%m_%d_%H%M%S_%f'
+
+    def __init__(self, backup_name, now=None):
+        self.created_at = now or datetime.now()
+        self.name = backup_name + '_' + self.created_at.strftime(self.TIME_FORMAT)
+        self.is_created = False
+
+    def nested(self, folder):
+        """
+        Session storing backups in the folder inside of the folder of this session.
+        """
+        session = copy(self)
+        session.name = join(self.name, folder)
+        return session
+
+
+class Backup(object):
+    """
+    Backup folder created by the populate command.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._size = None
+
+    def get_size(self):
+        """
+        Size of all files stored in this backup (in bytes).
+        """
+        if self._size is None:
+            self._size = get_folder_size(self.path)
+        return self._size
+
+    def get_age(self, now=None):
+        """
+        Age of the backup in days.
+        """
+        now = time() if now is None else now
+        return (now - getmtime(self.path)) / DAY
+
+
+class BackupRetention(object):
+    """
+    Decide which backups should be evicted. Backups are evicted from the oldest one until all of the limits (keep last
+    N, maximum age in days and maximum total size in bytes) are satisfied. The protected backup (the one of the current
+    run) is counted, but never evicted.
+    """
+
+    def __init__(self, backups, keep_last=None, max_age=None, max_size=None, protected=None):
+        self.backups = backups
+        self.protected = protected
+        self.keep_last = keep_last
+        self.max_age = max_age
+        self.max_size = max_size
+
+    def is_enabled(self):
+        """
+        Is any of the limits set?
+        """
+        return any(limit is not None for limit in [self.keep_last, self.max_age, self.max_size])
+
+    def get_evicted(self, now=None):
+        """
+        Get list of backups to evict. Backups should be sorted from the oldest one.
+        """
+        if not self.is_enabled():
+            return []
+
+        sizes = [backup.get_size() for backup in self.backups]
+        total = sum(sizes)
+        left = len(self.backups)
+        evicted = []
+        for backup, size in zip(self.backups, sizes):
+            if backup.path == self.protected or not self._is_over_limit(backup, left, total, now):
+                continue
+            evicted.append(backup)
+            total -= size
+            left -= 1
+        return evicted
+
+    def _is_over_limit(self, backup, left, total, now):
+        if self.keep_last is not None and left > self.keep_last:
+            return True
+        if self.max_size is not None and total > self.max_size:
+            return True
+        if self.max_age is not None and backup.get_age(now) > self.max_age:
+            return True
+        return False
@@ -1,9 +1,24 @@
+import json
+import re
+import sys
 from argparse import ArgumentParser
+from os.path import basename
 from os.path import exists
+from os.path import isfile
 
+from confsave import instrumentation
+from confsave import profiling
 from confsave.app import Application
 from confsave.commands import Commands
 from confsave.commands import EmptyValue
+from confsave.commands import PathNotInUserPath
+from confsave.commands import SharedObjectStoreNotSet
+from confsave.daemon import forward
+from confsave.lock import LockTimeout
+from confsave.render import RenderError
+
+
+PROFILE_NAME = re.compile(r'^[A-Za-z0-9][A-Za-z0-9._-]*$')
 
 
 class ValidationError(Exception):
@@ -14,20 +29,33 @@ class ValidationError(Exception):
 
 class CommandLine(object):
 
-    def __init__(self, app):
+    def __init__(self, app, argv=None):
         self.app = app
+        self.argv = argv
         self.commands = Commands(app)
 
     def initalize_parser(self):
         """
         Create argument parser which will parse argument provided by command line.
         """
-        self.parser = ArgumentParser(description='ConfSave cmd')
+        prog = basename(self.argv[0]) if self.argv else None
+        # no abbreviations, so the daemon client recognizes the local only options (like --export) by their names
+        self.parser = ArgumentParser(prog=prog, description='ConfSave cmd', allow_abbrev=False)
         self.parser.add_argument(
             '--add',
             '-a',
             help='add endpoint',
             dest='add')
+        self.parser.add_argument(
+            '--tag',
+            action='append',
+            help='tag added endpoint (can be used many times)',
+            dest='tags')
+        self.parser.add_argument(
+            '--render',
+            action='store_true',
+            help='add file as the template rendered with the host variables (~/.confsave.vars) on populate',
+            dest='render')
         self.parser.add_argument(
             '--list',
             '-l',
@@ -84,20 +112,182 @@ class CommandLine(object):
             dest='populate',
             action='store_true',
         )
+        self.parser.add_argument(
+            '--fleet',
+            help='populate repo files into many user directories (paths or quoted globs like "/home/*")',
+            dest='fleet',
+            metavar='HOME',
+            nargs='+',
+        )
+        self.parser.add_argument(
+            '--processes',
+            help='number of processes of the --fleet populate (default: number of cpus)',
+            dest='processes',
+            type=int,
+        )
         self.parser.add_argument(
             '--create-repo',
             help='create repo for the configs',
             dest='create_repo',
         )
+        self.parser.add_argument(
+            '--create-repos',
+            help='create repos listed in the manifest file ("-" for stdin, one path per line) and print their urls',
+            dest='create_repos',
+            metavar='MANIFEST',
+        )
+        self.parser.add_argument(
+            '--template',
+            help='seed repos created by --create-repos from the template repo through the shared object store',
+            dest='template',
+        )
+        self.parser.add_argument(
+            '--threads',
+            help='number of threads of the --create-repos command',
+            dest='threads',
+            type=int,
+        )
+        self.parser.add_argument(
+            '--export',
+            nargs='?',
+            const='HEAD',
+            help='write tracked files from the commit (default: HEAD) to stdout as tar.gz archive',
+            dest='export',
+        )
+        self.parser.add_argument(
+            '--import',
+            help='import tar archive ("-" for stdin) into the home directory',
+            dest='import_archive',
+        )
+        self.parser.add_argument(
+            '--bundle-create',
+            help='create git bundle with commits not yet synced with the peer',
+            dest='bundle_create',
+        )
+        self.parser.add_argument(
+            '--bundle-apply',
+            help='pull commits from the git bundle',
+            dest='bundle_apply',
+        )
+        self.parser.add_argument(
+            '--peer',
+            default='default',
+            help='name of the peer to create bundle for (default: default)',
+            dest='peer',
+        )
+        self.parser.add_argument(
+            '--since',
+            help='create bundle with commits newer then this one, instead of the last bundled one',
+            dest='since',
+        )
+        self.parser.add_argument(
+            '--shared-objects',
+            help='path to the host-wide shared object store',
+            dest='shared_objects_path',
+        )
+        self.parser.add_argument(
+            '--share-objects',
+            help='move objects of the repo to the shared object store and show saved disk space',
+            dest='share_objects',
+            action='store_true',
+        )
+        self.parser.add_argument(
+            '--watch',
+            help='watch tracked files and commit changes automatically',
+            dest='watch',
+            action='store_true',
+        )
+        self.parser.add_argument(
+            '--debounce',
+            help='seconds without changes after which watch makes the commit (default: 2)',
+            dest='debounce',
+            type=float,
+            default=2.0,
+        )
+        self.parser.add_argument(
+            '--daemon',
+            help='run daemon which will serve cs commands over the unix socket',
+            dest='daemon',
+            action='store_true',
+        )
+        self.parser.add_argument(
+            '--prune-backups',
+            help='remove backups which are out of the retention limits',
+            dest='prune_backups',
+            action='store_true',
+        )
+        self.parser.add_argument(
+            '--host-profile',
+            help='switch to the profile of the host (branch profile/NAME, "default" is the main branch) and populate '
+                 'it',
+            dest='host_profile',
+            metavar='NAME',
+        )
+        self.parser.add_argument(
+            '--drift',
+            help='show tracked paths which differ on the other hosts (profiles)',
+            dest='drift',
+            action='store_true',
+        )
+        self.parser.add_argument(
+            '--backup-keep-last',
+            help='number of the newest backups to keep',
+            dest='backup_keep_last',
+            type=int,
+        )
+        self.parser.add_argument(
+            '--backup-max-age',
+            help='remove backups older then given number of days',
+            dest='backup_max_age',
+            type=float,
+        )
+        self.parser.add_argument(
+            '--backup-max-size',
+            help='maximum total size of the backups in bytes',
+            dest='backup_max_size',
+            type=int,
+        )
+        self.parser.add_argument(
+            '--format',
+            help='output format of the -l, -s and -p commands (ndjson: one JSON object per line)',
+            dest='format',
+            choices=['text', 'ndjson'],
+            default='text',
+        )
+        self.parser.add_argument(
+            '--profile',
+            help='print wall and cpu time of the phases of the command on stderr (and write cProfile stats to FILE)',
+            dest='profile',
+            metavar='FILE',
+            nargs='?',
+            const='',
+        )
+        self.parser.add_argument(
+            '--lock-timeout',
+            help='seconds to wait for other cs processes using the repo (default: 60)',
+            dest='lock_timeout',
+            type=float,
+        )
+        self.parser.add_argument(
+            '--metrics-file',
+            help='write metrics of the repo for the node_exporter textfile collector to FILE after the command',
+            dest='metrics_file',
+            metavar='FILE',
+        )
 
     def validate(self):
         """
         Validate if arguments provided by command line have any errors.
         """
-        self.args = self.parser.parse_args()
+        self.args = self.parser.parse_args(self.argv[1:] if self.argv else None)
         try:
             self._validate_conflicts()
             self._validate_add()
+            self._validate_import()
+            self._validate_bundle_apply()
+            self._validate_create_repos()
+            self._validate_format()
+            self._validate_host_profile()
             return True
         except ValidationError as error:
             print('Error: {}'.format(error.message))
@@ -113,7 +303,19 @@ class CommandLine(object):
             self.args.commit,
             self.args.set_repo,
             self.args.populate,
+            self.args.fleet,
             self.args.create_repo,
+            self.args.create_repos,
+            self.args.prune_backups,
+            self.args.export,
+            self.args.import_archive,
+            self.args.bundle_create,
+            self.args.bundle_apply,
+            self.args.share_objects,
+            self.args.daemon,
+            self.args.watch,
+            self.args.host_profile,
+            self.args.drift,
         ]
         if self._has_conflicts(conflicting_arguments):
             raise ValidationError('Two or more commands are in conflict')
@@ -127,20 +329,62 @@ class CommandLine(object):
 
     def _validate_add(self):
         filename = self.args.add
+        if not filename and (self.args.tags or self.args.render):
+            raise ValidationError('--tag and --render can be used only with -a')
         if filename:
             if not exists(filename):
                 raise ValidationError('Path "{}" does not exists'.format(filename))
+            if self.args.render and not isfile(filename):
+                raise ValidationError('Only files can be rendered, "{}" is not a file'.format(filename))
+
+    def _validate_import(self):
+        filename = self.args.import_archive
+        if filename and filename != '-':
+            if not exists(filename):
+                raise ValidationError('Path "{}" does not exists'.format(filename))
+
+    def _validate_bundle_apply(self):
+        filename = self.args.bundle_apply
+        if filename:
+            if not exists(filename):
+                raise ValidationError('Path "{}" does not exists'.format(filename))
+
+    def _validate_create_repos(self):
+        filename = self.args.create_repos
+        if filename and filename != '-':
+            if not exists(filename):
+                raise ValidationError('Path "{}" does not exists'.format(filename))
+
+    def _validate_format(self):
+        if self.args.format == 'ndjson':
+            args = self.args
+            if not (args.list or args.status or args.populate or args.host_profile or args.create_repos):
+                raise ValidationError(
+                    '--format=ndjson can be used only with -l, -s, -p, --host-profile or --create-repos')
+
+    def _validate_host_profile(self):
+        profile = self.args.host_profile
+        if profile is not None and not PROFILE_NAME.match(profile):
+            raise ValidationError(
+                'Profile name "{}" can contain only letters, digits, ".", "_" and "-"'.format(profile))
 
     def run_command(self):
         """
         Run command choosed by the command line.
         """
         if self.args.add:
-            self.commands.add(self.args.add)
+            try:
+                self.commands.add(self.args.add, self.args.tags, self.args.render)
+            except PathNotInUserPath as error:
+                print(error.message)
             return
 
         if self.args.list:
-            self.commands.show_list()
+            if self.args.format == 'ndjson':
+                print_records(self.commands.show_list())
+            else:
+                for entry in self.commands.show_list():
+                    print(entry.path)
             return
 
         if self.args.ignore:
@@ -148,7 +392,11 @@ class CommandLine(object):
             return
 
         if self.args.status:
-            self.commands.show_status()
+            if self.args.format == 'ndjson':
+                print_records(self.commands.show_status())
+            else:
+                for entry in self.commands.show_status():
+                    print(format_status(entry))
             return
 
         if self.args.commit:
@@ -160,15 +408,115 @@ class CommandLine(object):
             return
 
         if self.args.populate:
-            self.commands.populate()
+            if self.args.format == 'ndjson':
+                print_records(self.commands.populate())
+            else:
+                print_linked(self.commands.populate(), 'Populated')
+            return
+
+        if self.args.fleet:
+            failed = print_fleet(self.commands.populate_fleet(self.args.fleet, self.args.processes))
+            if failed:
+                sys.exit('Failed to populate {} homes'.format(failed))
+            return
+
+        if self.args.host_profile:
+            results = self.commands.switch_profile(self.args.host_profile)
+            if self.args.format == 'ndjson':
+                print_records(results)
+            else:
+                print_linked(results, 'Linked')
+                print('Switched to profile {}'.format(self.args.host_profile))
+            return
+
+        if self.args.drift:
+            print(format_drift(self.commands.drift()))
             return
 
         if self.args.create_repo:
-            self.commands.create_repo(self.args.create_repo)
+            result = self.commands.create_repo(self.args.create_repo)
+            if result.created:
+                print('Created repo at {}'.format(result.path))
+            else:
+                print('Path {} already exists.'.format(result.path))
+            print('Possible remote url is: {}'.format(result.url))
+            return
+
+        if self.args.create_repos:
+            self.create_repos()
+            return
+
+        if self.args.prune_backups:
+            print('Reclaimed {} bytes'.format(self.commands.prune_backups()))
+            return
+
+        if self.args.bundle_create:
+            result = self.commands.create_bundle(self.args.bundle_create, self.args.peer, self.args.since)
+            if result.created:
+                print('Created bundle for {0} at {1}'.format(result.peer, result.path))
+            else:
+                print('Nothing to bundle for {}'.format(result.peer))
+            return
+
+        if self.args.bundle_apply:
+            self.commands.apply_bundle(self.args.bundle_apply)
+            print('Applied bundle {}'.format(self.args.bundle_apply))
+            return
+
+        if self.args.share_objects:
+            reclaimed = self.commands.share_objects()
+            if reclaimed is None:
+                print('Shared object store is not set.')
+            else:
+                print('Reclaimed {} bytes'.format(reclaimed))
+            return
+
+        if self.args.watch:
+            for state in self.commands.watch(self.args.debounce):
+                if state.commits:
+                    print('Committed changes', flush=True)
+                else:
+                    print('Watching {} tracked paths'.format(state.tracked), flush=True)
+            return
+
+        if self.args.daemon:
+            from confsave.daemon import Daemon
+            Daemon(self.app, CommandLine).serve_forever()
+            return
+
+        if self.args.export:
+            self.commands.export(sys.stdout.buffer, self.args.export)
+            return
+
+        if self.args.import_archive:
+            if self.args.import_archive == '-':
+                print_linked(self.commands.import_archive(sys.stdin.buffer), 'Imported')
+            else:
+                with open(self.args.import_archive, 'rb') as file:
+                    print_linked(self.commands.import_archive(file), 'Imported')
             return
 
         self.parser.print_help()
 
+    def create_repos(self):
+        """
+        Create repos from the manifest and print their urls (one per line) as soon as they are ready.
+        """
+        if self.args.create_repos == '-':
+            paths = read_manifest(sys.stdin)
+        else:
+            with open(self.args.create_repos) as file:
+                paths = read_manifest(file)
+        try:
+            results = self.commands.create_repos(paths, self.args.template, self.args.threads)
+            if self.args.format == 'ndjson':
+                print_records(results)
+            else:
+                for result in results:
+                    print(result.url, flush=True)
+        except SharedObjectStoreNotSet as error:
+            sys.exit(error.message)
+
     def update_settings(self):
         """
         Update settings from command line arguments.
@@ -176,7 +524,33 @@ class CommandLine(object):
         self.app.update_settings(
             repo_path=self.args.repo_path,
             home_path=self.args.home_path,
-            config_filename=self.args.config_filename)
+            config_filename=self.args.config_filename,
+            backup_keep_last=self.args.backup_keep_last,
+            backup_max_age=self.args.backup_max_age,
+            backup_max_size=self.args.backup_max_size,
+            shared_objects_path=self.args.shared_objects_path,
+            lock_timeout=self.args.lock_timeout)
+
+    def start_metrics(self):
+        """
+        Start recording of the metrics if the metrics file is set. Return the recorder or None.
+        """
+        if not self.args.metrics_file:
+            return None
+        from confsave.metrics import MetricsRecorder
+        return instrumentation.register(MetricsRecorder(self.app))
+
+    def write_metrics(self, recorder):
+        """
+        Write the metrics file (also when the command failed, so the time since the last push keeps growing).
+        """
+        if recorder is None:
+            return
+        instrumentation.unregister(recorder)
+        try:
+            recorder.write(self.args.metrics_file)
+        except (LockTimeout, OSError) as error:
+            print('Metrics not written: {}'.format(error), file=sys.stderr)
 
     def run(self):
         """
@@ -185,12 +559,100 @@ class CommandLine(object):
         self.initalize_parser()
         if self.validate():
             self.update_settings()
-            self.run_command()
+            if self.args.profile is not None:
+                profiling.start(self.args.profile or None)
+            recorder = self.start_metrics()
+            try:
+                self.run_command()
+            except (LockTimeout, RenderError) as error:
+                sys.exit(str(error))
+            finally:
+                self.write_metrics(recorder)
+                if self.args.profile is not None:
+                    print(profiling.stop().format_table(self.app.get_lock().stats), file=sys.stderr)
         else:
             self.parser.print_help()
 
 
+def read_manifest(file):
+    """
+    Read paths from the manifest (one per line, empty lines and lines starting with "#" are skipped).
+    """
+    lines = (line.strip() for line in file)
+    return [line for line in lines if line and not line.startswith('#')]
+
+
+def format_status(entry):
+    """
+    Format StatusEntry like the short format of the git status.
+    """
+    if entry.original_path is not None:
+        return '{0} {1} -> {2}'.format(entry.code, entry.original_path, entry.path)
+    return '{0} {1}'.format(entry.code, entry.path)
+
+
+def format_drift(report):
+    """
+    Format DriftReport as the matrix of the paths and the hosts.
+    """
+    if not report.entries:
+        return 'No drift from {} on {} hosts'.format(report.reference, len(report.hosts))
+    width = max([len('path')] + [len(entry.path) for entry in report.entries])
+    lines = ['  '.join(['{:<{}}'.format('path', width)] + list(report.hosts))]
+    for entry in report.entries:
+        cells = ['{:^{}}'.format(code, len(host)) for code, host in zip(entry.changes, report.hosts)]
+        lines.append('  '.join(['{:<{}}'.format(entry.path, width)] + cells))
+    lines.append('')
+    lines.append('Compared with {}. M: modified, A: only on the host, D: missing on the host'.format(report.reference))
+    return '\n'.join(lines)
+
+
+def print_linked(results, verb):
+    """
+    Print results of populate or import.
+    """
+    for result in results:
+        if result.populated:
+            print('{0} {1}'.format(verb, result.path))
+        if result.backuped:
+            print('    * Backup stored in: {}'.format(result.backup_path))
+
+
+def print_fleet(homes):
+    """
+    Print a line for every populated home as soon as it is done and the summary of all of them. Return number of the
+    failed homes.
+    """
+    linked = backuped = failed = count = 0
+    for count, home in enumerate(homes, 1):
+        home_linked = sum(1 for result in home.results if result.populated)
+        home_backuped = sum(1 for result in home.results if result.backuped)
+        linked += home_linked
+        backuped += home_backuped
+        if home.error is None:
+            print('{0}: {1} linked, {2} backuped'.format(home.home, home_linked, home_backuped), flush=True)
+        else:
+            failed += 1
+            print('{0}: failed: {1}'.format(home.home, home.error), flush=True)
+    print('Populated {0} homes: {1} linked, {2} backuped, {3} failed'.format(count, linked, backuped, failed))
+    return failed
+
+
+def print_records(results):
+    """
+    Print every result as a JSON object in a separate line as soon as it is ready.
+    """
+    for result in results:
+        print(json.dumps(result._asdict()), flush=True)
+
+
 def run():
     app = Application()
+    response = forward(app.get_daemon_socket_path(), sys.argv)
+    if response is not None:
+        sys.stdout.write(response['stdout'])
+        sys.stderr.write(response['stderr'])
+        sys.exit(response['code'])
+
     cmd = CommandLine(app)
     cmd.run()
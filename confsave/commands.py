@@ -5,9 +5,20 @@ from os.path import expanduser
 from socket import gethostname
 from getpass import getuser
 
-from git import Repo
-
+from confsave.instrumentation import instrumented
+from confsave.lock import EXCLUSIVE
+from confsave.lock import SHARED
+from confsave.lock import locked
 from confsave.models import Endpoint
+from confsave.render import Renderer
+from confsave.render import read_template
+from confsave.results import AddResult
+from confsave.results import BundleResult
+from confsave.results import LinkResult
+from confsave.results import RepoCreated
+from confsave.results import StatusEntry
+from confsave.results import UntrackedPath
+from confsave.results import WatchState
 
 
 class EmptyValue(object):
@@ -15,47 +26,95 @@ class EmptyValue(object):
 
 
 class PathNotInUserPath(Exception):
-    pass
+
+    def __init__(self, path, user_path):
+        self.path = path
+        self.user_path = user_path
+        self.message = 'Path {0} is not in the user directory {1}'.format(path, user_path)
+        super(PathNotInUserPath, self).__init__(self.message)
+
+
+class SharedObjectStoreNotSet(Exception):
+
+    def __init__(self):
+        self.message = 'Shared object store is not set (use --shared-objects).'
+        super(SharedObjectStoreNotSet, self).__init__(self.message)
 
 
 class Commands(object):
+    """
+    Commands of the confsave. They are returning results (or generators of results) instead of printing them, so they
+    can be used as a library. Generators are holding the repo lock until they are exhausted or closed.
+    """
 
     def __init__(self, app):
         self.app = app
 
+    @instrumented('repo.init')
     def _init_repo(self):
         """
-        Initialize the git repo if needed and read the confsave config.
+        Initialize the git repo of the active profile if needed, read the confsave config and start new backup session.
+        Backup retention limits given by the command holding the exclusive lock are stored in the config.
         """
+        self.app.load_profile()
+        self.app.start_backup_session()
         self.app.repo.init_git_repo()
         self.app.repo.init_branch()
         self.app.repo.read_config()
+        if self.app.get_lock().mode == EXCLUSIVE:
+            self.app.repo.store_backup_retention()
+
+    def _prepare_reader(self):
+        """
+        Initialize the repo with the exclusive lock if something has to be made, so the commands holding the shared lock
+        only read it.
+        """
+        self.app.load_profile()
+        if not self.app.repo.is_initialized():
+            with self.app.get_lock().hold(EXCLUSIVE):
+                self._init_repo()
 
-    def add(self, filename):
+    @locked(EXCLUSIVE)
+    def add(self, filename, tags=None, render=False):
         """
-        Add file to the repo and change it to the symlink.
+        Add file to the repo and change it to the symlink. Tags are stored in the metadata of the tracked path. File
+        added with render is a template: the symlink points to its output rendered with the host variables.
+        Raise PathNotInUserPath if the file is outside of the user directory and RenderError if the template is not a
+        text (before the file is moved) or it can not be rendered (the file stays tracked).
         """
         self._init_repo()
         endpoint = Endpoint(self.app, filename)
-        if endpoint.is_in_user_path():
-            endpoint.add_to_repo()
+        if not endpoint.is_in_user_path():
+            raise PathNotInUserPath(filename, endpoint._get_user_path())
+        if render and not endpoint.is_link():
+            read_template(endpoint.path)
+
+        endpoint.add_to_repo()
+        tags = sorted(tags or [])
+        try:
+            if tags and endpoint.path in self.app.repo.config['files']:
+                self.app.repo.track(endpoint.path, tags=tags)
+            if render and endpoint.path in self.app.repo.config['files']:
+                self.app.repo.track(endpoint.path, render=True)
+                renderer = Renderer(self.app)
+                endpoint.make_link(renderer.render(endpoint))
+                renderer.save()
+        finally:
             self.app.repo.write_config()
-        else:
-            print('Path {0} is not in the user directory {1}'.format(
-                filename,
-                endpoint._get_user_path()
-            ))
+        return AddResult(endpoint.path, tags)
 
+    @locked(SHARED, prepare=_prepare_reader)
     def show_list(self):
         """
-        Show list of files from home which are not yet added to the repo.
+        Yield UntrackedPath for every file from home which is not yet added to the repo.
         """
         self._init_repo()
         for filename in glob(self.app.get_home_path() + '/.*'):
             endpoint = Endpoint(self.app, filename)
             if endpoint.is_visible():
-                print(endpoint.path)
+                yield UntrackedPath(endpoint.path)
 
+    @locked(EXCLUSIVE)
     def ignore(self, filename):
         """
         Add filename to ignore list.
@@ -63,16 +122,21 @@ class Commands(object):
         self._init_repo()
         self.app.repo.hide_file(filename)
 
+    @locked(SHARED, prepare=_prepare_reader)
     def show_status(self):
         """
-        Show status of tracked files.
+        Yield StatusEntry for every changed file in the repo (except of the config file).
         """
         self._init_repo()
-        status = self.app.repo.git.git.status('-s')
-        for line in status.split('\n'):
-            if not line.endswith(self.app.settings.CONFIG_FILENAME):
-                print(line)
+        fields = self.app.repo.iter_status()
+        for field in fields:
+            code, path = field[:2], field[3:]
+            # renamed and copied files are followed by the original path
+            original_path = next(fields) if code[0] in 'RC' else None
+            if path != self.app.settings.CONFIG_FILENAME:
+                yield StatusEntry(code, path, original_path)
 
+    @locked(EXCLUSIVE)
     def commit(self, message=EmptyValue):
         """
         Commit files added to the index and push them to the repo.
@@ -82,6 +146,7 @@ class Commands(object):
             message = 'configuration stamp'
         self.app.repo.commit(message)
 
+    @locked(EXCLUSIVE)
     def set_repo(self, remote):
         """
         Set remote url.
@@ -89,33 +154,181 @@ class Commands(object):
         self._init_repo()
         self.app.repo.set_remote(remote)
 
+    @locked(EXCLUSIVE)
+    def create_bundle(self, path, peer, since=None):
+        """
+        Create bundle with commits not yet synced with the peer.
+        """
+        self._init_repo()
+        return BundleResult(path, peer, self.app.repo.create_bundle(path, peer, since))
+
+    @locked(EXCLUSIVE)
+    def apply_bundle(self, path):
+        """
+        Pull commits from the bundle.
+        """
+        self._init_repo()
+        self.app.repo.apply_bundle(path)
+
+    @instrumented('command.watch')
+    def watch(self, debounce):
+        """
+        Watch tracked files and commit every burst of changes. Yield WatchState when the watch starts and after every
+        commit.
+        """
+        from confsave.watch import Watcher
+        self._init_repo()
+        yield WatchState(len(self.app.repo.config['files']), 0)
+        for commits, _ in enumerate(Watcher(self.app, debounce).run(), 1):
+            yield WatchState(len(self.app.repo.config['files']), commits)
+
+    def _get_link_result(self, endpoint, result):
+        backup_path = endpoint.get_backup_path() if result['backuped'] else None
+        return LinkResult(endpoint.path, result['populated'], backup_path)
+
+    @locked(EXCLUSIVE)
     def populate(self):
         """
-        Populate repo files into a user directory.
+        Populate repo files into a user directory. Templates are rendered (only when the template or the variables
+        changed) and linked to their outputs. Yield LinkResult for every tracked file. Backups are pruned after the last
+        one.
         """
         self._init_repo()
-        for file in self.app.repo.config['files']:
+        files = self.app.repo.config['files']
+        renderer = Renderer(self.app)
+        for file in files:
             endpoint = Endpoint(self.app, file)
-            result = endpoint.make_link()
-            if result['populated']:
-                print('Populated {}'.format(file))
-            if result['backuped']:
-                print('    * Backup stored in: {}'.format(endpoint.get_backup_path()))
+            target = renderer.render(endpoint) if files.get_metadata(file).get('render') else None
+            yield self._get_link_result(endpoint, endpoint.make_link(target))
+        renderer.save()
+        self.app.repo.prune_backups()
+
+    @locked(EXCLUSIVE)
+    def populate_fleet(self, homes, processes=None):
+        """
+        Populate repo files into many user directories (paths or globs like "/home/*") by the pool of processes.
+        The repo and the config are read once. Yield HomePopulated for every home as soon as it is done. Backups are
+        pruned after the last one.
+        """
+        from confsave.fleet import FleetPopulate
+        from confsave.fleet import expand_homes
+        self._init_repo()
+        yield from FleetPopulate(self.app, processes).run(expand_homes(homes))
+        self.app.repo.prune_backups()
+
+    @locked(EXCLUSIVE)
+    def switch_profile(self, profile):
+        """
+        Make the profile active and populate its files. The profile is the branch "profile/<name>" made from the
+        default branch and checked out once into its own worktree, so switching back and forth only replaces the
+        symlinks. Symlinks of the files which are not tracked by the new profile are removed (and their backups are
+        restored). Yield LinkResult for every tracked file of the profile.
+        """
+        self._init_repo()
+        previous = [Endpoint(self.app, path) for path in self.app.repo.config['files']]
+        backups = self.app.repo.get_backups()
+        if profile != self.app.DEFAULT_PROFILE:
+            self.app.repo.init_profile(profile)
+        self.app.set_profile(profile)
+        self._init_repo()
+        tracked = set(Endpoint(self.app, path).path for path in self.app.repo.config['files'])
+        for endpoint in previous:
+            if endpoint.path not in tracked:
+                endpoint.remove_link(backups)
+        yield from self.populate()
+
+    @locked(EXCLUSIVE)
+    def drift(self):
+        """
+        Fetch branches of all the hosts and return DriftReport of the tracked paths which differ from the active
+        profile. Nothing is checked out.
+        """
+        self._init_repo()
+        return self.app.repo.get_drift()
+
+    @locked(EXCLUSIVE)
+    def prune_backups(self):
+        """
+        Remove backups which are out of the retention limits. Return number of reclaimed bytes.
+        """
+        self._init_repo()
+        return self.app.repo.prune_backups()
+
+    @locked(SHARED, prepare=_prepare_reader)
+    def export(self, stream, treeish='HEAD'):
+        """
+        Write tracked files from the given commit into the stream as a tar.gz archive.
+        """
+        self._init_repo()
+        self.app.repo.export_archive(stream, treeish)
+
+    @locked(EXCLUSIVE)
+    def import_archive(self, stream):
+        """
+        Import tar archive with tracked files into a user directory. Git repo is not needed for this. Yield LinkResult
+        for every imported file.
+        """
+        from confsave.archive import ArchiveImporter
+        self.app.start_backup_session()
+        for endpoint, result in ArchiveImporter(self.app).import_archive(stream):
+            yield self._get_link_result(endpoint, result)
+
+    @locked(EXCLUSIVE)
+    def share_objects(self):
+        """
+        Move objects of the repo to the shared object store. Return number of reclaimed bytes or None if the shared
+        object store is not set.
+        """
+        self._init_repo()
+        if not self.app.get_shared_object_store():
+            return None
+        return self.app.repo.share_objects()
 
+    @instrumented('command.create_repo')
     def create_repo(self, path):
         """
-        Create repo for the
+        Create bare repo which can be used as the remote.
+        """
+        return self._create_repo(path, self.app.get_shared_object_store(), self._get_url_prefix())
+
+    @instrumented('command.create_repos')
+    def create_repos(self, paths, template=None, threads=None):
         """
+        Create bare repos concurrently by the pool of threads (creating a repo is mostly waiting for the git process).
+        Yield RepoCreated in order of the paths as soon as it is ready. Created repos are seeded from the template repo
+        through the shared object store: objects of the template are fetched into the store once and every new repo gets
+        only refs pointing to them. Raise SharedObjectStoreNotSet if the template is given without the store. Paths
+        leading to the same repo are created (and yielded) only once, so they are not racing for it.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        store = self.app.get_shared_object_store()
+        seed = None
+        if template is not None:
+            if not store:
+                raise SharedObjectStoreNotSet()
+            seed = store.add_template(template)
+        elif store:
+            store.init()
+        prefix = self._get_url_prefix()
+        unique = {}
+        for path in paths:
+            unique.setdefault(abspath(expanduser(path)), path)
+        with ThreadPoolExecutor(threads) as executor:
+            yield from executor.map(lambda path: self._create_repo(path, store, prefix, seed), unique.values())
+
+    def _get_url_prefix(self):
+        return '{0}@{1}:'.format(getuser(), gethostname())
+
+    def _create_repo(self, path, store, prefix, seed=None):
         fullpath = abspath(expanduser(path))
 
-        if exists(fullpath):
-            print("Path {} already exists.".format(fullpath))
-        else:
+        created = not exists(fullpath)
+        if created:
+            from git import Repo
             Repo.init(fullpath, bare=True)
-            print("Created repo at {}".format(fullpath))
+            if store:
+                store.link(fullpath)
+                if seed:
+                    store.seed(fullpath, *seed)
 
-        print('Possible remote url is: {0}@{1}:{2}'.format(
-            getuser(),
-            gethostname(),
-            fullpath,
-        ))
+        return RepoCreated(fullpath, created, '{0}{1}'.format(prefix, fullpath))
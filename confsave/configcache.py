@@ -0,0 +1,40 @@
+import marshal
+from hashlib import sha1
+
+
+class ConfigCache(object):
+    """
+    Binary sidecar of the YAML config. It is valid only for the YAML file with the same hash, so the YAML file stays
+    the source of truth and repeated commands do not need to parse it.
+    """
+    VERSION = 1
+
+    def __init__(self, path):
+        self.path = path
+
+    @staticmethod
+    def get_digest(data):
+        return sha1(data).hexdigest()
+
+    def get(self, digest):
+        """
+        Get cached config for the YAML file with given hash. Return None if the cache is missing or outdated.
+        """
+        try:
+            with open(self.path, 'rb') as file:
+                version, cached_digest, config = marshal.load(file)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        if version != self.VERSION or cached_digest != digest:
+            return None
+        return config
+
+    def set(self, digest, config):
+        """
+        Store config parsed from the YAML file with given hash. Cache is optional, so errors are ignored.
+        """
+        try:
+            with open(self.path, 'wb') as file:
+                marshal.dump((self.VERSION, digest, config), file)
+        except (OSError, ValueError):
+            pass
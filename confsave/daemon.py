@@ -0,0 +1,152 @@
+import json
+import socket
+import traceback
+from contextlib import redirect_stderr
+from contextlib import redirect_stdout
+from io import StringIO
+from os import chdir
+from os import chmod
+from os import environ
+from os import getcwd
+from os import unlink
+from os.path import exists
+from shutil import get_terminal_size
+
+# commands which are streaming data through stdin/stdout (the manifest of --create-repos can be read from stdin) or
+# running forever are always run locally (and the profiled ones, so the profile is not mixed with the state of the
+# daemon)
+LOCAL_ONLY = ['--daemon', '--export', '--import', '--watch', '--profile', '--create-repos']
+
+
+class Daemon(object):
+    """
+    Long-lived process which keeps the Application (with the local repo and the parsed config) warm and runs commands
+    send by the cs client over the Unix socket.
+    """
+
+    def __init__(self, app, command_line):
+        self.app = app
+        self.command_line = command_line
+
+    def listen(self):
+        """
+        Create the socket. Only the owner can connect to it.
+        """
+        path = self.app.get_daemon_socket_path()
+        if exists(path):
+            unlink(path)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(path)
+        chmod(path, 0o600)
+        server.listen(5)
+        return server
+
+    def serve_forever(self):
+        """
+        Listen on the socket and handle requests one by one.
+        """
+        server = self.listen()
+        try:
+            while True:
+                self.accept(server)
+        finally:
+            server.close()
+            unlink(self.app.get_daemon_socket_path())
+
+    def accept(self, server):
+        """
+        Handle next connection.
+        """
+        connection, _ = server.accept()
+        with connection:
+            self.handle(connection)
+
+    def handle(self, connection):
+        """
+        Read request from the connection, run the command and send back the response.
+        """
+        request = json.loads(read_all(connection).decode('utf8'))
+        response = self.execute(request['argv'], request['cwd'], request.get('columns'))
+        connection.sendall(json.dumps(response).encode('utf8'))
+
+    def execute(self, argv, cwd, columns=None):
+        """
+        Run command line with given arguments. Return its output and exit code. Columns is the terminal width of the
+        client, so the help is formatted the same way as in the local run.
+        """
+        stdout = StringIO()
+        stderr = StringIO()
+        old_cwd = getcwd()
+        old_columns = environ.pop('COLUMNS', None)
+        if columns:
+            environ['COLUMNS'] = str(columns)
+        self.app.reset_settings()
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            try:
+                chdir(cwd)
+                self.command_line(self.app, argv).run()
+                code = 0
+            except SystemExit as error:
+                code = get_exit_code(error, stderr)
+            except Exception:
+                traceback.print_exc()
+                code = 1
+            finally:
+                chdir(old_cwd)
+                environ.pop('COLUMNS', None)
+                if old_columns is not None:
+                    environ['COLUMNS'] = old_columns
+        return dict(stdout=stdout.getvalue(), stderr=stderr.getvalue(), code=code)
+
+
+def get_exit_code(error, stderr):
+    """
+    Convert SystemExit to the exit code, the same way the interpreter does.
+    """
+    if error.code is None:
+        return 0
+    if isinstance(error.code, int):
+        return error.code
+    stderr.write('{}\n'.format(error.code))
+    return 1
+
+
+def read_all(connection):
+    chunks = []
+    while True:
+        chunk = connection.recv(65536)
+        if not chunk:
+            return b''.join(chunks)
+        chunks.append(chunk)
+
+
+def is_local_only(argv):
+    """
+    Should this command be run without the daemon? NDJSON output is streamed, but the daemon sends the output only
+    when the command ends.
+    """
+    args = argv[1:]
+    if '--format=ndjson' in args or ['--format', 'ndjson'] in [args[index:index + 2] for index in range(len(args))]:
+        return True
+    return any(arg.split('=')[0] in LOCAL_ONLY for arg in args)
+
+
+def forward(socket_path, argv):
+    """
+    Send command to the daemon. Return the response or None if the daemon is not running.
+    """
+    if is_local_only(argv) or not exists(socket_path):
+        return None
+
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(socket_path)
+    except (ConnectionRefusedError, FileNotFoundError):
+        client.close()
+        return None
+
+    with client:
+        request = dict(argv=argv, cwd=getcwd(), columns=get_terminal_size().columns)
+        client.sendall(json.dumps(request).encode('utf8'))
+        client.shutdown(socket.SHUT_WR)
+        return json.loads(read_all(client).decode('utf8'))
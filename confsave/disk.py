@@ -0,0 +1,14 @@
+from os import lstat
+from os import walk
+from os.path import join
+
+
+def get_folder_size(path):
+    """
+    Size of all files and folders in the path (in bytes). Symlinks are not followed.
+    """
+    size = 0
+    for root, dirs, files in walk(path):
+        for name in dirs + files:
+            size += lstat(join(root, name)).st_size
+    return size
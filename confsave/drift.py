@@ -0,0 +1,86 @@
+from os.path import dirname
+from stat import S_ISDIR
+
+from git.objects.fun import tree_entries_from_data
+from git.util import hex_to_bin
+
+SAME = '.'
+MODIFIED = 'M'
+ADDED = 'A'
+DELETED = 'D'
+
+
+class TreeDiff(object):
+    """
+    Find tracked paths which differ between two trees by comparing object ids. Only subtrees with different ids on
+    the way to the tracked paths are read, every tree object is read once and comparisons of the same pair of subtrees
+    are reused. So comparing many hosts which share most of the files costs only the changed subtrees.
+    """
+
+    def __init__(self, git, paths=()):
+        self.git = git
+        self.paths = set()
+        self.folders = set()
+        self.trees = {}
+        self.diffs = {}
+        self.add_paths(paths)
+
+    def add_paths(self, paths):
+        """
+        Compare also these paths (before the first .compare(), because the comparisons are cached).
+        """
+        for path in paths:
+            self.paths.add(path)
+            folder = dirname(path)
+            while folder:
+                self.folders.add(folder)
+                folder = dirname(folder)
+
+    def get_blob(self, tree, name):
+        """
+        Get binary id of the blob in the root of the tree given by the hex id, or None if there is no such blob.
+        """
+        binsha, is_tree = self.read(hex_to_bin(tree)).get(name, (None, False))
+        return None if is_tree else binsha
+
+    def read(self, binsha):
+        """
+        Get entries of the tree: {name: (binsha, is tree)}.
+        """
+        entries = self.trees.get(binsha)
+        if entries is None:
+            data = self.git.odb.stream(binsha).read()
+            entries = {name: (sha, S_ISDIR(mode)) for sha, mode, name in tree_entries_from_data(data)}
+            self.trees[binsha] = entries
+        return entries
+
+    def compare(self, reference, other):
+        """
+        Compare trees given by the hex ids. Return {path: MODIFIED, ADDED (only in the other) or DELETED}.
+        """
+        return dict(self._compare(hex_to_bin(reference), hex_to_bin(other), ''))
+
+    def _compare(self, reference, other, base):
+        if reference == other:
+            return ()
+        key = (reference, other, base)
+        if key not in self.diffs:
+            self.diffs[key] = tuple(self._walk(reference, other, base))
+        return self.diffs[key]
+
+    def _walk(self, reference, other, base):
+        left = self.read(reference) if reference else {}
+        right = self.read(other) if other else {}
+        for name in set(left) | set(right):
+            path = base + name
+            if path not in self.paths and path not in self.folders:
+                continue
+            old = left.get(name)
+            new = right.get(name)
+            if old == new:
+                continue
+            if path in self.paths:
+                yield path, ADDED if old is None else DELETED if new is None else MODIFIED
+            else:
+                yield from self._compare(
+                    old[0] if old and old[1] else None, new[0] if new and new[1] else None, path + '/')
@@ -0,0 +1,168 @@
+from copy import copy
+from glob import glob
+from glob import has_magic
+from multiprocessing import get_context
+from os import geteuid
+from os import lchown
+from os import listdir
+from os import makedirs
+from os import mkdir
+from os import rmdir
+from os import sep
+from os import stat
+from os.path import abspath
+from os.path import exists
+from os.path import expanduser
+from os.path import isdir
+from os.path import dirname
+from os.path import join
+from os.path import realpath
+from os.path import splitext
+from pwd import getpwuid
+
+from confsave.instrumentation import span
+from confsave.models import Endpoint
+from confsave.render import RenderError
+from confsave.render import Renderer
+from confsave.results import HomePopulated
+from confsave.results import LinkResult
+
+class PathOutsideHome(Exception):
+
+    def __init__(self, path, home):
+        self.path = path
+        self.home = home
+        self.message = 'Path {0} leads outside of the home {1}'.format(path, home)
+        super(PathOutsideHome, self).__init__(self.message)
+
+
+# application of the fleet populate, inherited by the forked workers (with the parsed config and the opened repo)
+_app = None
+
+
+def expand_homes(patterns):
+    """
+    Get sorted unique home folders from the paths and globs (like "/home/*").
+    """
+    homes = set()
+    for pattern in patterns:
+        pattern = abspath(expanduser(pattern))
+        paths = glob(pattern) if has_magic(pattern) else [pattern]
+        homes.update(abspath(path) for path in paths if isdir(path))
+    return sorted(homes)
+
+
+def get_home_app(app, home):
+    """
+    Copy of the application for one home of the fleet. Everything is shared except of the home path (with the variables
+    file in it), the backup folder, which is a subfolder of the backup of the run named after the home (like
+    "home_alice"), and the rendered templates with their index, which are named after the home the same way.
+    """
+    name = home.strip(sep).replace(sep, '_')
+    home_app = copy(app)
+    home_app.settings = copy(app.settings)
+    home_app.settings.HOME_PATH = home
+    home_app.settings.RENDERED_DIR = join(app.settings.RENDERED_DIR, name)
+    index, extension = splitext(app.settings.RENDER_INDEX)
+    home_app.settings.RENDER_INDEX = '{0}.{1}{2}'.format(index, name, extension)
+    home_app.backup_session = app.get_backup_session().nested(name)
+    return home_app
+
+
+def get_user_name(uid):
+    """
+    Name of the user (or the uid if the user has no name).
+    """
+    try:
+        return getpwuid(uid).pw_name
+    except KeyError:
+        return str(uid)
+
+
+def _init_worker(app):
+    global _app
+    _app = app
+
+
+def populate_home(home):
+    """
+    Populate tracked files into the home. Tracked paths are relative to the home of the application, so they are
+    moved to this home. Missing parent folders are made, and they and the symlinks are given to the owner of the home
+    when running as root. Templates are rendered with the variables of the home (its owner, path and variables file).
+    Folders of the tracked paths are resolved first and the home is left (with PathOutsideHome) when some of them is a
+    symlink leading outside of the home, so the users can not make root replace their files. Return HomePopulated with
+    the error message instead of raising, so one broken home does not stop the fleet.
+    """
+    app = get_home_app(_app, home)
+    root = realpath(home)
+    owner = stat(home)
+    chown = geteuid() == 0
+    backup_path = app.get_backup_path()
+    makedirs(backup_path, exist_ok=True)
+    files = app.repo.config['files']
+    renderer = Renderer(app, get_user_name(owner.st_uid))
+    results = []
+    try:
+        for file in files:
+            endpoint = Endpoint(app, join(home, Endpoint(_app, file)._get_relative_path()))
+            for path in endpoint.get_folders_paths(home):
+                if exists(path):
+                    _check_inside(path, root, home)
+                else:
+                    with span('fs.mkdir', path=path):
+                        mkdir(path)
+                    _give(path, owner, chown)
+            _check_inside(dirname(endpoint.path), root, home)
+            target = renderer.render(endpoint) if files.get_metadata(file).get('render') else None
+            result = endpoint.make_link(target)
+            if result['populated']:
+                _give(endpoint.path, owner, chown)
+            backup = endpoint.get_backup_path() if result['backuped'] else None
+            results.append(LinkResult(endpoint.path, result['populated'], backup))
+        renderer.save()
+    except (OSError, PathOutsideHome, RenderError) as error:
+        return HomePopulated(home, results, str(error))
+    finally:
+        _remove_empty(backup_path)
+    return HomePopulated(home, results, None)
+
+
+def _check_inside(path, root, home):
+    folder = realpath(path)
+    if folder != root and not folder.startswith(root + sep):
+        raise PathOutsideHome(path, home)
+
+
+def _give(path, owner, chown):
+    if chown:
+        with span('fs.chown', path=path):
+            lchown(path, owner.st_uid, owner.st_gid)
+
+
+def _remove_empty(path):
+    if not listdir(path):
+        rmdir(path)
+
+
+class FleetPopulate(object):
+    """
+    Populate one repo into many homes. The repo and the config are opened once and the forked worker processes are
+    sharing them, so every home costs only its symlinks and backups. Backups of all the homes are stored in one backup
+    folder of the run (so the retention treats them as one backup).
+    """
+
+    def __init__(self, app, processes=None):
+        self.app = app
+        self.processes = processes
+
+    def run(self, homes):
+        """
+        Yield HomePopulated for every home as soon as it is done (in order of completion).
+        """
+        # the backup folder and its ignore rule are made by the parent, so the workers never touch the git repo
+        self.app.repo.create_backup()
+        backup_path = self.app.get_backup_path()
+        context = get_context('fork')
+        with context.Pool(self.processes, initializer=_init_worker, initargs=(self.app,)) as pool:
+            yield from pool.imap_unordered(populate_home, homes)
+        _remove_empty(backup_path)
@@ -0,0 +1,196 @@
+from bisect import bisect_left
+from functools import wraps
+from time import perf_counter
+
+# observers registered for the spans (tuple, so every span can keep the observers it started with)
+_observers = ()
+# upper bounds (in seconds) of the latency histogram buckets, the last bucket is unbounded
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# inspect.CO_GENERATOR (the inspect module is too slow to import on every cs run)
+CO_GENERATOR = 0x20
+
+
+class Observer(object):
+    """
+    Base class for the observers of the spans. .on_start is called when the span starts and .on_end when it ends
+    (nested spans are ending before the outer ones).
+    """
+
+    def on_start(self, span):
+        pass
+
+    def on_end(self, span):
+        pass
+
+
+class Span(object):
+    """
+    One run of the instrumented operation. Attributes are describing the operation (paths, remote names, ...) and can
+    be added while the span is running. Error is the type of exception raised from the span (None on success).
+    """
+    __slots__ = ('name', 'attributes', 'start', 'duration', 'error', 'observers')
+
+    def __init__(self, name, attributes, observers):
+        self.name = name
+        self.attributes = attributes
+        self.observers = observers
+        self.start = None
+        self.duration = None
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        self.start = perf_counter()
+        for observer in self.observers:
+            observer.on_start(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.duration = perf_counter() - self.start
+        self.error = exc_type
+        for observer in reversed(self.observers):
+            observer.on_end(self)
+
+
+class NoSpan(object):
+    """
+    Span used when no observer is registered. It does nothing.
+    """
+    __slots__ = ()
+
+    def set(self, **attributes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+NO_SPAN = NoSpan()
+
+
+def register(observer):
+    """
+    Register observer of all the spans started from now on.
+    """
+    global _observers
+    _observers += (observer,)
+    return observer
+
+
+def unregister(observer):
+    """
+    Unregister the observer. Spans which are already running will still report their end to it.
+    """
+    global _observers
+    _observers = tuple(item for item in _observers if item is not observer)
+
+
+def span(name, **attributes):
+    """
+    Context manager reporting the operation to the observers. It is a shared no-op when no observer is registered.
+    """
+    if not _observers:
+        return NO_SPAN
+    return Span(name, attributes, _observers)
+
+
+def instrumented(name):
+    """
+    Run every call of the function in the span. Spans of generators are running until they are exhausted or closed.
+    """
+    def decorator(function):
+        if function.__code__.co_flags & CO_GENERATOR:
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                with span(name):
+                    yield from function(*args, **kwargs)
+        else:
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                with span(name):
+                    return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class Histogram(object):
+    """
+    Latency histogram of one span name. counts[index] is the number of spans not longer than BUCKETS[index] (and not
+    counted in the previous buckets), the last one is for spans longer than all the buckets.
+    """
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, duration, error=None):
+        self.counts[bisect_left(BUCKETS, duration)] += 1
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+        if error is not None:
+            self.errors += 1
+
+    def cumulative(self):
+        """
+        Yield (upper bound, number of spans not longer than it). The last bound is float('inf').
+        """
+        total = 0
+        for bound, count in zip(BUCKETS + (float('inf'),), self.counts):
+            total += count
+            yield bound, total
+
+    def quantile(self, fraction):
+        """
+        Upper bound of the bucket with the given quantile (None if there are no spans, max if it is in the last
+        bucket).
+        """
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        for bound, count in self.cumulative():
+            if count >= rank:
+                return min(bound, self.max)
+
+
+class Aggregator(Observer):
+    """
+    Built-in observer counting the spans and collecting their latency histograms by the span name.
+    """
+
+    def __init__(self):
+        self.histograms = {}
+
+    def on_end(self, span):
+        histogram = self.histograms.get(span.name)
+        if histogram is None:
+            histogram = self.histograms[span.name] = Histogram()
+        histogram.add(span.duration, span.error)
+
+    def format_table(self):
+        """
+        Summary of the spans sorted by the name.
+        """
+        def milliseconds(value):
+            return '-' if value is None else '{:.2f}'.format(value * 1000)
+        lines = ['{:<30} {:>6} {:>6} {:>10} {:>10} {:>10} {:>10}'.format(
+            'span', 'count', 'errors', 'total ms', 'p50 ms', 'p99 ms', 'max ms')]
+        for name, histogram in sorted(self.histograms.items()):
+            lines.append('{:<30} {:>6} {:>6} {:>10} {:>10} {:>10} {:>10}'.format(
+                name,
+                histogram.count,
+                histogram.errors,
+                milliseconds(histogram.total),
+                milliseconds(histogram.quantile(0.5)),
+                milliseconds(histogram.quantile(0.99)),
+                milliseconds(histogram.max),
+            ))
+        return '\n'.join(lines)
@@ -0,0 +1,129 @@
+import json
+from os import O_CREAT
+from os import O_DIRECTORY
+from os import O_RDONLY
+from os import O_TRUNC
+from os import O_WRONLY
+from os import SEEK_END
+from os import close
+from os import curdir
+from os import fdopen
+from os import fsync
+from os import getpid
+from os import open as os_open
+from os import rename
+from os import unlink
+from os.path import basename
+from os.path import dirname
+from os.path import exists
+from os.path import join
+
+
+def atomic_write(path, data, mode=0o666):
+    """
+    Write data (bytes) to the file, so the file is never torn: write to a temporary file, fsync it and rename it over
+    the old one.
+    """
+    folder = dirname(path) or curdir
+    temporary = join(folder, '.{}.tmp-{}'.format(basename(path), getpid()))
+    # created like by the open(), so the mode respects the umask
+    fd = os_open(temporary, O_WRONLY | O_CREAT | O_TRUNC, mode)
+    try:
+        with fdopen(fd, 'wb') as file:
+            file.write(data)
+            file.flush()
+            fsync(file.fileno())
+    except BaseException:
+        unlink(temporary)
+        raise
+    rename(temporary, path)
+    fd = os_open(folder, O_RDONLY | O_DIRECTORY)
+    try:
+        fsync(fd)
+    finally:
+        close(fd)
+
+
+class ConfigJournal(object):
+    """
+    Append-only journal of the tracked paths mutations. Mutations are recorded in memory and appended to the file by
+    .flush() with a single fsync. The journal is folded into the YAML config by the compaction.
+    Entries are counted, so the caller knows when the compaction is needed.
+    """
+    ADD = 'add'
+    REMOVE = 'remove'
+
+    def __init__(self, path):
+        self.path = path
+        self.pending = []
+        self.entries = 0
+
+    def record(self, operation, path, **metadata):
+        """
+        Record mutation. It will be written on the next .flush().
+        """
+        entry = dict(op=operation, path=path)
+        if metadata:
+            entry['meta'] = metadata
+        self.pending.append(entry)
+
+    def flush(self):
+        """
+        Append all recorded mutations to the file with a single fsync. Return number of written entries. The torn
+        entry of the previous append is ended by the newline first, so the new entries are not glued to it.
+        """
+        if not self.pending:
+            return 0
+        data = ''.join(json.dumps(entry, sort_keys=True) + '\n' for entry in self.pending).encode('utf8')
+        with open(self.path, 'ab+') as file:
+            if file.tell() and not self._ends_with_newline(file):
+                data = b'\n' + data
+            file.write(data)
+            file.flush()
+            fsync(file.fileno())
+        count = len(self.pending)
+        self.entries += count
+        self.pending = []
+        return count
+
+    def _ends_with_newline(self, file):
+        file.seek(-1, SEEK_END)
+        return file.read(1) == b'\n'
+
+    def replay(self, registry):
+        """
+        Apply mutations from the file to the registry. Return number of applied entries. Torn entry (the process was
+        killed in the middle of the append) is skipped.
+        """
+        if not exists(self.path):
+            self.entries = 0
+            return 0
+        count = 0
+        with open(self.path, 'r') as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                self._apply(registry, entry)
+                count += 1
+        self.entries = count
+        return count
+
+    def _apply(self, registry, entry):
+        if entry['op'] == self.ADD:
+            registry.add(entry['path'], **entry.get('meta', {}))
+        elif entry['op'] == self.REMOVE and entry['path'] in registry:
+            registry.remove(entry['path'])
+
+    def is_empty(self):
+        return not self.pending and not exists(self.path)
+
+    def clear(self):
+        """
+        Remove the journal (after compaction).
+        """
+        self.pending = []
+        self.entries = 0
+        if exists(self.path):
+            unlink(self.path)
@@ -0,0 +1,163 @@
+import sys
+from contextlib import contextmanager
+from fcntl import LOCK_EX
+from fcntl import LOCK_NB
+from fcntl import LOCK_SH
+from fcntl import LOCK_UN
+from fcntl import flock
+from functools import wraps
+from os import O_CREAT
+from os import O_RDWR
+from os import close
+from os import open as os_open
+from time import monotonic
+from time import sleep
+
+from confsave.instrumentation import CO_GENERATOR
+from confsave.instrumentation import span
+
+SHARED = LOCK_SH
+EXCLUSIVE = LOCK_EX
+MODE_NAMES = {SHARED: 'shared', EXCLUSIVE: 'exclusive'}
+
+
+class LockTimeout(Exception):
+    pass
+
+
+class LockStats(object):
+    """
+    Contention statistics of the lock.
+    """
+
+    def __init__(self):
+        self.acquired = 0
+        self.contended = 0
+        self.waited = 0.0
+        self.max_wait = 0.0
+
+    def add(self, wait, contended):
+        self.acquired += 1
+        if contended:
+            self.contended += 1
+            self.waited += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def format(self):
+        return 'repo lock: acquired {0} times, contended {1} times (waited {2:.2f} ms, at most {3:.2f} ms)'.format(
+            self.acquired, self.contended, self.waited * 1000, self.max_wait * 1000)
+
+
+class RepoLock(object):
+    """
+    Lock of the local repo shared by all cs processes (flock on the lock file). Many processes can hold the shared lock
+    at once, but the exclusive lock is held by only one of them. The lock is reentrant: nested .hold() calls in one
+    process are using the lock which is already held.
+    """
+
+    def __init__(self, path, timeout=None, poll=0.05):
+        self.path = path
+        self.timeout = timeout
+        self.poll = poll
+        self.fd = None
+        self.mode = None
+        self.depth = 0
+        self.stats = LockStats()
+
+    def acquire(self, mode):
+        """
+        Acquire the lock. Return time spent on waiting for other processes. Raise LockTimeout if the lock was not
+        acquired in time.
+        """
+        if self.depth:
+            if mode == EXCLUSIVE and self.mode == SHARED:
+                raise RuntimeError('Shared lock of {} can not be upgraded to the exclusive one'.format(self.path))
+            self.depth += 1
+            return 0.0
+
+        self.fd = os_open(self.path, O_RDWR | O_CREAT, 0o600)
+        try:
+            wait, contended = self._wait(mode)
+        except BaseException:
+            close(self.fd)
+            self.fd = None
+            raise
+        self.mode = mode
+        self.depth = 1
+        self.stats.add(wait, contended)
+        return wait
+
+    def _wait(self, mode):
+        start = monotonic()
+        try:
+            flock(self.fd, mode | LOCK_NB)
+            return 0.0, False
+        except BlockingIOError:
+            pass
+
+        if self.timeout is None:
+            flock(self.fd, mode)
+            return monotonic() - start, True
+
+        deadline = start + self.timeout
+        while True:
+            try:
+                flock(self.fd, mode | LOCK_NB)
+                return monotonic() - start, True
+            except BlockingIOError:
+                if monotonic() >= deadline:
+                    raise LockTimeout(
+                        'Timed out after {:.1f}s waiting for the lock {}'.format(self.timeout, self.path))
+                sleep(min(self.poll, max(0, deadline - monotonic())))
+
+    def release(self):
+        self.depth -= 1
+        if not self.depth:
+            flock(self.fd, LOCK_UN)
+            close(self.fd)
+            self.fd = None
+            self.mode = None
+
+    @contextmanager
+    def hold(self, mode):
+        """
+        Hold the lock for the block. Waiting for other processes is reported on the stderr.
+        """
+        with span('lock', path=self.path, mode=MODE_NAMES[mode]) as current:
+            wait = self.acquire(mode)
+            current.set(waited=wait)
+        if wait:
+            print('Waited {:.2f}s for the lock {}'.format(wait, self.path), file=sys.stderr)
+        try:
+            yield self
+        finally:
+            self.release()
+
+
+def locked(mode, prepare=None):
+    """
+    Run the Commands method with the repo lock held (in the instrumentation span "command.<method name>").
+    Generators are holding the lock until they are exhausted or closed. Prepare is the method run before the lock is
+    taken (the readers are initializing the repo in it with the exclusive lock, because the shared lock can not be
+    upgraded).
+    """
+    def decorator(method):
+        name = 'command.' + method.__name__
+        if method.__code__.co_flags & CO_GENERATOR:
+            @wraps(method)
+            def wrapper(self, *args, **kwargs):
+                with span(name):
+                    if prepare:
+                        prepare(self)
+                    with self.app.get_lock().hold(mode):
+                        yield from method(self, *args, **kwargs)
+        else:
+            @wraps(method)
+            def wrapper(self, *args, **kwargs):
+                with span(name):
+                    if prepare:
+                        prepare(self)
+                    with self.app.get_lock().hold(mode):
+                        return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
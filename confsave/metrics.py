@@ -0,0 +1,168 @@
+import json
+from glob import glob
+from os import readlink
+from os.path import exists
+from os.path import getsize
+from os.path import islink
+from os.path import join
+from time import time
+
+from confsave.instrumentation import Observer
+from confsave.journal import atomic_write
+from confsave.lock import SHARED
+from confsave.models import Endpoint
+
+
+class Metric(object):
+    """
+    Gauge of the Prometheus text format.
+    """
+
+    def __init__(self, name, help, value):
+        self.name = name
+        self.help = help
+        self.value = value
+
+    def format(self, labels):
+        return '# HELP {0} {1}\n# TYPE {0} gauge\n{0}{{{2}}} {3}\n'.format(self.name, self.help, labels, self.value)
+
+
+def format_metrics(metrics, **labels):
+    """
+    Format metrics as the Prometheus text format (for the textfile collector of the node_exporter).
+    """
+    labels = ','.join('{}="{}"'.format(key, escape_label(value)) for key, value in sorted(labels.items()))
+    return ''.join(metric.format(labels) for metric in metrics)
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricsRecorder(Observer):
+    """
+    Observer recording durations of the commit and the push of the run. After the run it writes the metrics file
+    with them and with the state of the repo. Values which are not known in every run (durations and time of the
+    last push, sizes of the old backups) are kept in the state file in .git.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.commit_duration = None
+        self.push_duration = None
+        self.pushed_at = None
+
+    def on_end(self, span):
+        if span.error is not None:
+            return
+        if span.name == 'command.commit':
+            self.commit_duration = span.duration
+        elif span.name == 'git.push':
+            self.push_duration = span.duration
+            self.pushed_at = time()
+
+    def load_state(self):
+        try:
+            with open(self.app.get_metrics_state_path()) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def save_state(self, state):
+        atomic_write(self.app.get_metrics_state_path(), json.dumps(state, sort_keys=True).encode('utf8'))
+
+    def update_state(self, state):
+        if self.commit_duration is not None:
+            state['last_commit_duration'] = self.commit_duration
+        if self.push_duration is not None:
+            state['last_push_duration'] = self.push_duration
+            state['last_push'] = self.pushed_at
+        return state
+
+    def write(self, path):
+        """
+        Write the metrics file atomically (the repo lock is shared while the repo is read).
+        """
+        with self.app.get_lock().hold(SHARED):
+            metrics = []
+            if exists(join(self.app.get_repo_path(), '.git')):
+                state = self.update_state(self.load_state())
+                metrics = self.collect(state)
+                self.save_state(state)
+        profile = self.app.get_profile() or self.app.DEFAULT_PROFILE
+        data = format_metrics(metrics, repo=self.app.get_main_repo_path(), profile=profile)
+        atomic_write(path, data.encode('utf8'))
+
+    def collect(self, state):
+        """
+        Collect metrics of the repo. Sizes of the backups (except of the one of this run) are cached in the state.
+        """
+        metrics = []
+        if 'last_commit_duration' in state:
+            metrics.append(Metric(
+                'confsave_last_commit_duration_seconds',
+                'Duration of the last commit command (with the push).',
+                state['last_commit_duration']))
+        if 'last_push' in state:
+            metrics.append(Metric(
+                'confsave_last_push_duration_seconds', 'Duration of the last successful push.',
+                state['last_push_duration']))
+            metrics.append(Metric(
+                'confsave_last_push_timestamp_seconds', 'Time of the last successful push.', state['last_push']))
+            metrics.append(Metric(
+                'confsave_seconds_since_last_push', 'Seconds since the last successful push.',
+                time() - state['last_push']))
+
+        repo = self.app.repo
+        repo.read_config()
+        files = repo.config['files']
+        metrics.append(Metric('confsave_tracked_entries', 'Number of tracked paths.', len(files)))
+        metrics.append(Metric(
+            'confsave_drifted_entries', 'Number of tracked paths which are not linked to the repo in the home.',
+            sum(1 for path in files if not self.is_linked(Endpoint(self.app, path)))))
+        metrics.append(Metric(
+            'confsave_untracked_entries', 'Number of dotfiles in the home which are not tracked nor ignored.',
+            sum(1 for path in glob(self.app.get_home_path() + '/.*') if Endpoint(self.app, path).is_visible())))
+        metrics.append(Metric('confsave_backup_bytes', 'Size of all the backups.', self.get_backups_size(state)))
+        metrics.append(Metric('confsave_pack_bytes', 'Size of the pack files of the repo.', self.get_pack_size()))
+        metrics.extend(self.get_lock_metrics())
+        return metrics
+
+    def get_lock_metrics(self):
+        """
+        Contention of the repo lock in this process (for the daemon since its start).
+        """
+        stats = self.app.get_lock().stats
+        return [
+            Metric('confsave_lock_acquired', 'Number of acquisitions of the repo lock.', stats.acquired),
+            Metric(
+                'confsave_lock_contended', 'Number of acquisitions of the repo lock which waited for others.',
+                stats.contended),
+            Metric('confsave_lock_wait_seconds', 'Time spent on waiting for the repo lock.', stats.waited),
+            Metric('confsave_lock_max_wait_seconds', 'Longest wait for the repo lock.', stats.max_wait),
+        ]
+
+    def is_linked(self, endpoint):
+        return islink(endpoint.path) and readlink(endpoint.path) in (
+            endpoint.get_repo_path(), endpoint.get_rendered_path())
+
+    def get_backups_size(self, state):
+        """
+        Backups are not changed after the run which made them, so only the new ones are measured.
+        """
+        session = self.app.backup_session
+        current = session.name if session else None
+        cached = state.get('backup_sizes', {})
+        sizes = {}
+        for backup in self.app.repo.get_backups():
+            name = backup.path[len(self.app.get_repo_path()) + 1:]
+            if name in cached and name != current:
+                sizes[name] = cached[name]
+            else:
+                sizes[name] = backup.get_size()
+        state['backup_sizes'] = sizes
+        return sum(sizes.values())
+
+    def get_pack_size(self):
+        pattern = join(self.app.get_main_repo_path(), '.git', 'objects', 'pack', '*.pack')
+        return sum(getsize(path) for path in glob(pattern))
@@ -1,6 +1,8 @@
 from os import mkdir
+from os import readlink
 from os import sep
 from os import symlink
+from os import unlink
 from os.path import abspath
 from os.path import dirname
 from os.path import exists
@@ -10,6 +12,7 @@ from os.path import join
 from shutil import move
 
 from confsave.filematching import FilePatternMatching
+from confsave.instrumentation import span
 
 
 class Endpoint(object):
@@ -30,6 +33,15 @@ class Endpoint(object):
         """
         return islink(self.path)
 
+    def is_stale_link(self, target=None):
+        """
+        is local file a symlink to the repo, but not to the target (by default the file of the active profile)?
+        """
+        if not self.is_link():
+            return False
+        current = readlink(self.path)
+        return current != (target or self.get_repo_path()) and current.startswith(self.app.get_main_repo_path() + sep)
+
     def is_in_user_path(self):
         """
         Is this path in the user path?
@@ -50,9 +62,14 @@ class Endpoint(object):
 
     def is_repo(self):
         """
-        Is this endpoint a path to confsave repo?
+        Is this endpoint a path to confsave repo (or its lock, variables or daemon socket file)?
         """
-        return self.path == self.app.get_repo_path()
+        return self.path in (
+            self.app.get_main_repo_path(),
+            self.app.get_lock_path(),
+            self.app.get_variables_path(),
+            self.app.get_daemon_socket_path(),
+        )
 
     def get_repo_path(self):
         """
@@ -60,6 +77,12 @@ class Endpoint(object):
         """
         return join(self.app.get_repo_path(), self._get_relative_path())
 
+    def get_rendered_path(self):
+        """
+        get path for the rendered template of the file
+        """
+        return join(self.app.get_rendered_path(), self._get_relative_path())
+
     def get_backup_path(self):
         """
         get path for the file in the backup folder
@@ -94,7 +117,8 @@ class Endpoint(object):
         """
         for path in self.get_folders_paths(root):
             if not exists(path):
-                mkdir(path)
+                with span('fs.mkdir', path=path):
+                    mkdir(path)
 
     def _get_user_path(self):
         """
@@ -108,28 +132,64 @@ class Endpoint(object):
         """
         if not self.is_link():
             self.make_folders()
-            move(self.path, self.get_repo_path())
-            symlink(self.get_repo_path(), self.path)
+            self._move(self.get_repo_path())
+            self._symlink()
             self.app.repo.add_endpoint_to_repo(self)
 
-    def make_link(self):
+    def make_link(self, target=None):
         """
-        Make symlink only and backup old data.
+        Make symlink only and backup old data. Symlink points to the target (by default the file in the repo).
+        Symlinks to the files of other profiles (or to the other target) are replaced.
         """
         result = dict(populated=False, backuped=False)
+        if self.is_stale_link(target):
+            with span('fs.unlink', path=self.path):
+                unlink(self.path)
         if not self.is_link():
             if self.is_existing():
                 self._backup_local_file()
                 result['backuped'] = True
-            symlink(self.get_repo_path(), self.path)
+            self._symlink(target)
             result['populated'] = True
 
         return result
 
+    def remove_link(self, backups=()):
+        """
+        Remove symlink to the repo (of any profile) and move back the newest backup of the file from the backups
+        (sorted from the oldest one). Return True if the symlink was removed.
+        """
+        if not self.is_link() or not readlink(self.path).startswith(self.app.get_main_repo_path() + sep):
+            return False
+        with span('fs.unlink', path=self.path):
+            unlink(self.path)
+        for backup in reversed(backups):
+            path = join(backup.path, self._get_relative_path())
+            if exists(path) or islink(path):
+                with span('fs.move', path=path, destination=self.path):
+                    move(path, self.path)
+                break
+        return True
+
     def _backup_local_file(self):
         """
         Backup local file.
         """
-        self.app.repo.create_backup()
-        self.make_folders(self.app.get_backup_path())
-        move(self.path, self.get_backup_path())
+        with span('fs.backup', path=self.path):
+            self.app.repo.create_backup()
+            self.make_folders(self.app.get_backup_path())
+            self._move(self.get_backup_path())
+
+    def _move(self, destination):
+        """
+        Move local file to the destination.
+        """
+        with span('fs.move', path=self.path, destination=destination):
+            move(self.path, destination)
+
+    def _symlink(self, target=None):
+        """
+        Replace local file with the symlink to the target (by default the file in the repo).
+        """
+        with span('fs.symlink', path=self.path):
+            symlink(target or self.get_repo_path(), self.path)
@@ -0,0 +1,118 @@
+from hashlib import sha1
+from os import makedirs
+from os.path import abspath
+from os.path import exists
+from os.path import expanduser
+from os.path import join
+
+from git import Repo
+
+from confsave.disk import get_folder_size
+
+
+class SharedObjectStore(object):
+    """
+    Host-wide bare repo which stores git objects common for many repos. Repos are linked to the store by git
+    alternates, so objects available in the store are not stored in the repos again.
+    """
+    SHARED_REF = 'refs/shared/{}/'
+
+    def __init__(self, path):
+        self.path = abspath(expanduser(path))
+
+    def get_objects_path(self):
+        """
+        path to the objects folder of the store
+        """
+        return join(self.path, 'objects')
+
+    def init(self):
+        """
+        Create the store if it does not exists. The store is shared by the group (core.sharedRepository), so all the
+        users of the group can write objects into it.
+        """
+        if not exists(self.path):
+            Repo.init(self.path, bare=True, mkdir=True, shared='group')
+
+    def _get_alternates_path(self, git_dir):
+        return join(git_dir, 'objects', 'info', 'alternates')
+
+    def is_linked(self, git_dir):
+        """
+        Is the repo using objects from this store?
+        """
+        path = self._get_alternates_path(git_dir)
+        if not exists(path):
+            return False
+        with open(path) as file:
+            return self.get_objects_path() in [line.strip() for line in file]
+
+    def link(self, git_dir):
+        """
+        Make the repo use objects from this store.
+        """
+        self.init()
+        if self.is_linked(git_dir):
+            return
+
+        path = self._get_alternates_path(git_dir)
+        makedirs(join(git_dir, 'objects', 'info'), exist_ok=True)
+        with open(path, 'a') as file:
+            file.write(self.get_objects_path() + '\n')
+
+    def add_template(self, path):
+        """
+        Fetch branches of the template repo into the store. Return (refs, head) of the template: {ref: commit id} and
+        the branch of its HEAD, which can be written into the linked repos by .seed().
+        """
+        self.init()
+        template = Repo(abspath(expanduser(path)))
+        git_dir = abspath(template.common_dir)
+        prefix = self._get_ref_prefix(git_dir)
+        store = Repo(self.path)
+        store.git.fetch(git_dir, '+refs/heads/*:{}heads/*'.format(prefix))
+        output = store.git.for_each_ref('--format=%(objectname) %(refname)', prefix + 'heads/')
+        refs = {}
+        for line in output.splitlines():
+            sha, ref = line.split(' ', 1)
+            refs['refs/' + ref[len(prefix):]] = sha
+        head = None if template.head.is_detached else template.head.reference.path
+        return refs, head
+
+    def seed(self, git_dir, refs, head=None):
+        """
+        Write refs of the template into the new (empty) repo linked to the store. Objects are not copied, they are
+        available from the store, so seeding costs two small files and no git process.
+        """
+        with open(join(git_dir, 'packed-refs'), 'w') as file:
+            file.write(''.join('{} {}\n'.format(sha, ref) for ref, sha in sorted(refs.items())))
+        if head is not None:
+            with open(join(git_dir, 'HEAD'), 'w') as file:
+                file.write('ref: {}\n'.format(head))
+
+    def _get_ref_prefix(self, git_dir):
+        """
+        Every shared repo has own refs namespace in the store, so the objects are never pruned from the store.
+        """
+        return self.SHARED_REF.format(sha1(abspath(git_dir).encode('utf8')).hexdigest()[:16])
+
+    def share(self, repo):
+        """
+        Move objects of the repo into the store. Objects already available in the store are removed from the repo.
+        Return number of reclaimed bytes.
+        """
+        # objects and refs of the worktrees are stored in the main git folder
+        git_dir = abspath(repo.common_dir)
+        objects_path = join(git_dir, 'objects')
+        before = get_folder_size(objects_path)
+        self.link(git_dir)
+
+        prefix = self._get_ref_prefix(git_dir)
+        Repo(self.path).git.fetch(git_dir, '+refs/heads/*:{}heads/*'.format(prefix))
+        # pack the loose objects first, because only packed objects can be dropped in favour of the alternates
+        repo.git.repack('-d')
+        repo.git.repack('-a', '-d', '-l')
+        # persistent cat-file processes do not know about the alternates and the new packs
+        repo.git.clear_cache()
+
+        return before - get_folder_size(objects_path)
@@ -0,0 +1,138 @@
+import sys
+from os.path import basename
+from time import perf_counter
+from time import process_time
+
+from confsave import instrumentation
+from confsave.instrumentation import Aggregator
+from confsave.instrumentation import Observer
+
+# profiler of the current run (None if profiling is disabled)
+_profiler = None
+_hook_installed = False
+
+
+class PhaseStats(object):
+    """
+    Summary of all the runs of one phase.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+
+    def add(self, wall, cpu):
+        self.calls += 1
+        self.wall += wall
+        self.cpu += cpu
+
+
+class Profiler(Observer):
+    """
+    Observer of the instrumentation spans collecting wall and CPU time of the phases (spans) and counting spawned
+    subprocesses. Nested phases are named with the path of the spans, for example "command.commit/git.index.add".
+    """
+
+    def __init__(self, output=None):
+        self.output = output
+        self.phases = {}
+        self.stack = []
+        self.running = []
+        self.aggregator = Aggregator()
+        self.subprocesses = 0
+        self.git_subprocesses = 0
+        self.startup_cpu = process_time()
+        self.profile = None
+
+    def start(self):
+        self.wall = perf_counter()
+        self.cpu = process_time()
+        if self.output:
+            from cProfile import Profile
+            self.profile = Profile()
+            self.profile.enable()
+
+    def stop(self):
+        self.wall = perf_counter() - self.wall
+        self.cpu = process_time() - self.cpu
+        if self.profile:
+            self.profile.disable()
+            self.profile.dump_stats(self.output)
+
+    def on_start(self, span):
+        self.stack.append(span.name)
+        self.running.append((self.phases.setdefault('/'.join(self.stack), PhaseStats()), process_time()))
+
+    def on_end(self, span):
+        stats, cpu = self.running.pop()
+        stats.add(span.duration, process_time() - cpu)
+        self.stack.pop()
+        self.aggregator.on_end(span)
+
+    def on_subprocess(self, executable, args):
+        self.subprocesses += 1
+        program = args[0] if isinstance(args, (list, tuple)) and args else executable
+        if basename(str(program)) == 'git':
+            self.git_subprocesses += 1
+
+    def format_table(self, lock_stats=None):
+        """
+        Summary of the phases in order of the first call (and the contention of the repo lock, if the stats are given).
+        """
+        lines = [format_row('phase', 'calls', 'wall ms', 'cpu ms')]
+        lines.append(format_row('startup (imports before the run)', '-', None, self.startup_cpu))
+        for path, stats in self.phases.items():
+            lines.append(format_row(path, stats.calls, stats.wall, stats.cpu))
+        lines.append(format_row('total', '-', self.wall, self.cpu))
+        lines.append('git subprocesses: {} (all subprocesses: {})'.format(self.git_subprocesses, self.subprocesses))
+        if lock_stats is not None:
+            lines.append(lock_stats.format())
+        lines.append('')
+        lines.append(self.aggregator.format_table())
+        if self.output:
+            lines.append('cProfile stats written to {}'.format(self.output))
+        return '\n'.join(lines)
+
+
+def format_row(name, calls, wall, cpu):
+    """
+    Format row of the summary table. Times are in seconds (None means not measured).
+    """
+    def milliseconds(value):
+        if isinstance(value, str):
+            return value
+        return '-' if value is None else '{:.2f}'.format(value * 1000)
+    return '{:<60} {:>6} {:>10} {:>10}'.format(name, calls, milliseconds(wall), milliseconds(cpu))
+
+
+def _audit(event, args):
+    if event == 'subprocess.Popen' and _profiler is not None:
+        _profiler.on_subprocess(args[0], args[1])
+
+
+def start(output=None):
+    """
+    Start profiling of the run. If output is set, the run is also profiled by cProfile and stats are written to it.
+    """
+    global _profiler, _hook_installed
+    if not _hook_installed:
+        # audit hooks can not be removed, so the hook is installed once and does nothing when profiling is stopped
+        sys.addaudithook(_audit)
+        _hook_installed = True
+    _profiler = Profiler(output)
+    _profiler.start()
+    instrumentation.register(_profiler)
+    return _profiler
+
+
+def stop():
+    """
+    Stop profiling. Return the profiler.
+    """
+    global _profiler
+    profiler, _profiler = _profiler, None
+    instrumentation.unregister(profiler)
+    profiler.stop()
+    return profiler
+
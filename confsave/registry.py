@@ -0,0 +1,78 @@
+from bisect import bisect_left
+from bisect import insort
+
+
+class FileRegistry(object):
+    """
+    Registry of tracked paths. Paths are unique and kept sorted, so membership checks are O(1) and prefix queries are
+    O(log n + k). Every path can have metadata (for example mode, tags or the last hash). It is stored in the config as
+    the plain "files" list and the optional "files_meta" mapping.
+    """
+
+    def __init__(self, paths=(), metadata=None):
+        metadata = metadata or {}
+        self._metadata = {path: dict(metadata.get(path) or {}) for path in paths}
+        self._paths = sorted(self._metadata)
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Create registry from the "files" and "files_meta" keys of the config.
+        """
+        return cls(config.get('files') or [], config.get('files_meta'))
+
+    def to_config(self):
+        """
+        Get "files" and "files_meta" keys for the config. Paths without metadata are not listed in the "files_meta".
+        """
+        config = {'files': list(self._paths)}
+        metadata = {path: meta for path, meta in self._metadata.items() if meta}
+        if metadata:
+            config['files_meta'] = metadata
+        return config
+
+    def add(self, path, **metadata):
+        """
+        Add path to the registry or update its metadata. Return True if the path was not in the registry before.
+        """
+        created = path not in self._metadata
+        if created:
+            insort(self._paths, path)
+            self._metadata[path] = {}
+        self._metadata[path].update(metadata)
+        return created
+
+    def remove(self, path):
+        """
+        Remove path from the registry.
+        """
+        del self._metadata[path]
+        del self._paths[bisect_left(self._paths, path)]
+
+    def get_metadata(self, path):
+        return self._metadata[path]
+
+    def under(self, prefix):
+        """
+        Get the path and all the paths inside of it (for example everything under ~/.config/nvim).
+        """
+        prefix = prefix.rstrip('/')
+        if prefix in self._metadata:
+            yield prefix
+        # all paths starting with "prefix/" are sorted between "prefix/" and "prefix0" ("0" is next after "/")
+        start = bisect_left(self._paths, prefix + '/')
+        end = bisect_left(self._paths, prefix + '0')
+        for path in self._paths[start:end]:
+            yield path
+
+    def __contains__(self, path):
+        return path in self._metadata
+
+    def __iter__(self):
+        return iter(list(self._paths))
+
+    def __len__(self):
+        return len(self._paths)
+
+    def __repr__(self):
+        return 'FileRegistry({!r})'.format(self._paths)
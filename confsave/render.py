@@ -0,0 +1,137 @@
+import json
+from getpass import getuser
+from hashlib import sha1
+from os import makedirs
+from os import stat
+from os.path import dirname
+from os.path import exists
+from socket import gethostname
+from stat import S_IMODE
+from string import Template
+
+from confsave.instrumentation import span
+from confsave.journal import atomic_write
+
+
+class RenderError(Exception):
+
+    def __init__(self, path, reason):
+        self.path = path
+        self.message = 'Can not render {0}: {1}'.format(path, reason)
+        super(RenderError, self).__init__(self.message)
+
+
+def get_blob_hash(data):
+    """
+    Hash of the data as the git blob (the same as "git hash-object").
+    """
+    return sha1(b'blob ' + str(len(data)).encode('ascii') + b'\0' + data).hexdigest()
+
+
+def read_template(path):
+    """
+    Read the template. Return its data and text. Raise RenderError if it is not an UTF-8 text.
+    """
+    with open(path, 'rb') as file:
+        data = file.read()
+    try:
+        return data, data.decode('utf8')
+    except UnicodeDecodeError:
+        raise RenderError(path, 'template is not an UTF-8 text')
+
+
+class Renderer(object):
+    """
+    Render tracked templates with the host variables (string.Template: "$name" or "${name}", "$$" is "$", unknown
+    variables are left as they are). Outputs are stored in the .git folder of the profile and the home links point to
+    them. Every output is keyed by the blob hash of the template, its mode and the hash of the variables, so an
+    unchanged template is never rendered nor written again.
+    """
+
+    def __init__(self, app, user=None):
+        self.app = app
+        self.user = user
+        self._variables = None
+        self._variables_hash = None
+        self._index = None
+        self._changed = False
+
+    def get_variables(self):
+        """
+        Variables of the host: hostname, user (by default the current one), home and profile, overridden by the YAML
+        mapping from the variables file (~/.confsave.vars).
+        """
+        if self._variables is None:
+            variables = dict(
+                hostname=gethostname(),
+                user=self.user or getuser(),
+                home=self.app.get_home_path(),
+                profile=self.app.get_profile() or self.app.DEFAULT_PROFILE,
+            )
+            path = self.app.get_variables_path()
+            if exists(path):
+                variables.update((str(key), str(value)) for key, value in self._load_variables(path).items())
+            self._variables = variables
+            self._variables_hash = sha1(json.dumps(variables, sort_keys=True).encode('utf8')).hexdigest()
+        return self._variables
+
+    def _load_variables(self, path):
+        """
+        Read the variables file. Raise RenderError if it is not a YAML mapping.
+        """
+        from yaml import SafeLoader
+        from yaml import YAMLError
+        from yaml import load
+        with open(path, 'rb') as file:
+            try:
+                loaded = load(file, Loader=SafeLoader)
+            except YAMLError:
+                raise RenderError(path, 'variables are not valid YAML')
+        if loaded is None:
+            return {}
+        if not isinstance(loaded, dict):
+            raise RenderError(path, 'variables are not a YAML mapping')
+        return loaded
+
+    def load_index(self):
+        """
+        Index of the rendered outputs: {relative path: key}.
+        """
+        if self._index is None:
+            try:
+                with open(self.app.get_render_index_path()) as file:
+                    self._index = json.load(file)
+            except (OSError, ValueError):
+                self._index = {}
+        return self._index
+
+    def render(self, endpoint):
+        """
+        Render the template of the endpoint if its key changed since the last render. Return path of the output.
+        """
+        variables = self.get_variables()
+        template_path = endpoint.get_repo_path()
+        output_path = endpoint.get_rendered_path()
+        data, text = read_template(template_path)
+        mode = S_IMODE(stat(template_path).st_mode)
+        key = '{0}:{1:o}:{2}'.format(get_blob_hash(data), mode, self._variables_hash)
+        index = self.load_index()
+        relative = endpoint._get_relative_path()
+        if index.get(relative) == key and exists(output_path):
+            return output_path
+
+        with span('fs.render', path=endpoint.path):
+            rendered = Template(text).safe_substitute(variables)
+            makedirs(dirname(output_path), exist_ok=True)
+            atomic_write(output_path, rendered.encode('utf8'), mode)
+        index[relative] = key
+        self._changed = True
+        return output_path
+
+    def save(self):
+        """
+        Save the index if some output was rendered.
+        """
+        if self._changed:
+            atomic_write(self.app.get_render_index_path(), json.dumps(self._index, sort_keys=True).encode('utf8'))
+            self._changed = False
@@ -1,77 +1,262 @@
-from os import mkdir
+import tarfile
+from glob import glob
+from os import makedirs
+from os import lstat
+from os import stat
+from os.path import abspath
 from os.path import exists
+from os.path import isdir
+from os.path import join
+from shutil import rmtree
 from yaml import dump
 from yaml import load
 
+try:
+    from yaml import CSafeDumper as SafeDumper
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:  # libyaml is not available
+    from yaml import SafeDumper
+    from yaml import SafeLoader
+
+from git import BadName
+from git import InvalidGitRepositoryError
+from git import NoSuchPathError
 from git import Repo
 
+from confsave.backups import Backup
+from confsave.backups import BackupRetention
+from confsave.configcache import ConfigCache
+from confsave.journal import ConfigJournal
+from confsave.journal import atomic_write
+from confsave.models import Endpoint
+from confsave.instrumentation import instrumented
+from confsave.instrumentation import span
+from confsave.registry import FileRegistry
+from confsave.results import DriftEntry
+from confsave.results import DriftReport
+
 
 class LocalRepo(object):
     REMOTE_NAME = 'origin'
     BRANCH_NAME = 'master'
+    PROFILE_BRANCH = 'profile/{}'
+    RETENTION_KEY = 'backup_retention'
+    BUNDLE_REF = 'refs/confsave/bundles/{}'
 
     def __init__(self, app):
         self.app = app
         self.git = None
-        self.config = {'files': []}
+        self.config = {'files': FileRegistry()}
+        self._config_signature = None
+        self._journal = None
 
-    def is_created(self):
+    def is_initialized(self):
         """
-        Is this repo created and ready?
+        Is the repo of the active profile ready, so .init_git_repo() and .init_branch() would change nothing (the
+        worktree of the profile, the initial commit and the link to the shared object store are made)? The opened repo
+        is kept.
         """
-        if exists(self.app.get_repo_path()):
+        path = self.app.get_repo_path()
+        git = self.git
+        if git is None or git.working_dir != path:
             try:
-                Repo(self.app.get_repo_path())
-                return True
-            except:
+                git = Repo(path)
+            except (InvalidGitRepositoryError, NoSuchPathError):
                 return False
-        else:
+        if not git.head.is_valid():
             return False
+        store = self.app.get_shared_object_store()
+        if store and not (exists(store.path) and store.is_linked(abspath(git.common_dir))):
+            return False
+        self.git = git
+        return True
 
+    @instrumented('repo.init_git_repo')
     def init_git_repo(self):
         """
-        Initalize git repo.
+        Initalize git repo. Repo is opened only once per process.
+        """
+        path = self.app.get_repo_path()
+        if self.git is not None and self.git.working_dir == path:
+            return
+        profile = self.app.get_profile()
+        if profile is not None:
+            self.init_profile(profile)
+        try:
+            with span('git.open', path=path):
+                self.git = Repo(path)
+        except (InvalidGitRepositoryError, NoSuchPathError):
+            with span('git.init', path=path):
+                self.git = Repo.init(path, mkdir=True)
+        store = self.app.get_shared_object_store()
+        if store:
+            store.link(abspath(self.git.common_dir))
+
+    def get_branch_name(self):
+        """
+        Name of the branch of the active profile.
         """
-        if not self.is_created():
-            Repo.init(self.app.get_repo_path(), mkdir=True)
-        self.git = Repo(self.app.get_repo_path())
+        profile = self.app.get_profile()
+        return self.BRANCH_NAME if profile is None else self.PROFILE_BRANCH.format(profile)
 
+    @instrumented('repo.init_profile')
+    def init_profile(self, profile):
+        """
+        Create the branch of the profile and its worktree if needed. The branch is made from the remote one if it
+        exists, otherwise from the default branch. The worktree is kept, so switching back to the profile does not
+        check files out again. Return True if the worktree was created.
+        """
+        path = self.app.get_profile_path(profile)
+        if exists(path):
+            return False
+        main = Repo(self.app.get_main_repo_path())
+        branch = self.PROFILE_BRANCH.format(profile)
+        if branch not in main.heads:
+            upstream = self._get_remote_branch(main, branch)
+            head = main.create_head(branch, upstream or main.heads[self.BRANCH_NAME])
+            if upstream:
+                head.set_tracking_branch(upstream)
+        with span('git.worktree.add', profile=profile):
+            main.git.worktree('add', path, branch)
+        return True
+
+    def _get_remote_branch(self, git, branch):
+        """
+        Get the remote branch or None if it does not exists (or there is no remote).
+        """
+        try:
+            return git.remotes[self.REMOTE_NAME].refs[branch]
+        except (IndexError, KeyError):
+            return None
+
+    @instrumented('repo.read_config')
     def read_config(self):
         """
-        Read config file or flush the .config attribute if no file found.
+        Read config file and replay the journal on it, or flush the .config attribute if no file found. The file is not
+        parsed again if it and the journal have not changed since the last read or if the binary cache of it is valid.
         """
-        if exists(self.app.get_config_path()):
-            with open(self.app.get_config_path(), 'r') as file:
-                self.config = load(file)
+        path = self.app.get_config_path()
+        journal = self.get_journal()
+        signature = (self._get_config_signature(path), self._get_config_signature(journal.path))
+        if signature == self._config_signature:
+            return
+        if exists(path):
+            with open(path, 'rb') as file:
+                self._set_config(self._load_config(file.read()))
         else:
-            self.config = {'files': []}
+            self.config = {'files': FileRegistry()}
+        journal.replay(self.config['files'])
+        self._config_signature = signature
+
+    def _set_config(self, data):
+        self.config = dict(data)
+        self.config['files'] = FileRegistry.from_config(data)
+        self.config.pop('files_meta', None)
+
+    def _load_config(self, data):
+        cache = self._get_config_cache()
+        digest = ConfigCache.get_digest(data)
+        config = cache.get(digest) if cache else None
+        if config is None:
+            config = load(data, Loader=SafeLoader)
+            if cache:
+                cache.set(digest, config)
+        return config
 
+    def _get_config_cache(self):
+        path = self.app.get_config_cache_path()
+        return ConfigCache(path) if path else None
+
+    def _get_config_signature(self, path):
+        if not exists(path):
+            return None
+        info = stat(path)
+        return (path, info.st_ino, info.st_size, info.st_mtime_ns)
+
+    def _update_config_signature(self):
+        self._config_signature = (
+            self._get_config_signature(self.app.get_config_path()),
+            self._get_config_signature(self.get_journal().path),
+        )
+
+    def get_journal(self):
+        """
+        Get journal of the tracked paths changes. It is created once per journal path.
+        """
+        path = self.app.get_journal_path()
+        if self._journal is None or self._journal.path != path:
+            self._journal = ConfigJournal(path)
+        return self._journal
+
+    def track(self, path, **metadata):
+        """
+        Add path to the tracked paths (or update its metadata). The change is saved by .write_config().
+        """
+        self.config['files'].add(path, **metadata)
+        self.get_journal().record(ConfigJournal.ADD, path, **metadata)
+
+    def untrack(self, path):
+        """
+        Remove path from the tracked paths. The change is saved by .write_config().
+        """
+        self.config['files'].remove(path)
+        self.get_journal().record(ConfigJournal.REMOVE, path)
+
+    @instrumented('repo.write_config')
     def write_config(self):
         """
-        Write config to a file in local repo.
+        Save changes of the tracked paths by appending them to the journal (with one fsync for all of them). The
+        journal is compacted into the config file when it is too long or when there is no config file yet.
         """
-        with open(self.app.get_config_path(), 'w') as file:
-            dump(self.config, file, default_flow_style=False)
+        journal = self.get_journal()
+        journal.flush()
+        if journal.entries > self.app.settings.JOURNAL_LIMIT or not exists(self.app.get_config_path()):
+            self.compact_config()
+        else:
+            self._update_config_signature()
+
+    @instrumented('repo.compact_config')
+    def compact_config(self):
+        """
+        Write whole config to the config file (atomically) and clear the journal.
+        """
+        config = dict(self.config)
+        config.update(self.config['files'].to_config())
+        data = dump(config, Dumper=SafeDumper, default_flow_style=False).encode('utf8')
+        atomic_write(self.app.get_config_path(), data)
+        # the config file is complete now, so the journal is not needed (replaying it again would change nothing)
+        self.get_journal().clear()
+        self._update_config_signature()
+        cache = self._get_config_cache()
+        if cache:
+            cache.set(ConfigCache.get_digest(data), config)
 
     def add_endpoint_to_repo(self, endpoint):
         """
-        Add path to repo and the config.
+        Add path to repo and the config (with the mode and the hash of the file).
         """
-        self.git.index.add([endpoint.get_repo_path()])
-        self.config['files'].append(endpoint.path)
+        repo_path = endpoint.get_repo_path()
+        with span('git.index.add', paths=1):
+            entries = self.git.index.add([repo_path])
+        metadata = dict(mode=lstat(repo_path).st_mode)
+        if len(entries) == 1 and not isdir(repo_path):
+            metadata['hash'] = entries[0].hexsha
+        self.track(endpoint.path, **metadata)
 
     def set_remote(self, remote_path):
         """
         Connect with remote repo.
         """
         remote = self._get_remote(remote_path)
-        remote.fetch()
+        with span('git.fetch', remote=self.REMOTE_NAME):
+            remote.fetch()
         was_created = self._create_remote_branch(remote)
         self._set_remote_branch(remote)
 
         if not was_created:
             # if the branch was not created, then we need to pull changes from the upstream
-            remote.pull()
+            with span('git.pull', remote=self.REMOTE_NAME):
+                remote.pull()
 
     def _get_remote(self, remote_path):
         """
@@ -99,20 +284,24 @@ class LocalRepo(object):
         Remove remote.
         """
         old_remote = self.git.remotes[self.REMOTE_NAME]
-        self.git.delete_remote(old_remote)
+        with span('git.remote.delete', remote=self.REMOTE_NAME):
+            self.git.delete_remote(old_remote)
 
     def _create_remote(self, remote_path):
         """
         Create remote with given remote_path.
         """
-        self.git.create_remote(self.REMOTE_NAME, remote_path)
+        with span('git.remote.create', remote=self.REMOTE_NAME):
+            self.git.create_remote(self.REMOTE_NAME, remote_path)
 
     def _create_remote_branch(self, remote):
         """
         Create remote branch if needed. Return status of creation.
         """
-        if self.BRANCH_NAME not in [ref.name for ref in remote.refs]:
-            remote.push('{0}:{0}'.format(self.BRANCH_NAME))
+        branch = self.get_branch_name()
+        if branch not in [ref.name for ref in remote.refs]:
+            with span('git.push', remote=self.REMOTE_NAME):
+                remote.push('{0}:{0}'.format(branch))
             return True
         return False
 
@@ -120,32 +309,209 @@ class LocalRepo(object):
         """
         Link local branch to a remote one.
         """
-        local = self.git.heads[self.BRANCH_NAME]
-        upstream = remote.refs[self.BRANCH_NAME]
+        branch = self.get_branch_name()
+        local = self.git.heads[branch]
+        upstream = remote.refs[branch]
         local.set_tracking_branch(upstream)
 
+    @instrumented('repo.init_branch')
     def init_branch(self):
         """
         Make initial commit if needed.
         """
-        if self.git.refs == []:
-            self.write_config()
+        if not self.git.head.is_valid():
+            self.compact_config()
             index = self.git.index
-            index.add([self.app.get_config_path()])
-            index.commit('inital commit')
+            with span('git.index.add', paths=1):
+                index.add([self.app.get_config_path()])
+            with span('git.index.commit'):
+                index.commit('inital commit')
             self.git.active_branch.rename(self.BRANCH_NAME)
 
     def commit(self, message):
         """
-        Commit files added to the index and push them to the repo if it is set.
-        """
-        changes = [diff.a_path for diff in self.git.index.diff(None)]
-        self.git.index.add(changes)
-        self.git.index.commit(message)
+        Commit files added to the index and push them to the repo if it is set. The journal is compacted first, so
+        the commited config file is complete.
+        """
+        if not self.get_journal().is_empty():
+            self.compact_config()
+        with span('git.index.diff'):
+            changes = [diff.a_path for diff in self.git.index.diff(None)]
+        with span('git.index.add', paths=len(changes)):
+            self.git.index.add(changes)
+        with span('git.index.commit'):
+            self.git.index.commit(message)
 
         remote = self._get_remote(None)
         if remote:
-            remote.push()
+            with span('git.push', remote=self.REMOTE_NAME):
+                # pushed by the refspec, so branches of new profiles are pushed without the upstream set
+                remote.push('{0}:{0}'.format(self.get_branch_name()))
+
+    def iter_status(self, chunk_size=65536):
+        """
+        Yield fields of the `git status --porcelain -z` output. The output is read in chunks, so it is never stored
+        whole in the memory.
+        """
+        with span('git.status'):
+            process = self.git.git.status('--porcelain', '-z', as_process=True)
+            rest = b''
+            for chunk in iter(lambda: process.stdout.read(chunk_size), b''):
+                fields = (rest + chunk).split(b'\0')
+                rest = fields.pop()
+                for field in fields:
+                    yield field.decode('utf8', 'surrogateescape')
+            process.wait()
+
+    def get_config_at(self, treeish):
+        """
+        Read config file stored in the given commit.
+        """
+        tree = self.git.commit(treeish).tree
+        try:
+            blob = tree / self.app.settings.CONFIG_FILENAME
+        except KeyError:
+            return {'files': []}
+        return load(blob.data_stream.read(), Loader=SafeLoader)
+
+    def _load_config_blob(self, binsha):
+        """
+        Parse config file stored in the blob given by the binary id.
+        """
+        return load(self.git.odb.stream(binsha).read(), Loader=SafeLoader) or {'files': []}
+
+    def get_tracked_paths_at(self, treeish):
+        """
+        Get paths (relative to the repo) of tracked files which exist in the given commit.
+        """
+        tree = self.git.commit(treeish).tree
+        for path in self.get_config_at(treeish)['files']:
+            relative = Endpoint(self.app, path)._get_relative_path()
+            try:
+                tree / relative
+            except KeyError:
+                continue
+            yield relative
+
+    def get_host_trees(self):
+        """
+        Get root tree ids of the hosts: {host: tree id}. Hosts are the branches of the profiles ("default" is the main
+        branch). Remote branches are fetched first and they are used instead of the local ones. All the trees are read
+        by one git call.
+        """
+        remote = self._get_remote_or_none()
+        prefixes = ['refs/heads/']
+        if remote:
+            with span('git.fetch', remote=self.REMOTE_NAME):
+                remote.fetch()
+            prefixes.append('refs/remotes/{}/'.format(self.REMOTE_NAME))
+        with span('git.for_each_ref'):
+            output = self.git.git.for_each_ref('--format=%(refname) %(tree)', *prefixes)
+        trees = {}
+        for line in output.splitlines():
+            refname, tree = line.split(' ')
+            for prefix in prefixes:
+                if refname.startswith(prefix):
+                    host = self.get_host_name(refname[len(prefix):])
+                    if host is not None and (host not in trees or prefix != prefixes[0]):
+                        trees[host] = tree
+        return trees
+
+    def get_host_name(self, branch):
+        """
+        Get name of the host (profile) from the branch name or None if it is not a branch of the profile.
+        """
+        if branch == self.BRANCH_NAME:
+            return self.app.DEFAULT_PROFILE
+        prefix = self.PROFILE_BRANCH.format('')
+        if branch.startswith(prefix):
+            return branch[len(prefix):]
+        return None
+
+    @instrumented('repo.get_drift')
+    def get_drift(self):
+        """
+        Compare tracked paths of all the hosts with the last commit of the active profile. Paths tracked by any of the
+        hosts are compared, so paths which exist only on other hosts are reported too. Only subtrees with different ids
+        are read (see TreeDiff) and every distinct config of the hosts is parsed once (hosts sharing the config of the
+        active profile need no parsing).
+        """
+        from confsave.drift import SAME
+        from confsave.drift import TreeDiff
+        trees = self.get_host_trees()
+        reference = self.git.heads[self.get_branch_name()].commit.tree.hexsha
+        diff = TreeDiff(self.git)
+        name = self.app.settings.CONFIG_FILENAME
+        blobs = set(diff.get_blob(tree, name) for tree in set(trees.values()))
+        blobs.discard(diff.get_blob(reference, name))
+        blobs.discard(None)
+        files = set(self.config['files'])
+        for blob in blobs:
+            files.update(self._load_config_blob(blob).get('files') or [])
+        diff.add_paths(Endpoint(self.app, path)._get_relative_path() for path in files)
+        hosts = sorted(trees)
+        changes = {}
+        for index, host in enumerate(hosts):
+            for path, code in diff.compare(reference, trees[host]).items():
+                changes.setdefault(path, [SAME] * len(hosts))[index] = code
+        entries = [DriftEntry(path, tuple(codes)) for path, codes in sorted(changes.items())]
+        return DriftReport(self.app.get_profile() or self.app.DEFAULT_PROFILE, hosts, entries)
+
+    def export_archive(self, stream, treeish='HEAD'):
+        """
+        Write tracked files from the given commit into the stream as a tar.gz archive. Files are streamed from the git
+        objects, so nothing is written on the disk.
+        """
+        paths = list(self.get_tracked_paths_at(treeish))
+        if paths:
+            with span('git.archive', treeish=treeish, paths=len(paths)):
+                self.git.archive(stream, treeish, format='tar.gz', path=paths)
+        else:
+            # git archive without paths would export the whole tree
+            tarfile.open(fileobj=stream, mode='w|gz').close()
+        return paths
+
+    def get_bundled_commit(self, peer):
+        """
+        Get last commit bundled for the peer or None if nothing was bundled yet.
+        """
+        try:
+            return self.git.commit(self.BUNDLE_REF.format(peer)).hexsha
+        except BadName:
+            return None
+
+    def create_bundle(self, path, peer, since=None):
+        """
+        Create git bundle with commits which were not bundled for the peer yet (or are newer then since). Return
+        False if there is nothing to bundle.
+        """
+        since = since or self.get_bundled_commit(peer)
+        branch = self.get_branch_name()
+        head = self.git.heads[branch].commit.hexsha
+        if since and self.git.commit(since).hexsha == head:
+            return False
+
+        revision = '{}..{}'.format(since, branch) if since else branch
+        with span('git.bundle.create', path=path, revision=revision):
+            self.git.git.bundle('create', path, revision)
+        with span('git.update_ref', peer=peer):
+            self.git.git.update_ref(self.BUNDLE_REF.format(peer), head)
+        return True
+
+    def apply_bundle(self, path):
+        """
+        Verify the bundle and pull commits from it.
+        """
+        with span('git.bundle.verify', path=path):
+            self.git.git.bundle('verify', path)
+        with span('git.pull', remote=path):
+            self.git.git.pull(path, self.get_branch_name())
+
+    def share_objects(self):
+        """
+        Move objects of this repo to the shared object store. Return number of reclaimed bytes.
+        """
+        return self.app.get_shared_object_store().share(self.git)
 
     def add_ignore(self, path):
         """
@@ -158,18 +524,81 @@ class LocalRepo(object):
             ignored.sort()
         with open(self.app.get_gitignore_path(), 'w') as file:
             file.write('\n'.join(ignored))
-        self.git.index.add([self.app.get_gitignore_path()])
+        with span('git.index.add', paths=1):
+            self.git.index.add([self.app.get_gitignore_path()])
 
     def create_backup(self):
         """
         Create backup dir if it does not exists. Add backup to gitignore.
         """
-        path = self.app.get_backup_path()
-        if exists(path):
+        session = self.app.get_backup_session()
+        if session.is_created:
             return
 
-        mkdir(path)
-        self.add_ignore(self.app.settings.BACKUP_NAME + '_*')
+        path = self.app.get_backup_path()
+        if not exists(path):
+            makedirs(path)
+            if self.git:
+                self.add_ignore(self.app.settings.BACKUP_NAME + '_*')
+        session.is_created = True
+
+    def get_backups(self):
+        """
+        Get list of backups sorted from the oldest one.
+        """
+        pattern = join(self.app.get_repo_path(), self.app.settings.BACKUP_NAME + '_*')
+        return [Backup(path) for path in sorted(glob(pattern)) if isdir(path)]
+
+    def get_backup_retention(self):
+        """
+        Get retention limits of the backups: {keep_last, max_age, max_size}. Limits stored in the config are
+        overridden by the ones from the settings (command line).
+        """
+        retention = dict(self.config.get(self.RETENTION_KEY) or {})
+        for name, value in self._get_retention_settings().items():
+            if value is not None:
+                retention[name] = value
+        return {name: retention.get(name) for name in ('keep_last', 'max_age', 'max_size')}
+
+    def store_backup_retention(self):
+        """
+        Store retention limits from the settings in the config, so the pruning after populate uses them in the next
+        runs too. Return True if the config was changed.
+        """
+        retention = dict(self.config.get(self.RETENTION_KEY) or {})
+        changed = False
+        for name, value in self._get_retention_settings().items():
+            if value is not None and retention.get(name) != value:
+                retention[name] = value
+                changed = True
+        if changed:
+            self.config[self.RETENTION_KEY] = retention
+            self.compact_config()
+        return changed
+
+    def _get_retention_settings(self):
+        settings = self.app.settings
+        return dict(
+            keep_last=settings.BACKUP_KEEP_LAST,
+            max_age=settings.BACKUP_MAX_AGE,
+            max_size=settings.BACKUP_MAX_SIZE,
+        )
+
+    def prune_backups(self):
+        """
+        Remove backups which are out of the retention limits. The backup of the current run is never removed. Return
+        number of reclaimed bytes.
+        """
+        retention = BackupRetention(
+            self.get_backups(),
+            protected=self.app.get_backup_path(),
+            **self.get_backup_retention()
+        )
+        reclaimed = 0
+        for backup in retention.get_evicted():
+            reclaimed += backup.get_size()
+            rmtree(backup.path)
+        return reclaimed
 
     def hide_file(self, name):
         """
@@ -184,7 +613,8 @@ class LocalRepo(object):
             hidden_files.sort()
 
             open(self.app.get_cs_ignore_path(), 'w').write('\n'.join(hidden_files))
-            self.git.index.add([self.app.get_cs_ignore_path()])
+            with span('git.index.add', paths=1):
+                self.git.index.add([self.app.get_cs_ignore_path()])
 
     def get_ignore_list(self):
         """
@@ -0,0 +1,78 @@
+from collections import namedtuple
+
+
+class AddResult(namedtuple('AddResult', ['path', 'tags'])):
+    """
+    Path added to the repo.
+    """
+    __slots__ = ()
+
+
+class UntrackedPath(namedtuple('UntrackedPath', ['path'])):
+    """
+    File from the home folder which is not added to the repo.
+    """
+    __slots__ = ()
+
+
+class StatusEntry(namedtuple('StatusEntry', ['code', 'path', 'original_path'])):
+    """
+    Changed file in the repo. Code is the two letters status of the git ("XY" of the porcelain format), path is relative
+    to the repo and original_path is set only for renamed or copied files.
+    """
+    __slots__ = ()
+
+
+class LinkResult(namedtuple('LinkResult', ['path', 'populated', 'backup_path'])):
+    """
+    Result of populating (or importing) a path into the home folder. Backup path is set if the old file was moved to the
+    backup.
+    """
+    __slots__ = ()
+
+    @property
+    def backuped(self):
+        return self.backup_path is not None
+
+
+class HomePopulated(namedtuple('HomePopulated', ['home', 'results', 'error'])):
+    """
+    Result of populating one home of the fleet: LinkResult for every tracked path made before the error (if any).
+    """
+    __slots__ = ()
+
+
+class BundleResult(namedtuple('BundleResult', ['path', 'peer', 'created'])):
+    """
+    Result of creating a bundle. Created is False if there was nothing to bundle for the peer.
+    """
+    __slots__ = ()
+
+
+class RepoCreated(namedtuple('RepoCreated', ['path', 'created', 'url'])):
+    """
+    Result of creating a bare repo. Created is False if the path already existed.
+    """
+    __slots__ = ()
+
+
+class DriftEntry(namedtuple('DriftEntry', ['path', 'changes'])):
+    """
+    Tracked path (relative to the repo) which differs on some of the hosts. Changes are the codes (".", "M", "A" or "D")
+    in order of the hosts of the report.
+    """
+    __slots__ = ()
+
+
+class DriftReport(namedtuple('DriftReport', ['reference', 'hosts', 'entries'])):
+    """
+    Differences of the tracked paths between the branches of the hosts and the reference (the active profile).
+    """
+    __slots__ = ()
+
+
+class WatchState(namedtuple('WatchState', ['tracked', 'commits'])):
+    """
+    State of the watch: number of watched paths and number of commits made so far.
+    """
+    __slots__ = ()
@@ -0,0 +1,21 @@
+from os import mkdir
+from os.path import join
+from tempfile import mkdtemp
+
+from confsave.api import UntrackedPath
+from confsave.api import get_commands
+
+
+class TestApi(object):
+
+    def test_get_commands(self):
+        """
+        get_commands should create commands for the given settings, which can be used without the command line
+        """
+        home = mkdtemp()
+        mkdir(join(home, '.config'))
+
+        commands = get_commands(home_path=home, repo_path=join(home, '.confsave'))
+
+        assert commands.app.get_home_path() == home
+        assert list(commands.show_list()) == [UntrackedPath(join(home, '.config'))]
@@ -34,20 +34,48 @@ class TestApplication(object):
         with patch.object(SampleApplication, 'get_repo_path') as mock:
             yield mock
 
+    @yield_fixture
+    def mget_main_repo_path(self):
+        with patch.object(SampleApplication, 'get_main_repo_path') as mock:
+            yield mock
+
     @yield_fixture
     def mjoin(self):
         with patch('confsave.app.join') as mock:
             yield mock
 
-    def test_get_repo_path(self, mexpanduser, mabspath):
+    def test_get_main_repo_path(self, mexpanduser, mabspath):
         """
-        .get_repo_path should return path to a local repo using path from settings
+        .get_main_repo_path should return path to a local repo using path from settings
         """
         app = SampleApplication()
-        assert app.get_repo_path() == mabspath.return_value
+        assert app.get_main_repo_path() == mabspath.return_value
         mexpanduser.assert_called_once_with('~/.creazyrepopath')
         mabspath.assert_called_once_with(mexpanduser.return_value)
 
+    def test_get_repo_path(self, tmpdir):
+        """
+        .get_repo_path should return path to the worktree of the active profile stored in the repo
+        """
+        app = SampleApplication()
+        app.update_settings(repo_path=str(tmpdir))
+        tmpdir.mkdir('.git')
+
+        assert app.get_repo_path() == str(tmpdir)
+        assert app.get_git_dir() == str(tmpdir.join('.git'))
+
+        app.set_profile('web')
+        app.update_settings(repo_path=str(tmpdir))
+
+        assert app.get_profile() == 'web'
+        assert app.get_repo_path() == str(tmpdir.join('.git', 'profiles', 'web'))
+        assert app.get_git_dir() == str(tmpdir.join('.git', 'worktrees', 'web'))
+        assert app.get_lock_path() == str(tmpdir) + '.lock'
+
+        app.set_profile(app.DEFAULT_PROFILE)
+
+        assert app.get_profile() is None
+
     def test_get_config_path(self, mjoin, mget_repo_path):
         """
         .get_repo_path should return path to a config file in local repo using
@@ -95,19 +123,131 @@ class TestApplication(object):
         )
         assert app.settings.BACKUP_NAME == backup_name if backup_name else app.settings.BACKUP_NAME != backup_name
 
+    @mark.parametrize('value', [None, 0, 3])
+    def test_update_settings_backup_retention(self, value):
+        """
+        .update_settings should update backup retention limits when values are not None (0 is a proper value)
+        """
+        app = SampleApplication()
+
+        app.update_settings(backup_keep_last=value, backup_max_age=value, backup_max_size=value)
+
+        assert app.settings.BACKUP_KEEP_LAST == value
+        assert app.settings.BACKUP_MAX_AGE == value
+        assert app.settings.BACKUP_MAX_SIZE == value
+
+    def test_get_config_cache_path(self, mget_main_repo_path):
+        """
+        .get_config_cache_path should return path in the .git folder or None when the cache is disabled
+        """
+        app = SampleApplication()
+        mget_main_repo_path.return_value = 'something'
+
+        assert app.get_config_cache_path() == 'something/.git/confsave-config.cache'
+
+        app.settings.CONFIG_CACHE = None
+
+        assert app.get_config_cache_path() is None
+
+    def test_get_lock(self, mget_main_repo_path):
+        """
+        .get_lock should return the same lock for the same repo path with the timeout from the settings
+        """
+        app = SampleApplication()
+        mget_main_repo_path.return_value = '/home/user/.confsave'
+        app.update_settings(lock_timeout=5)
+
+        lock = app.get_lock()
+
+        assert lock.path == '/home/user/.confsave.lock'
+        assert lock.timeout == 5
+        assert app.get_lock() is lock
+
+    def test_get_journal_path(self, mget_main_repo_path):
+        """
+        .get_journal_path should return path in the .git folder
+        """
+        app = SampleApplication()
+        mget_main_repo_path.return_value = 'something'
+
+        assert app.get_journal_path() == 'something/.git/confsave.journal'
+
+    def test_get_metrics_state_path(self, mget_main_repo_path):
+        """
+        .get_metrics_state_path should return path in the .git folder
+        """
+        app = SampleApplication()
+        mget_main_repo_path.return_value = 'something'
+
+        assert app.get_metrics_state_path() == 'something/.git/confsave.metrics.json'
+
+    def test_get_rendered_path(self, mget_main_repo_path):
+        """
+        .get_rendered_path and .get_render_index_path should return paths in the .git folder
+        """
+        app = SampleApplication()
+        mget_main_repo_path.return_value = 'something'
+
+        assert app.get_rendered_path() == 'something/.git/rendered'
+        assert app.get_render_index_path() == 'something/.git/confsave.rendered.json'
+
+    def test_get_variables_path(self):
+        """
+        .get_variables_path should return path in the home directory
+        """
+        app = SampleApplication()
+        app.update_settings(home_path='/home/user')
+
+        assert app.get_variables_path() == '/home/user/.confsave.vars'
+
+    def test_get_shared_object_store(self):
+        """
+        .get_shared_object_store should return the store only when its path is set
+        """
+        app = SampleApplication()
+        assert app.get_shared_object_store() is None
+
+        app.update_settings(shared_objects_path='/var/lib/confsave')
+
+        assert app.get_shared_object_store().path == '/var/lib/confsave'
+
     def test_get_backup_path(self, mget_repo_path, mjoin):
         """
-        .get_backup_path should return backup path with local date
+        .get_backup_path should return backup path with time of the backup session start
         """
         app = SampleApplication()
-        now = datetime(year=2012, month=5, day=3)
+        now = datetime(year=2012, month=5, day=3, hour=23, minute=59, second=58)
         with freeze_time(now):
             assert app.get_backup_path() == mjoin.return_value
             mjoin.assert_called_once_with(
                 mget_repo_path.return_value,
-                'backup_12_05_03',
+                'backup_12_05_03_235958_000000',
             )
 
+    def test_get_backup_path_within_one_session(self, mget_repo_path, mjoin):
+        """
+        .get_backup_path should return the same path for the whole backup session, even after midnight
+        """
+        app = SampleApplication()
+        with freeze_time(datetime(year=2012, month=5, day=3, hour=23, minute=59)):
+            app.get_backup_path()
+        with freeze_time(datetime(year=2012, month=5, day=4)):
+            app.get_backup_path()
+
+        assert mjoin.call_args_list[0] == mjoin.call_args_list[1]
+
+    def test_start_backup_session(self):
+        """
+        .start_backup_session should replace the current backup session
+        """
+        app = SampleApplication()
+        first = app.get_backup_session()
+
+        second = app.start_backup_session()
+
+        assert first is not second
+        assert app.get_backup_session() is second
+
     def test_get_gitignore_path(self, mget_repo_path):
         """
         .get_gitignore_path should return proper path to a .gitignore file in main repository's path
@@ -0,0 +1,165 @@
+import tarfile
+from io import BytesIO
+from os import mkdir
+from os import stat
+from os import symlink
+from os import umask
+from os.path import exists
+from os.path import join
+from stat import S_IMODE
+from tempfile import mkdtemp
+
+from mock import MagicMock
+from pytest import fixture
+from pytest import raises
+
+from confsave.archive import ArchiveImporter
+from confsave.archive import UnsafeArchiveMember
+
+
+class TestArchiveImporter(object):
+
+    @fixture
+    def home_path(self):
+        return mkdtemp()
+
+    @fixture
+    def backup_path(self):
+        return mkdtemp()
+
+    @fixture
+    def app(self, home_path, backup_path):
+        mock = MagicMock()
+        mock.get_home_path.return_value = home_path
+        mock.get_backup_path.return_value = backup_path
+        mock.get_main_repo_path.return_value = join(home_path, '.confsave')
+        return mock
+
+    @fixture
+    def importer(self, app):
+        return ArchiveImporter(app)
+
+    def _archive(self, files):
+        stream = BytesIO()
+        with tarfile.open(fileobj=stream, mode='w:gz') as archive:
+            for name, data in files:
+                info = tarfile.TarInfo(name)
+                if isinstance(data, tuple):
+                    info.type = tarfile.SYMTYPE
+                    info.linkname = data[0]
+                    archive.addfile(info)
+                elif data is None:
+                    info.type = tarfile.DIRTYPE
+                    info.mode = 0o755
+                    archive.addfile(info)
+                else:
+                    info.size = len(data)
+                    info.mode = 0o644
+                    archive.addfile(info, BytesIO(data))
+        stream.seek(0)
+        return stream
+
+    def test_import_archive(self, importer, home_path):
+        """
+        .import_archive should write members of the archive into the user directory
+        """
+        stream = self._archive([('.config', None), ('.config/app.conf', b'conf'), ('.vimrc', b'vim')])
+
+        results = [(endpoint.path, result) for endpoint, result in importer.import_archive(stream)]
+
+        assert results == [
+            (join(home_path, '.config'), dict(populated=True, backuped=False)),
+            (join(home_path, '.config/app.conf'), dict(populated=True, backuped=False)),
+            (join(home_path, '.vimrc'), dict(populated=True, backuped=False)),
+        ]
+        assert open(join(home_path, '.config/app.conf')).read() == 'conf'
+        assert open(join(home_path, '.vimrc')).read() == 'vim'
+
+    def test_import_archive_umask(self, importer, home_path):
+        """
+        .import_archive should mask modes of the members by the umask of the process
+        """
+        stream = BytesIO()
+        with tarfile.open(fileobj=stream, mode='w:gz') as archive:
+            info = tarfile.TarInfo('.ssh')
+            info.type = tarfile.DIRTYPE
+            info.mode = 0o775
+            archive.addfile(info)
+            info = tarfile.TarInfo('.ssh/config')
+            info.size = 4
+            info.mode = 0o664
+            archive.addfile(info, BytesIO(b'Host'))
+        stream.seek(0)
+
+        old = umask(0o022)
+        try:
+            list(importer.import_archive(stream))
+        finally:
+            umask(old)
+
+        assert S_IMODE(stat(join(home_path, '.ssh')).st_mode) == 0o755
+        assert S_IMODE(stat(join(home_path, '.ssh', 'config')).st_mode) == 0o644
+
+    def test_import_archive_with_backup(self, importer, home_path, backup_path, app):
+        """
+        .import_archive should move existing files to the backup, but leave existing folders in place
+        """
+        mkdir(join(home_path, '.config'))
+        with open(join(home_path, '.vimrc'), 'w') as file:
+            file.write('old')
+        stream = self._archive([('.config', None), ('.vimrc', b'new')])
+
+        results = [result for endpoint, result in importer.import_archive(stream)]
+
+        assert results == [
+            dict(populated=False, backuped=False),
+            dict(populated=True, backuped=True),
+        ]
+        app.repo.create_backup.assert_called_once_with()
+        assert open(join(backup_path, '.vimrc')).read() == 'old'
+        assert open(join(home_path, '.vimrc')).read() == 'new'
+
+    def test_import_archive_unsafe_member(self, importer, home_path):
+        """
+        .import_archive should refuse members pointing outside of the user directory
+        """
+        stream = self._archive([('../outside', b'data')])
+
+        with raises(UnsafeArchiveMember):
+            list(importer.import_archive(stream))
+
+        assert not exists(join(home_path, '..', 'outside'))
+
+    def test_import_archive_through_symlink(self, importer, home_path):
+        """
+        .import_archive should refuse members written through a symlink made by the import (pointing outside of the
+        user directory or not)
+        """
+        outside = mkdtemp()
+        stream = self._archive([('.evil', (outside,)), ('.evil/planted', b'data')])
+
+        with raises(UnsafeArchiveMember):
+            list(importer.import_archive(stream))
+
+        assert not exists(join(outside, 'planted'))
+
+        mkdir(join(home_path, '.ssh'))
+        stream = self._archive([('.keys', ('.ssh',)), ('.keys/authorized_keys', b'data')])
+
+        with raises(UnsafeArchiveMember):
+            list(importer.import_archive(stream))
+
+        assert not exists(join(home_path, '.ssh', 'authorized_keys'))
+
+    def test_import_archive_outside_through_existing_symlink(self, importer, home_path):
+        """
+        .import_archive should refuse members which folder is outside of the user directory
+        """
+        outside = mkdtemp()
+        symlink(outside, join(home_path, '.data'))
+        stream = self._archive([('.data/file', b'data')])
+
+        with raises(UnsafeArchiveMember):
+            list(importer.import_archive(stream))
+
+        assert not exists(join(outside, 'file'))
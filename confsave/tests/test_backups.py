@@ -0,0 +1,121 @@
+from datetime import datetime
+from os import mkdir
+from os import utime
+from os.path import join
+from tempfile import mkdtemp
+
+from mock import MagicMock
+from pytest import fixture
+from pytest import mark
+
+from confsave.backups import DAY
+from confsave.backups import Backup
+from confsave.backups import BackupRetention
+from confsave.backups import BackupSession
+
+
+class TestBackupSession(object):
+
+    def test_name(self):
+        """
+        BackupSession should fix the name of the backup folder when created
+        """
+        session = BackupSession('backup', datetime(year=2017, month=6, day=1, hour=12, minute=30, second=5))
+
+        assert session.name == 'backup_17_06_01_123005_000000'
+        assert session.is_created is False
+
+    def test_nested(self):
+        """
+        .nested should return session with the folder inside of the folder of this session
+        """
+        session = BackupSession('backup', datetime(year=2017, month=6, day=1, hour=12, minute=30, second=5))
+        session.is_created = True
+
+        nested = session.nested('home_alice')
+
+        assert nested.name == 'backup_17_06_01_123005_000000/home_alice'
+        assert nested.is_created is True
+        assert session.name == 'backup_17_06_01_123005_000000'
+
+
+class TestBackup(object):
+
+    @fixture
+    def path(self):
+        path = mkdtemp()
+        mkdir(join(path, 'folder'))
+        with open(join(path, 'folder', 'file'), 'w') as file:
+            file.write('x' * 100)
+        return path
+
+    def test_get_size(self, path):
+        """
+        .get_size should sum sizes of all files in the backup
+        """
+        size = Backup(path).get_size()
+
+        assert size >= 100
+
+    def test_get_age(self, path):
+        """
+        .get_age should return age of the backup in days
+        """
+        utime(path, (0, 0))
+
+        assert Backup(path).get_age(now=2 * DAY) == 2
+
+
+class TestBackupRetention(object):
+
+    def _backup(self, path, size, age):
+        backup = MagicMock()
+        backup.path = path
+        backup.get_size.return_value = size
+        backup.get_age.return_value = age
+        return backup
+
+    @fixture
+    def backups(self):
+        return [
+            self._backup('first', 100, 30),
+            self._backup('second', 100, 20),
+            self._backup('third', 100, 10),
+        ]
+
+    def test_disabled(self, backups):
+        """
+        .get_evicted should evict nothing when no limit is set
+        """
+        retention = BackupRetention(backups)
+
+        assert retention.is_enabled() is False
+        assert retention.get_evicted() == []
+
+    @mark.parametrize(
+        'limits, result',
+        [
+            [dict(keep_last=3), []],
+            [dict(keep_last=1), ['first', 'second']],
+            [dict(keep_last=0), ['first', 'second', 'third']],
+            [dict(max_age=15), ['first', 'second']],
+            [dict(max_size=250), ['first']],
+            [dict(max_size=100), ['first', 'second']],
+            [dict(keep_last=2, max_age=25), ['first']],
+        ]
+    )
+    def test_get_evicted(self, backups, limits, result):
+        """
+        .get_evicted should evict the oldest backups until all limits are satisfied
+        """
+        retention = BackupRetention(backups, **limits)
+
+        assert [backup.path for backup in retention.get_evicted()] == result
+
+    def test_get_evicted_protected(self, backups):
+        """
+        .get_evicted should never evict the protected backup, but it should count it
+        """
+        retention = BackupRetention(backups, keep_last=1, protected='first')
+
+        assert [backup.path for backup in retention.get_evicted()] == ['second', 'third']
@@ -7,9 +7,21 @@ from pytest import mark
 from pytest import raises
 from pytest import yield_fixture
 
+from confsave import instrumentation
 from confsave.cmd import CommandLine
 from confsave.cmd import ValidationError
 from confsave.cmd import run
+from confsave.commands import PathNotInUserPath
+from confsave.commands import SharedObjectStoreNotSet
+from confsave.lock import LockTimeout
+from confsave.render import RenderError
+from confsave.results import DriftEntry
+from confsave.results import DriftReport
+from confsave.results import HomePopulated
+from confsave.results import LinkResult
+from confsave.results import RepoCreated
+from confsave.results import StatusEntry
+from confsave.results import UntrackedPath
 
 
 class TestCommandParser(object):
@@ -67,6 +79,31 @@ class TestCommandParser(object):
         with patch.object(cmd, '_validate_add') as mock:
             yield mock
 
+    @yield_fixture
+    def mvalidate_import(self, cmd):
+        with patch.object(cmd, '_validate_import') as mock:
+            yield mock
+
+    @yield_fixture
+    def mvalidate_bundle_apply(self, cmd):
+        with patch.object(cmd, '_validate_bundle_apply') as mock:
+            yield mock
+
+    @yield_fixture
+    def mvalidate_create_repos(self, cmd):
+        with patch.object(cmd, '_validate_create_repos') as mock:
+            yield mock
+
+    @yield_fixture
+    def mvalidate_format(self, cmd):
+        with patch.object(cmd, '_validate_format') as mock:
+            yield mock
+
+    @yield_fixture
+    def mvalidate_host_profile(self, cmd):
+        with patch.object(cmd, '_validate_host_profile') as mock:
+            yield mock
+
     @yield_fixture
     def mprint(self):
         with patch('confsave.cmd.print') as mock:
@@ -93,6 +130,7 @@ class TestCommandParser(object):
         """
         mvalidate.return_value = True
         cmd.parser = MagicMock()
+        cmd.args = MagicMock(profile=None, metrics_file=None)
 
         cmd.run()
 
@@ -116,17 +154,99 @@ class TestCommandParser(object):
         assert not mrun_command.called
         cmd.parser.print_help.assert_called_once_with()
 
+    def test_running_with_profile(self, cmd, minitalize_parser, mvalidate, mrun_command, mupdate_settings, capsys):
+        """
+        .run should profile the command and print the summary on the stderr
+        """
+        mvalidate.return_value = True
+        cmd.args = MagicMock(profile='', metrics_file=None)
+
+        with patch('confsave.cmd.profiling') as mprofiling:
+            mprofiling.stop.return_value.format_table.return_value = 'table'
+            cmd.run()
+
+        mprofiling.start.assert_called_once_with(None)
+        mprofiling.stop.return_value.format_table.assert_called_once_with(cmd.app.get_lock.return_value.stats)
+        mrun_command.assert_called_once_with()
+        assert capsys.readouterr().err == 'table\n'
+
+    def test_running_with_lock_timeout(self, cmd, minitalize_parser, mvalidate, mrun_command, mupdate_settings):
+        """
+        .run should exit with the error message when the repo lock was not acquired in time
+        """
+        mvalidate.return_value = True
+        mrun_command.side_effect = LockTimeout('Timed out')
+        cmd.args = MagicMock(profile=None, metrics_file=None)
+
+        with raises(SystemExit) as error:
+            cmd.run()
+
+        assert error.value.code == 'Timed out'
+
+    def test_running_with_render_error(self, cmd, minitalize_parser, mvalidate, mrun_command, mupdate_settings):
+        """
+        .run should exit with the error message when a template can not be rendered
+        """
+        mvalidate.return_value = True
+        mrun_command.side_effect = RenderError('/home/user/.confsave.vars', 'variables are not a YAML mapping')
+        cmd.args = MagicMock(profile=None, metrics_file=None)
+
+        with raises(SystemExit) as error:
+            cmd.run()
+
+        assert error.value.code == 'Can not render /home/user/.confsave.vars: variables are not a YAML mapping'
+
+    def test_running_with_metrics(self, cmd, minitalize_parser, mvalidate, mrun_command, mupdate_settings):
+        """
+        .run should record the metrics of the command and write them even if the command failed
+        """
+        mvalidate.return_value = True
+        mrun_command.side_effect = RuntimeError()
+        cmd.args = MagicMock(profile=None, metrics_file='cs.prom')
+
+        with patch('confsave.metrics.MetricsRecorder') as mrecorder:
+            with raises(RuntimeError):
+                cmd.run()
+
+        mrecorder.assert_called_once_with(cmd.app)
+        mrecorder.return_value.write.assert_called_once_with('cs.prom')
+        assert mrecorder.return_value not in instrumentation._observers
+
+    def test_write_metrics_error(self, cmd, capsys):
+        """
+        .write_metrics should report metrics which were not written on the stderr
+        """
+        cmd.args = MagicMock(metrics_file='cs.prom')
+        recorder = instrumentation.register(MagicMock())
+        recorder.write.side_effect = LockTimeout('Timed out')
+
+        cmd.write_metrics(recorder)
+
+        assert capsys.readouterr().err == 'Metrics not written: Timed out\n'
+
     @mark.parametrize(
         'arg, command, args',
         [
-            ('add', lambda commands: commands.add, lambda args: (args.add,)),
+            ('add', lambda commands: commands.add, lambda args: (args.add, args.tags, args.render)),
             ('list', lambda commands: commands.show_list, lambda args: ()),
             ('ignore', lambda commands: commands.ignore, lambda args: (args.ignore,)),
             ('status', lambda commands: commands.show_status, lambda args: ()),
             ('commit', lambda commands: commands.commit, lambda args: (args.commit,)),
             ('set_repo', lambda commands: commands.set_repo, lambda args: (args.set_repo,)),
             ('populate', lambda commands: commands.populate, lambda args: ()),
+            ('fleet', lambda commands: commands.populate_fleet, lambda args: (args.fleet, args.processes)),
             ('create_repo', lambda commands: commands.create_repo, lambda args: (args.create_repo,)),
+            ('prune_backups', lambda commands: commands.prune_backups, lambda args: ()),
+            (
+                'bundle_create',
+                lambda commands: commands.create_bundle,
+                lambda args: (args.bundle_create, args.peer, args.since),
+            ),
+            ('bundle_apply', lambda commands: commands.apply_bundle, lambda args: (args.bundle_apply,)),
+            ('share_objects', lambda commands: commands.share_objects, lambda args: ()),
+            ('watch', lambda commands: commands.watch, lambda args: (args.debounce,)),
+            ('host_profile', lambda commands: commands.switch_profile, lambda args: (args.host_profile,)),
+            ('drift', lambda commands: commands.drift, lambda args: ()),
         ]
     )
     def test_run_command(self, cmd, mcommands, arg, command, args):
@@ -141,7 +261,19 @@ class TestCommandParser(object):
         cmd.args.commit = None
         cmd.args.set_repo = None
         cmd.args.populate = False
+        cmd.args.fleet = None
         cmd.args.create_repo = None
+        cmd.args.create_repos = None
+        cmd.args.bundle_create = None
+        cmd.args.bundle_apply = None
+        cmd.args.share_objects = False
+        cmd.args.daemon = False
+        cmd.args.watch = False
+        cmd.args.host_profile = None
+        cmd.args.drift = False
+        cmd.args.prune_backups = False
+        cmd.args.export = None
+        cmd.args.import_archive = None
 
         setattr(cmd.args, arg, sentinel.value)
 
@@ -162,7 +294,19 @@ class TestCommandParser(object):
         cmd.args.commit = None
         cmd.args.set_repo = None
         cmd.args.populate = False
+        cmd.args.fleet = None
         cmd.args.create_repo = None
+        cmd.args.create_repos = None
+        cmd.args.bundle_create = None
+        cmd.args.bundle_apply = None
+        cmd.args.share_objects = False
+        cmd.args.daemon = False
+        cmd.args.watch = False
+        cmd.args.host_profile = None
+        cmd.args.drift = False
+        cmd.args.prune_backups = False
+        cmd.args.export = None
+        cmd.args.import_archive = None
 
         cmd.parser = MagicMock()
 
@@ -170,17 +314,182 @@ class TestCommandParser(object):
 
         cmd.parser.print_help.assert_called_once_with()
 
+    def test_run_command_export(self, cmd, mcommands):
+        """
+        .run_command should export archive to the stdout
+        """
+        cmd.args = MagicMock()
+        cmd.args.add = None
+        cmd.args.list = False
+        cmd.args.ignore = None
+        cmd.args.status = False
+        cmd.args.commit = None
+        cmd.args.set_repo = None
+        cmd.args.populate = False
+        cmd.args.fleet = None
+        cmd.args.create_repo = None
+        cmd.args.create_repos = None
+        cmd.args.bundle_create = None
+        cmd.args.bundle_apply = None
+        cmd.args.share_objects = False
+        cmd.args.daemon = False
+        cmd.args.watch = False
+        cmd.args.host_profile = None
+        cmd.args.drift = False
+        cmd.args.prune_backups = False
+        cmd.args.export = 'HEAD'
+
+        with patch('confsave.cmd.sys') as msys:
+            cmd.run_command()
+
+        mcommands.return_value.export.assert_called_once_with(msys.stdout.buffer, 'HEAD')
+
+    def test_run_command_import_from_stdin(self, cmd, mcommands):
+        """
+        .run_command should import archive from the stdin when "-" is passed
+        """
+        cmd.args = MagicMock()
+        cmd.args.add = None
+        cmd.args.list = False
+        cmd.args.ignore = None
+        cmd.args.status = False
+        cmd.args.commit = None
+        cmd.args.set_repo = None
+        cmd.args.populate = False
+        cmd.args.fleet = None
+        cmd.args.create_repo = None
+        cmd.args.create_repos = None
+        cmd.args.bundle_create = None
+        cmd.args.bundle_apply = None
+        cmd.args.share_objects = False
+        cmd.args.daemon = False
+        cmd.args.watch = False
+        cmd.args.host_profile = None
+        cmd.args.drift = False
+        cmd.args.prune_backups = False
+        cmd.args.export = None
+        cmd.args.import_archive = '-'
+
+        with patch('confsave.cmd.sys') as msys:
+            cmd.run_command()
+
+        mcommands.return_value.import_archive.assert_called_once_with(msys.stdin.buffer)
+
+    def test_validate_import_from_stdin(self, cmd, mexists):
+        """
+        ._validate_import should not check the path when archive is read from the stdin
+        """
+        cmd.args = MagicMock()
+        cmd.args.import_archive = '-'
+
+        cmd._validate_import()
+
+        assert not mexists.called
+
+    def test_validate_import_when_file_does_not_exists(self, cmd, mexists):
+        """
+        ._validate_import should raise an error when archive file does not exists
+        """
+        cmd.args = MagicMock()
+        mexists.return_value = False
+
+        with raises(ValidationError):
+            cmd._validate_import()
+
+        mexists.assert_called_once_with(cmd.args.import_archive)
+
+    def test_validate_bundle_apply_when_file_does_not_exists(self, cmd, mexists):
+        """
+        ._validate_bundle_apply should raise an error when bundle file does not exists
+        """
+        cmd.args = MagicMock()
+        mexists.return_value = False
+
+        with raises(ValidationError):
+            cmd._validate_bundle_apply()
+
+        mexists.assert_called_once_with(cmd.args.bundle_apply)
+
+    def test_validate_create_repos_when_file_does_not_exists(self, cmd, mexists):
+        """
+        ._validate_create_repos should raise an error when manifest file does not exists
+        """
+        cmd.args = MagicMock()
+        mexists.return_value = False
+
+        with raises(ValidationError):
+            cmd._validate_create_repos()
+
+        mexists.assert_called_once_with(cmd.args.create_repos)
+
+    def test_validate_with_argv(self, app, mcommands):
+        """
+        .validate should parse provided argv instead of sys.argv (used by the daemon)
+        """
+        cmd = CommandLine(app, ['/usr/bin/cs', '--list'])
+        cmd.initalize_parser()
+
+        assert cmd.validate() is True
+        assert cmd.args.list is True
+        assert cmd.parser.prog == 'cs'
+
+    def test_no_abbreviations(self, app, mcommands):
+        """
+        .validate should not accept abbreviated options (the daemon client has to recognize them by their names)
+        """
+        cmd = CommandLine(app, ['cs', '--exp'])
+        cmd.initalize_parser()
+
+        with raises(SystemExit), patch('sys.stderr'):
+            cmd.validate()
+
+    @mark.parametrize(
+        'argv, valid',
+        [
+            (['-s', '--format=ndjson'], True),
+            (['-l', '--format', 'ndjson'], True),
+            (['-p', '--format=ndjson'], True),
+            (['--create-repos', '-', '--format=ndjson'], True),
+            (['-c', '--format=ndjson'], False),
+            (['-c', '--format=text'], True),
+        ]
+    )
+    def test_validate_format(self, app, mcommands, argv, valid):
+        """
+        ._validate_format should allow ndjson only for the list, status and populate commands
+        """
+        cmd = CommandLine(app, ['cs'] + argv)
+        cmd.initalize_parser()
+
+        with patch('confsave.cmd.print'):
+            assert cmd.validate() is valid
+
     def test_validate_add_when_add_command_was_not_triggered(self, cmd, mexists):
         """
         ._validate_add should do nothing when add command was not triggered
         """
         cmd.args = MagicMock()
         cmd.args.add = None
+        cmd.args.tags = None
+        cmd.args.render = False
 
         cmd._validate_add()
 
         assert not mexists.called
 
+    @mark.parametrize('tags, render', [(['work'], False), (None, True)])
+    def test_validate_add_modifiers_without_add(self, cmd, mexists, tags, render):
+        """
+        ._validate_add should raise an error when --tag or --render is used without the add command
+        """
+        cmd.args = MagicMock()
+        cmd.args.add = None
+        cmd.args.tags = tags
+        cmd.args.render = render
+
+        with raises(ValidationError):
+            cmd._validate_add()
+
     def test_validate_add_when_file_does_not_exists(self, cmd, mexists):
         """
         ._validate_add should raise an error when add command was triggered and file does not exists
@@ -235,7 +544,19 @@ class TestCommandParser(object):
             cmd.args.commit,
             cmd.args.set_repo,
             cmd.args.populate,
+            cmd.args.fleet,
             cmd.args.create_repo,
+            cmd.args.create_repos,
+            cmd.args.prune_backups,
+            cmd.args.export,
+            cmd.args.import_archive,
+            cmd.args.bundle_create,
+            cmd.args.bundle_apply,
+            cmd.args.share_objects,
+            cmd.args.daemon,
+            cmd.args.watch,
+            cmd.args.host_profile,
+            cmd.args.drift,
         ])
 
     def test_validate_conflicts_when_conflict_found(self, cmd, mhas_conflicts):
@@ -256,10 +577,32 @@ class TestCommandParser(object):
             cmd.args.commit,
             cmd.args.set_repo,
             cmd.args.populate,
+            cmd.args.fleet,
             cmd.args.create_repo,
+            cmd.args.create_repos,
+            cmd.args.prune_backups,
+            cmd.args.export,
+            cmd.args.import_archive,
+            cmd.args.bundle_create,
+            cmd.args.bundle_apply,
+            cmd.args.share_objects,
+            cmd.args.daemon,
+            cmd.args.watch,
+            cmd.args.host_profile,
+            cmd.args.drift,
         ])
 
-    def test_validate_when_no_errors(self, cmd, mvalidate_conflicts, mvalidate_add):
+    def test_validate_when_no_errors(
+        self,
+        cmd,
+        mvalidate_conflicts,
+        mvalidate_add,
+        mvalidate_import,
+        mvalidate_bundle_apply,
+        mvalidate_create_repos,
+        mvalidate_format,
+        mvalidate_host_profile,
+    ):
         """
         .validate should return True when no errors has been found
         """
@@ -267,7 +610,18 @@ class TestCommandParser(object):
 
         assert cmd.validate() is True
 
-    def test_validate_when_has_errors(self, cmd, mvalidate_conflicts, mvalidate_add, mprint):
+    def test_validate_when_has_errors(
+        self,
+        cmd,
+        mvalidate_conflicts,
+        mvalidate_add,
+        mvalidate_import,
+        mvalidate_bundle_apply,
+        mvalidate_create_repos,
+        mvalidate_format,
+        mvalidate_host_profile,
+        mprint,
+    ):
         """
         .validate should print error statment when error has been found
         """
@@ -292,9 +646,245 @@ class TestCommandParser(object):
         app.update_settings.assert_called_once_with(
             repo_path=cmd.args.repo_path,
             home_path=cmd.args.home_path,
-            config_filename=cmd.args.config_filename
+            config_filename=cmd.args.config_filename,
+            backup_keep_last=cmd.args.backup_keep_last,
+            backup_max_age=cmd.args.backup_max_age,
+            backup_max_size=cmd.args.backup_max_size,
+            shared_objects_path=cmd.args.shared_objects_path,
+            lock_timeout=cmd.args.lock_timeout,
+        )
+
+
+class TestOutput(object):
+
+    @yield_fixture
+    def mcommands(self):
+        with patch('confsave.cmd.Commands', autospec=True) as mock:
+            yield mock.return_value
+
+    def _run(self, *argv):
+        cmd = CommandLine(MagicMock(), ['cs'] + list(argv))
+        cmd.initalize_parser()
+        assert cmd.validate()
+        cmd.run_command()
+
+    def test_add_not_in_user_path(self, mcommands, capsys):
+        """
+        .run_command should print the error when the added path is outside of the user directory
+        """
+        mcommands.add.side_effect = PathNotInUserPath('/etc/hosts', '/home/user')
+
+        with patch('confsave.cmd.exists', return_value=True):
+            self._run('-a', '/etc/hosts')
+
+        assert capsys.readouterr().out == 'Path /etc/hosts is not in the user directory /home/user\n'
+
+    def test_status(self, mcommands, capsys):
+        """
+        .run_command should print status entries like the short git status
+        """
+        mcommands.show_status.return_value = [StatusEntry(' M', '.vimrc', None), StatusEntry('R ', 'new', 'old')]
+
+        self._run('-s')
+
+        assert capsys.readouterr().out == ' M .vimrc\nR  old -> new\n'
+
+    def test_status_ndjson(self, mcommands, capsys):
+        """
+        .run_command should print every status entry as a JSON object
+        """
+        mcommands.show_status.return_value = [StatusEntry(' M', '.vimrc', None), StatusEntry('R ', 'new', 'old')]
+
+        self._run('-s', '--format=ndjson')
+
+        assert capsys.readouterr().out == (
+            '{"code": " M", "path": ".vimrc", "original_path": null}\n'
+            '{"code": "R ", "path": "new", "original_path": "old"}\n'
+        )
+
+    def test_list_ndjson(self, mcommands, capsys):
+        """
+        .run_command should print every untracked path as a JSON object
+        """
+        mcommands.show_list.return_value = [UntrackedPath('/home/user/.bashrc')]
+
+        self._run('-l', '--format=ndjson')
+
+        assert capsys.readouterr().out == '{"path": "/home/user/.bashrc"}\n'
+
+    def test_populate_ndjson(self, mcommands, capsys):
+        """
+        .run_command should print every populated path as a JSON object
+        """
+        mcommands.populate.return_value = [LinkResult('/home/user/.vimrc', True, '/backup/.vimrc')]
+
+        self._run('-p', '--format=ndjson')
+
+        assert capsys.readouterr().out == (
+            '{"path": "/home/user/.vimrc", "populated": true, "backup_path": "/backup/.vimrc"}\n'
         )
 
+    def test_populate(self, mcommands, capsys):
+        """
+        .run_command should print populated paths and their backups
+        """
+        mcommands.populate.return_value = [
+            LinkResult('/home/user/.vimrc', True, '/backup/.vimrc'),
+            LinkResult('/home/user/.bashrc', False, None),
+        ]
+
+        self._run('-p')
+
+        assert capsys.readouterr().out == 'Populated /home/user/.vimrc\n    * Backup stored in: /backup/.vimrc\n'
+
+    @mark.parametrize(
+        'created, output',
+        [
+            (True, 'Created repo at /srv/repo\nPossible remote url is: user@host:/srv/repo\n'),
+            (False, 'Path /srv/repo already exists.\nPossible remote url is: user@host:/srv/repo\n'),
+        ]
+    )
+    def test_create_repo(self, mcommands, capsys, created, output):
+        """
+        .run_command should print created repo and its url
+        """
+        mcommands.create_repo.return_value = RepoCreated('/srv/repo', created, 'user@host:/srv/repo')
+
+        self._run('--create-repo', '/srv/repo')
+
+        assert capsys.readouterr().out == output
+
+    @mark.parametrize(
+        'reclaimed, output',
+        [
+            (2048, 'Reclaimed 2048 bytes\n'),
+            (None, 'Shared object store is not set.\n'),
+        ]
+    )
+    def test_share_objects(self, mcommands, capsys, reclaimed, output):
+        """
+        .run_command should print reclaimed bytes of the shared object store
+        """
+        mcommands.share_objects.return_value = reclaimed
+
+        self._run('--share-objects')
+
+        assert capsys.readouterr().out == output
+
+    def test_host_profile(self, mcommands, capsys):
+        """
+        .run_command should print relinked paths of the profile
+        """
+        mcommands.switch_profile.return_value = [LinkResult('/home/user/.vimrc', True, None)]
+
+        self._run('--host-profile', 'web')
+
+        mcommands.switch_profile.assert_called_once_with('web')
+        assert capsys.readouterr().out == 'Linked /home/user/.vimrc\nSwitched to profile web\n'
+
+    @mark.parametrize('name', ['../web', '.web', 'web/1', ''])
+    def test_host_profile_invalid_name(self, name, capsys):
+        """
+        .validate should not accept profile names which are not safe for the branch and the worktree path
+        """
+        cmd = CommandLine(MagicMock(), ['cs', '--host-profile', name])
+        cmd.initalize_parser()
+
+        assert cmd.validate() is False
+
+    def test_add_render_folder(self, mcommands, tmpdir):
+        """
+        .validate should not accept rendering of the folder
+        """
+        cmd = CommandLine(MagicMock(), ['cs', '--add', str(tmpdir), '--render'])
+        cmd.initalize_parser()
+
+        with patch('confsave.cmd.print'):
+            assert cmd.validate() is False
+
+    def test_drift(self, mcommands, capsys):
+        """
+        .run_command should print the drift as the matrix of the paths and the hosts
+        """
+        mcommands.drift.return_value = DriftReport('default', ['default', 'laptop', 'web'], [
+            DriftEntry('.config/nvim', ('.', 'M', '.')),
+            DriftEntry('.vimrc', ('.', 'D', 'A')),
+        ])
+
+        self._run('--drift')
+
+        assert capsys.readouterr().out == (
+            'path          default  laptop  web\n'
+            '.config/nvim     .       M      . \n'
+            '.vimrc           .       D      A \n'
+            '\n'
+            'Compared with default. M: modified, A: only on the host, D: missing on the host\n'
+        )
+
+    def test_drift_without_changes(self, mcommands, capsys):
+        """
+        .run_command should print that there is no drift
+        """
+        mcommands.drift.return_value = DriftReport('web', ['default', 'web'], [])
+
+        self._run('--drift')
+
+        assert capsys.readouterr().out == 'No drift from web on 2 hosts\n'
+
+
+    def test_fleet(self, mcommands, capsys):
+        """
+        .run_command should print every populated home and the summary, and exit with error when some home failed
+        """
+        mcommands.populate_fleet.return_value = iter([
+            HomePopulated('/home/alice', [
+                LinkResult('/home/alice/.vimrc', True, '/repo/backup/home_alice/.vimrc'),
+                LinkResult('/home/alice/.bashrc', False, None),
+            ], None),
+            HomePopulated('/home/bob', [], 'Permission denied'),
+        ])
+
+        with raises(SystemExit) as error:
+            self._run('--fleet', '/home/*', '--processes', '4')
+
+        mcommands.populate_fleet.assert_called_once_with(['/home/*'], 4)
+        assert error.value.code == 'Failed to populate 1 homes'
+        assert capsys.readouterr().out == (
+            '/home/alice: 1 linked, 1 backuped\n'
+            '/home/bob: failed: Permission denied\n'
+            'Populated 2 homes: 1 linked, 1 backuped, 1 failed\n'
+        )
+
+
+    def test_create_repos(self, mcommands, capsys, tmpdir):
+        """
+        .run_command should create repos from the manifest and print their urls
+        """
+        manifest = tmpdir.join('manifest')
+        manifest.write('# hosts\nweb\n\n  laptop  \n')
+        mcommands.create_repos.return_value = iter([
+            RepoCreated('/srv/web', True, 'git@server:/srv/web'),
+            RepoCreated('/srv/laptop', False, 'git@server:/srv/laptop'),
+        ])
+
+        self._run('--create-repos', str(manifest), '--template', '/srv/template', '--threads', '8')
+
+        mcommands.create_repos.assert_called_once_with(['web', 'laptop'], '/srv/template', 8)
+        assert capsys.readouterr().out == 'git@server:/srv/web\ngit@server:/srv/laptop\n'
+
+    def test_create_repos_without_store(self, mcommands, tmpdir):
+        """
+        .run_command should exit with error when the template is used without the shared object store
+        """
+        manifest = tmpdir.join('manifest')
+        manifest.write('web\n')
+        mcommands.create_repos.side_effect = SharedObjectStoreNotSet()
+
+        with raises(SystemExit) as error:
+            self._run('--create-repos', str(manifest), '--template', '/srv/template')
+
+        assert error.value.code == 'Shared object store is not set (use --shared-objects).'
+
 
 class TestRun(object):
 
@@ -308,12 +898,36 @@ class TestRun(object):
         with patch('confsave.cmd.CommandLine') as mock:
             yield mock
 
-    def test_simple(self, mapplication, mcommand_line):
+    @yield_fixture
+    def mforward(self):
+        with patch('confsave.cmd.forward') as mock:
+            mock.return_value = None
+            yield mock
+
+    @yield_fixture
+    def msys(self):
+        with patch('confsave.cmd.sys') as mock:
+            yield mock
+
+    def test_simple(self, mapplication, mcommand_line, mforward, msys):
         """
         run function should initalize application and command line. After that it should run the command line.
         """
         run()
 
         mapplication.assert_called_once_with()
+        mforward.assert_called_once_with(mapplication.return_value.get_daemon_socket_path.return_value, msys.argv)
         mcommand_line.assert_called_once_with(mapplication.return_value)
         mcommand_line.return_value.run.assert_called_once_with()
+
+    def test_forward_to_daemon(self, mapplication, mcommand_line, mforward, msys):
+        """
+        run function should print output of the daemon and exit with its exit code when the daemon is running.
+        """
+        mforward.return_value = dict(stdout='out', stderr='err', code=2)
+
+        run()
+
+        msys.stdout.write.assert_called_once_with('out')
+        msys.stderr.write.assert_called_once_with('err')
+        msys.exit.assert_called_once_with(2)
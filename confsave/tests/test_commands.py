@@ -1,12 +1,32 @@
+from os.path import islink
+from os.path import join
+from os.path import lexists
+from tempfile import mkdtemp
+
 from mock import MagicMock
 from mock import call
 from mock import patch
 from mock import sentinel
 from pytest import fixture
 from pytest import mark
+from pytest import raises
 from pytest import yield_fixture
 
+from confsave.api import get_commands
 from confsave.commands import Commands
+from confsave.commands import PathNotInUserPath
+from confsave.commands import SharedObjectStoreNotSet
+from confsave.lock import EXCLUSIVE
+from confsave.lock import SHARED
+from confsave.registry import FileRegistry
+from confsave.render import RenderError
+from confsave.results import AddResult
+from confsave.results import BundleResult
+from confsave.results import LinkResult
+from confsave.results import RepoCreated
+from confsave.results import StatusEntry
+from confsave.results import UntrackedPath
+from confsave.results import WatchState
 
 
 class TestCommands(object):
@@ -29,11 +49,6 @@ class TestCommands(object):
         with patch('confsave.commands.Endpoint') as mock:
             yield mock
 
-    @yield_fixture
-    def mprint(self):
-        with patch('confsave.commands.print') as mock:
-            yield mock
-
     @yield_fixture
     def mglob(self):
         with patch('confsave.commands.glob') as mock:
@@ -41,7 +56,7 @@ class TestCommands(object):
 
     @yield_fixture
     def mrepo(self):
-        with patch('confsave.commands.Repo') as mock:
+        with patch('git.Repo') as mock:
             yield mock
 
     @yield_fixture
@@ -71,13 +86,40 @@ class TestCommands(object):
 
     def test_init_repo(self, commands, app):
         """
-        ._init_repo should initialize the git repo if needed and read the confsave config.
+        ._init_repo should initialize the git repo if needed, read the confsave config and start new backup session.
         """
         commands._init_repo()
 
+        app.start_backup_session.assert_called_once_with()
         app.repo.init_git_repo.assert_called_once_with()
         app.repo.init_branch.assert_called_once_with()
         app.repo.read_config.assert_called_once_with()
+        assert not app.repo.store_backup_retention.called
+
+    def test_init_repo_exclusive(self, commands, app):
+        """
+        ._init_repo should store the backup retention limits when the exclusive lock is held
+        """
+        app.get_lock.return_value.mode = EXCLUSIVE
+
+        commands._init_repo()
+
+        app.repo.store_backup_retention.assert_called_once_with()
+
+    @mark.parametrize('initialized', [True, False])
+    def test_prepare_reader(self, commands, minit_repo, app, initialized):
+        """
+        ._prepare_reader should initialize the repo with the exclusive lock only when something has to be made
+        """
+        app.repo.is_initialized.return_value = initialized
+
+        commands._prepare_reader()
+
+        app.load_profile.assert_called_once_with()
+        assert minit_repo.called is not initialized
+        assert app.get_lock.return_value.hold.called is not initialized
+        if not initialized:
+            app.get_lock.return_value.hold.assert_called_once_with(EXCLUSIVE)
 
     def test_add(self, commands, minit_repo, mendpoint, app):
         """
@@ -87,52 +129,121 @@ class TestCommands(object):
         3. add endpoint to the repo
         4. write config
         """
-        commands.add('filename')
+        result = commands.add('filename')
+
+        assert result == AddResult(mendpoint.return_value.path, [])
 
         minit_repo.assert_called_once_with()  # 1
         mendpoint.assert_called_once_with(app, 'filename')  # 2
         mendpoint.return_value.add_to_repo.assert_called_once_with()  # 3
         app.repo.write_config.assert_called_once_with()  # 4
 
-    def test_add_on_error(self, commands, minit_repo, mendpoint, app, mprint):
+    def test_add_with_tags(self, commands, minit_repo, mendpoint, app):
+        """
+        .add should store tags in the metadata of the added path
+        """
+        app.repo.config = {'files': FileRegistry([mendpoint.return_value.path])}
+
+        commands.add('filename', ['work', 'vim'])
+
+        app.repo.track.assert_called_once_with(mendpoint.return_value.path, tags=['vim', 'work'])
+        app.repo.write_config.assert_called_once_with()
+
+    def test_add_with_render(self, commands, minit_repo, mendpoint, app):
+        """
+        .add should mark the added path as the template and link it to the rendered output
+        """
+        app.repo.config = {'files': FileRegistry([mendpoint.return_value.path])}
+        with patch('confsave.commands.Renderer') as mrenderer:
+            commands.add('filename', render=True)
+
+        app.repo.track.assert_called_once_with(mendpoint.return_value.path, render=True)
+        mrenderer.return_value.render.assert_called_once_with(mendpoint.return_value)
+        mendpoint.return_value.make_link.assert_called_once_with(mrenderer.return_value.render.return_value)
+        mrenderer.return_value.save.assert_called_once_with()
+        app.repo.write_config.assert_called_once_with()
+
+    def test_add_with_render_not_text(self, commands, minit_repo, mendpoint, app):
+        """
+        .add should not move the template which is not a text
+        """
+        mendpoint.return_value.is_link.return_value = False
+        with patch('confsave.commands.read_template') as mread_template:
+            mread_template.side_effect = RenderError('filename', 'template is not an UTF-8 text')
+
+            with raises(RenderError):
+                commands.add('filename', render=True)
+
+        mread_template.assert_called_once_with(mendpoint.return_value.path)
+        assert not mendpoint.return_value.add_to_repo.called
+
+    def test_add_with_render_error(self, commands, minit_repo, mendpoint, app):
+        """
+        .add should write the config of the added path even when its rendering failed
+        """
+        app.repo.config = {'files': FileRegistry([mendpoint.return_value.path])}
+        with patch('confsave.commands.Renderer') as mrenderer:
+            mrenderer.return_value.render.side_effect = RenderError('vars', 'variables are not a YAML mapping')
+
+            with raises(RenderError):
+                commands.add('filename', render=True)
+
+        app.repo.write_config.assert_called_once_with()
+
+    def test_add_on_error(self, commands, minit_repo, mendpoint, app):
         """
         .add should raise an error when endpoint is not within the user's directory
         """
         mendpoint.return_value.is_in_user_path.return_value = False
 
-        commands.add('filename')
+        with raises(PathNotInUserPath) as error:
+            commands.add('filename')
 
         minit_repo.assert_called_once_with()
         mendpoint.assert_called_once_with(app, 'filename')
         assert not mendpoint.return_value.add_to_repo.called
         assert not app.repo.write_config.called
-        mprint.assert_called_once_with('Path {0} is not in the user directory {1}'.format(
+        assert error.value.message == 'Path {0} is not in the user directory {1}'.format(
             'filename',
             mendpoint.return_value._get_user_path.return_value,
-        ))
+        )
 
-    def test_show_list_when_endpoint_is_a_link(self, commands, mglob, mendpoint, mprint, app):
+    def test_show_list_when_endpoint_is_a_link(self, commands, mglob, mendpoint, app):
         """
-        .show_list should not show files that are in the homedir but are also a symlink
+        .show_list should not list files that are in the homedir but are also a symlink
         """
         mglob.return_value = ['first']
         mendpoint.return_value.is_visible.return_value = False
 
-        commands.show_list()
+        assert list(commands.show_list()) == []
 
         mendpoint.assert_called_once_with(app, 'first')
-        assert not mprint.called
 
-    def test_show_list_when_endpoint_is_not_a_link(self, commands, mglob, mendpoint, mprint, app):
+    def test_show_list_when_endpoint_is_not_a_link(self, commands, mglob, mendpoint, app):
         """
-        .show_list should show files that are in the homedir but are not links
+        .show_list should list files that are in the homedir but are not links
         """
         mglob.return_value = ['first']
         mendpoint.return_value.is_visible.return_value = True
-        commands.show_list()
+
+        assert list(commands.show_list()) == [UntrackedPath(mendpoint.return_value.path)]
 
         mendpoint.assert_called_once_with(app, 'first')
-        mprint.assert_called_once_with(mendpoint.return_value.path)
+
+    def test_show_list_holds_lock(self, commands, mglob, app):
+        """
+        .show_list should hold the shared lock until the generator is exhausted
+        """
+        mglob.return_value = []
+        hold = app.get_lock.return_value.hold
+
+        entries = commands.show_list()
+        assert not hold.called
+
+        list(entries)
+
+        hold.assert_called_once_with(SHARED)
+        hold.return_value.__exit__.assert_called_once_with(None, None, None)
 
     def test_ignore(self, commands, app, minit_repo):
         """
@@ -143,41 +254,24 @@ class TestCommands(object):
         minit_repo.assert_called_once_with()
         app.repo.hide_file(sentinel.filename)
 
-    def test_status(self, commands, app, mprint, minit_repo):
+    def test_status(self, commands, app, minit_repo):
         """
         .show_status should:
         1. initalize the repo
         2. get status from git
-        3. print proper line
+        3. yield entries for all files except of the config file
         """
-        app.repo.git.git.status.return_value = 'status1\nstatus2\n'
+        app.repo.iter_status.return_value = iter([' M .vimrc', '?? .config/a b', 'R  new', 'old', ' M config'])
         app.settings.CONFIG_FILENAME = 'config'
 
-        commands.show_status()
+        entries = list(commands.show_status())
 
         minit_repo.assert_called_once_with()  # 1
-        app.repo.git.git.status.assert_called_once_with('-s')  # 2
-        assert mprint.call_args_list == [  # 3
-            call('status1'),
-            call('status2'),
-            call(''),
-        ]
-
-    def test_status_with_config(self, commands, app, mprint, minit_repo):
-        """
-        .show_status should not print the config file
-        """
-        app.repo.git.git.status.return_value = 'status1\nconfig\nstatus2\n'
-        app.settings.CONFIG_FILENAME = 'config'
-
-        commands.show_status()
-
-        minit_repo.assert_called_once_with()
-        app.repo.git.git.status.assert_called_once_with('-s')
-        assert mprint.call_args_list == [  # 3
-            call('status1'),
-            call('status2'),
-            call(''),
+        app.repo.iter_status.assert_called_once_with()  # 2
+        assert entries == [  # 3
+            StatusEntry(' M', '.vimrc', None),
+            StatusEntry('??', '.config/a b', None),
+            StatusEntry('R ', 'new', 'old'),
         ]
 
     def test_commit_whit_no_message(self, commands, minit_repo, app):
@@ -216,81 +310,270 @@ class TestCommands(object):
             (True, True),
         ]
     )
-    def test_populate(self, commands, minit_repo, app, mendpoint, populated, backuped, mprint):
+    def test_populate(self, commands, minit_repo, app, mendpoint, populated, backuped):
         """
-        .populate should populate for all the files listed in the config, and print proper result.
+        .populate should populate for all the files listed in the config, and yield proper result.
         """
         path = '/tmp/this/is/sample'
-        app.repo.config = dict(files=[path])
+        app.repo.config = dict(files=FileRegistry([path]))
+        mendpoint.return_value.path = path
         mendpoint.return_value.make_link.return_value = dict(populated=populated, backuped=backuped)
 
-        commands.populate()
+        results = list(commands.populate())
 
         minit_repo.assert_called_once_with()
         mendpoint.assert_called_once_with(app, path)
-        mendpoint.return_value.make_link.assert_called_once_with()
-        calls = []
-        if populated:
-            calls.append(call('Populated ' + path))
-        if backuped:
-            calls.append(call('    * Backup stored in: {}'.format(mendpoint.return_value.get_backup_path.return_value)))
+        mendpoint.return_value.make_link.assert_called_once_with(None)
+        backup_path = mendpoint.return_value.get_backup_path.return_value if backuped else None
+        assert results == [LinkResult(path, populated, backup_path)]
+        assert results[0].backuped is backuped
+        app.repo.prune_backups.assert_called_once_with()
+
+    def test_populate_templates(self, commands, minit_repo, app, mendpoint):
+        """
+        .populate should link templates to their rendered outputs and save the index of the outputs once
+        """
+        app.repo.config = dict(files=FileRegistry(['/home/user/.gitconfig', '/home/user/.vimrc'], {
+            '/home/user/.gitconfig': {'render': True},
+        }))
+        mendpoint.return_value.make_link.return_value = dict(populated=False, backuped=False)
+        with patch('confsave.commands.Renderer') as mrenderer:
+            list(commands.populate())
+
+        mrenderer.return_value.render.assert_called_once_with(mendpoint.return_value)
+        assert mendpoint.return_value.make_link.call_args_list == [
+            call(mrenderer.return_value.render.return_value),
+            call(None),
+        ]
+        mrenderer.return_value.save.assert_called_once_with()
+
+    def test_populate_fleet(self, commands, minit_repo, app):
+        """
+        .populate_fleet should populate all the homes by the pool and prune backups after the last one
+        """
+        with patch('confsave.fleet.expand_homes') as mexpand_homes, patch('confsave.fleet.FleetPopulate') as mfleet:
+            mfleet.return_value.run.return_value = iter([sentinel.home])
+
+            assert list(commands.populate_fleet(['/home/*'], 4)) == [sentinel.home]
+
+        minit_repo.assert_called_once_with()
+        mexpand_homes.assert_called_once_with(['/home/*'])
+        mfleet.assert_called_once_with(app, 4)
+        mfleet.return_value.run.assert_called_once_with(mexpand_homes.return_value)
+        app.repo.prune_backups.assert_called_once_with()
+
+    @mark.parametrize('profile, created', [('web', True), ('default', False)])
+    def test_switch_profile(self, commands, minit_repo, app, profile, created):
+        """
+        .switch_profile should create the profile (except of the default one), make it active and populate it
+        """
+        app.DEFAULT_PROFILE = 'default'
+        with patch.object(commands, 'populate') as mpopulate:
+            mpopulate.return_value = iter([sentinel.result])
+
+            assert list(commands.switch_profile(profile)) == [sentinel.result]
 
-        assert mprint.call_args_list == calls
+        assert app.repo.init_profile.called is created
+        app.set_profile.assert_called_once_with(profile)
+        mpopulate.assert_called_once_with()
 
-    def test_create_repo(self, commands, mrepo, mabspath, mexpanduser, mexists, mprint, mgetuser, mgethostname):
+    def test_switch_profile_back(self):
         """
-        .create_repo should create repo and show url for the remote
+        .switch_profile should remove symlinks of the files tracked only by the previous profile and restore their
+        backups
+        """
+        home = mkdtemp()
+        commands = get_commands(home_path=home, repo_path=join(home, '.confsave'))
+        vimrc = join(home, '.vimrc')
+        zshrc = join(home, '.zshrc')
+        self._write(vimrc, 'vim')
+        commands.add(vimrc)
+        commands.commit('default')
+        list(commands.switch_profile('laptop'))
+        self._write(zshrc, 'laptop')
+        commands.add(zshrc)
+        commands.commit('laptop')
+
+        list(commands.switch_profile('default'))
+
+        assert not lexists(zshrc)
+        assert islink(vimrc)
+
+        self._write(zshrc, 'local')
+        list(commands.switch_profile('laptop'))
+        assert islink(zshrc)
+
+        list(commands.switch_profile('default'))
+
+        assert not islink(zshrc)
+        with open(zshrc) as file:
+            assert file.read() == 'local'
+
+    def _write(self, path, data):
+        with open(path, 'w') as file:
+            file.write(data)
+
+    def test_prune_backups(self, commands, minit_repo, app):
+        """
+        .prune_backups should remove old backups and return reclaimed bytes
+        """
+        app.repo.prune_backups.return_value = 1024
+
+        assert commands.prune_backups() == 1024
+
+        minit_repo.assert_called_once_with()
+        app.repo.prune_backups.assert_called_once_with()
+
+    @mark.parametrize('created', [True, False])
+    def test_create_bundle(self, commands, minit_repo, app, created):
+        """
+        .create_bundle should create bundle for the peer and return proper result
+        """
+        app.repo.create_bundle.return_value = created
+
+        result = commands.create_bundle('/tmp/bundle', 'laptop', sentinel.since)
+
+        minit_repo.assert_called_once_with()
+        app.repo.create_bundle.assert_called_once_with('/tmp/bundle', 'laptop', sentinel.since)
+        assert result == BundleResult('/tmp/bundle', 'laptop', created)
+
+    def test_apply_bundle(self, commands, minit_repo, app):
+        """
+        .apply_bundle should pull commits from the bundle
+        """
+        commands.apply_bundle('/tmp/bundle')
+
+        minit_repo.assert_called_once_with()
+        app.repo.apply_bundle.assert_called_once_with('/tmp/bundle')
+
+    def test_share_objects(self, commands, minit_repo, app):
+        """
+        .share_objects should move objects to the shared store and return reclaimed bytes
+        """
+        app.repo.share_objects.return_value = 2048
+
+        assert commands.share_objects() == 2048
+
+        minit_repo.assert_called_once_with()
+
+    def test_share_objects_without_store(self, commands, minit_repo, app):
+        """
+        .share_objects should do nothing when the shared object store is not set
+        """
+        app.get_shared_object_store.return_value = None
+
+        assert commands.share_objects() is None
+
+        assert not app.repo.share_objects.called
+
+    def test_watch(self, commands, minit_repo, app):
+        """
+        .watch should run the watcher and yield state on start and after every commit
+        """
+        app.repo.config = dict(files=['first', 'second'])
+        with patch('confsave.watch.Watcher') as mwatcher:
+            mwatcher.return_value.run.return_value = [None, None]
+            states = list(commands.watch(5))
+
+        minit_repo.assert_called_once_with()
+        mwatcher.assert_called_once_with(app, 5)
+        assert states == [WatchState(2, 0), WatchState(2, 1), WatchState(2, 2)]
+
+    def test_export(self, commands, minit_repo, app):
+        """
+        .export should write archive of the tracked files into the stream
+        """
+        commands.export(sentinel.stream, sentinel.treeish)
+
+        minit_repo.assert_called_once_with()
+        app.repo.export_archive.assert_called_once_with(sentinel.stream, sentinel.treeish)
+
+    def test_import_archive(self, commands, minit_repo, app):
+        """
+        .import_archive should import archive without initializing the repo and yield proper result
+        """
+        endpoint = MagicMock()
+        endpoint.path = '/home/user/.vimrc'
+        with patch('confsave.archive.ArchiveImporter') as mimporter:
+            mimporter.return_value.import_archive.return_value = [
+                (endpoint, dict(populated=True, backuped=True)),
+            ]
+            results = list(commands.import_archive(sentinel.stream))
+
+        assert not minit_repo.called
+        app.start_backup_session.assert_called_once_with()
+        mimporter.assert_called_once_with(app)
+        mimporter.return_value.import_archive.assert_called_once_with(sentinel.stream)
+        assert results == [LinkResult('/home/user/.vimrc', True, endpoint.get_backup_path.return_value)]
+
+    def test_create_repo(self, commands, mrepo, mabspath, mexpanduser, mexists, mgetuser, mgethostname):
+        """
+        .create_repo should create repo and return url for the remote
         """
         mexists.return_value = False
 
-        commands.create_repo('somepath')
+        result = commands.create_repo('somepath')
 
         mexpanduser.assert_called_once_with('somepath')
         mabspath.assert_called_once_with(mexpanduser.return_value)
         mexists.assert_called_once_with(mabspath.return_value)
         mrepo.init.assert_called_once_with(mabspath.return_value, bare=True)
+        commands.app.get_shared_object_store.return_value.link.assert_called_once_with(mabspath.return_value)
         mgethostname.assert_called_once_with()
         mgetuser.assert_called_once_with()
 
-        assert mprint.call_args_list == [
-            call("Created repo at {}".format(mabspath.return_value)),
-            call('Possible remote url is: {0}@{1}:{2}'.format(
-                mgetuser.return_value,
-                mgethostname.return_value,
-                mabspath.return_value,
-            ))
-        ]
+        assert result == RepoCreated(
+            mabspath.return_value,
+            True,
+            '{0}@{1}:{2}'.format(mgetuser.return_value, mgethostname.return_value, mabspath.return_value),
+        )
+
+    def test_create_repos(self, commands, app, mgetuser, mgethostname):
+        """
+        .create_repos should create all the repos seeded from the template and yield results in order of the paths
+        """
+        store = app.get_shared_object_store.return_value
+        prefix = '{0}@{1}:'.format(mgetuser.return_value, mgethostname.return_value)
+        paths = ['repo{}'.format(index) for index in range(20)]
+        with patch.object(commands, '_create_repo') as mcreate_repo:
+            mcreate_repo.side_effect = lambda path, *args: path
+
+            assert list(commands.create_repos(paths, 'template', 4)) == paths
+
+        store.add_template.assert_called_once_with('template')
+        mgetuser.assert_called_once_with()
+        mcreate_repo.assert_any_call('repo0', store, prefix, store.add_template.return_value)
+
+    def test_create_repos_duplicates(self, commands, app):
+        """
+        .create_repos should create every repo only once, even if the manifest lists it more times (in order of the
+        first occurrence)
+        """
+        paths = ['repo1', 'repo2', './repo1', 'repo3', 'repo2']
+        with patch.object(commands, '_create_repo') as mcreate_repo:
+            mcreate_repo.side_effect = lambda path, *args: path
+
+            assert list(commands.create_repos(paths, threads=4)) == ['repo1', 'repo2', 'repo3']
+
+        assert mcreate_repo.call_count == 3
+
+    def test_create_repos_template_without_store(self, commands, app):
+        """
+        .create_repos should raise SharedObjectStoreNotSet when the template is used without the shared object store
+        """
+        app.get_shared_object_store.return_value = None
+
+        with raises(SharedObjectStoreNotSet):
+            list(commands.create_repos(['repo'], 'template'))
 
-    def test_create_repo_when_already_exists(
-        self,
-        commands,
-        mrepo,
-        mabspath,
-        mexpanduser,
-        mexists,
-        mprint,
-        mgetuser,
-        mgethostname,
-    ):
+    def test_create_repo_when_already_exists(self, commands, mrepo, mabspath, mexpanduser, mexists):
         """
-        .create_repo should create repo and show url for the remote
+        .create_repo should not create repo when the path already exists
         """
         mexists.return_value = True
 
-        commands.create_repo('somepath')
+        result = commands.create_repo('somepath')
 
-        mexpanduser.assert_called_once_with('somepath')
-        mabspath.assert_called_once_with(mexpanduser.return_value)
         mexists.assert_called_once_with(mabspath.return_value)
         assert not mrepo.init.called
-        mgethostname.assert_called_once_with()
-        mgetuser.assert_called_once_with()
-
-        assert mprint.call_args_list == [
-            call("Path {} already exists.".format(mabspath.return_value)),
-            call('Possible remote url is: {0}@{1}:{2}'.format(
-                mgetuser.return_value,
-                mgethostname.return_value,
-                mabspath.return_value,
-            ))
-        ]
+        assert result.created is False
@@ -0,0 +1,44 @@
+from os.path import join
+from tempfile import mkdtemp
+
+from pytest import fixture
+
+from confsave.configcache import ConfigCache
+
+
+class TestConfigCache(object):
+
+    @fixture
+    def cache(self):
+        return ConfigCache(join(mkdtemp(), 'config.cache'))
+
+    def test_get_when_missing(self, cache):
+        """
+        .get should return None when there is no cache
+        """
+        assert cache.get('digest') is None
+
+    def test_get(self, cache):
+        """
+        .get should return cached config only for the same hash of the YAML file
+        """
+        config = {'files': ['/home/user/.vimrc']}
+        cache.set(ConfigCache.get_digest(b'data'), config)
+
+        assert cache.get(ConfigCache.get_digest(b'data')) == config
+        assert cache.get(ConfigCache.get_digest(b'other')) is None
+
+    def test_get_when_broken(self, cache):
+        """
+        .get should return None when the cache file is broken
+        """
+        with open(cache.path, 'wb') as file:
+            file.write(b'garbage')
+
+        assert cache.get('digest') is None
+
+    def test_set_when_folder_missing(self):
+        """
+        .set should ignore errors, because the cache is optional
+        """
+        ConfigCache(join(mkdtemp(), 'missing', 'config.cache')).set('digest', {})
@@ -0,0 +1,118 @@
+from os.path import join
+from tempfile import mkdtemp
+from threading import Thread
+
+from mock import MagicMock
+from pytest import fixture
+from pytest import mark
+
+from confsave.daemon import Daemon
+from confsave.daemon import forward
+from confsave.daemon import is_local_only
+
+
+class SampleCommandLine(object):
+
+    def __init__(self, app, argv):
+        self.app = app
+        self.argv = argv
+
+    def run(self):
+        command = self.argv[1]
+        if command == 'print':
+            print('output')
+        elif command == 'exit':
+            raise SystemExit(2)
+        elif command == 'message':
+            raise SystemExit('message')
+        elif command == 'error':
+            raise RuntimeError('error')
+
+
+class TestDaemon(object):
+
+    @fixture
+    def app(self):
+        mock = MagicMock()
+        mock.get_daemon_socket_path.return_value = join(mkdtemp(), 'cs.sock')
+        return mock
+
+    @fixture
+    def daemon(self, app):
+        return Daemon(app, SampleCommandLine)
+
+    @mark.parametrize(
+        'command, stdout, code',
+        [
+            ('print', 'output\n', 0),
+            ('exit', '', 2),
+            ('nothing', '', 0),
+        ]
+    )
+    def test_execute(self, daemon, app, command, stdout, code):
+        """
+        .execute should return output and exit code of the command, and reset settings before it
+        """
+        response = daemon.execute(['cs', command], mkdtemp())
+
+        app.reset_settings.assert_called_once_with()
+        assert response == dict(stdout=stdout, stderr='', code=code)
+
+    def test_execute_with_message(self, daemon):
+        """
+        .execute should print SystemExit message to stderr and return 1, like the interpreter does
+        """
+        response = daemon.execute(['cs', 'message'], mkdtemp())
+
+        assert response == dict(stdout='', stderr='message\n', code=1)
+
+    def test_execute_with_exception(self, daemon):
+        """
+        .execute should print traceback to stderr and return 1, like the interpreter does
+        """
+        response = daemon.execute(['cs', 'error'], mkdtemp())
+
+        assert response['code'] == 1
+        assert response['stderr'].startswith('Traceback (most recent call last):')
+        assert response['stderr'].endswith('RuntimeError: error\n')
+
+    def test_forward(self, daemon, app):
+        """
+        forward should send the command to the running daemon and return its response
+        """
+        server = daemon.listen()
+        thread = Thread(target=daemon.accept, args=(server,))
+        thread.start()
+
+        response = forward(app.get_daemon_socket_path(), ['cs', 'print'])
+
+        thread.join()
+        server.close()
+        assert response == dict(stdout='output\n', stderr='', code=0)
+
+    def test_forward_without_daemon(self, app):
+        """
+        forward should return None when the daemon is not running
+        """
+        assert forward(app.get_daemon_socket_path(), ['cs', '--list']) is None
+
+    @mark.parametrize(
+        'argv, result',
+        [
+            (['cs', '--list'], False),
+            (['cs', '--export'], True),
+            (['cs', '--import=-'], True),
+            (['cs', '--daemon'], True),
+            (['cs', '-s', '--format=ndjson'], True),
+            (['cs', '-s', '--format', 'ndjson'], True),
+            (['cs', '-s', '--format', 'text'], False),
+            (['cs', '-c', '--profile'], True),
+            (['cs', '--create-repos', '-'], True),
+            (['cs', '--create-repos=manifest.txt'], True),
+        ]
+    )
+    def test_is_local_only(self, argv, result):
+        """
+        is_local_only should return True for commands which stream data through stdin/stdout
+        """
+        assert is_local_only(argv) is result
@@ -0,0 +1,76 @@
+from os import makedirs
+from os import remove
+from os.path import dirname
+from os.path import join
+from tempfile import mkdtemp
+
+from git import Repo
+from pytest import fixture
+
+from confsave.drift import ADDED
+from confsave.drift import DELETED
+from confsave.drift import MODIFIED
+from confsave.drift import TreeDiff
+
+
+class TestTreeDiff(object):
+
+    @fixture
+    def repo(self):
+        return Repo.init(mkdtemp())
+
+    def _commit(self, repo, files, removed=()):
+        for path, data in files.items():
+            path = join(repo.working_tree_dir, path)
+            makedirs(dirname(path), exist_ok=True)
+            with open(path, 'w') as file:
+                file.write(data)
+        if files:
+            repo.index.add(list(files))
+        if removed:
+            repo.index.remove(list(removed))
+            for path in removed:
+                remove(join(repo.working_tree_dir, path))
+        return repo.index.commit('change').tree.hexsha
+
+    def test_compare(self, repo):
+        """
+        .compare should return tracked paths which are modified, added or deleted in the other tree
+        """
+        reference = self._commit(repo, {'.vimrc': 'a', '.config/nvim/init.vim': 'b', '.config/other': 'c'})
+        other = self._commit(
+            repo, {'.config/nvim/init.vim': 'x', '.config/other': 'y', '.bashrc': 'z'}, removed=['.vimrc'])
+        diff = TreeDiff(repo, ['.vimrc', '.config/nvim', '.bashrc'])
+
+        assert diff.compare(reference, reference) == {}
+        assert diff.compare(reference, other) == {
+            '.vimrc': DELETED,
+            '.config/nvim': MODIFIED,
+            '.bashrc': ADDED,
+        }
+
+    def test_compare_reads_only_differing_trees(self, repo):
+        """
+        .compare should read only the trees on the way to the tracked paths which differ and read every tree once
+        """
+        reference = self._commit(repo, {'.vimrc': 'a', 'same/file': 'b', 'folder/nested/file': 'c'})
+        other = self._commit(repo, {'folder/nested/file': 'x'})
+        diff = TreeDiff(repo, ['.vimrc', 'same/file', 'folder/nested/file'])
+
+        assert diff.compare(reference, other) == {'folder/nested/file': MODIFIED}
+        assert len(diff.trees) == 6
+        reads = len(diff.trees)
+
+        assert diff.compare(reference, other) == {'folder/nested/file': MODIFIED}
+        assert len(diff.trees) == reads
+
+    def test_get_blob(self, repo):
+        """
+        .get_blob should return id of the blob in the root of the tree or None for missing paths and folders
+        """
+        tree = self._commit(repo, {'.vimrc': 'a', '.config/other': 'c'})
+        diff = TreeDiff(repo)
+
+        assert diff.get_blob(tree, '.vimrc') == repo.head.commit.tree['.vimrc'].binsha
+        assert diff.get_blob(tree, '.config') is None
+        assert diff.get_blob(tree, '.bashrc') is None
@@ -0,0 +1,172 @@
+from os import makedirs
+from os import listdir
+from os import readlink
+from os import symlink
+from os.path import exists
+from os.path import islink
+from os.path import join
+from tempfile import mkdtemp
+
+from mock import MagicMock
+from pytest import fixture
+
+from confsave.app import Application
+from confsave.fleet import FleetPopulate
+from confsave.fleet import expand_homes
+from confsave.fleet import get_home_app
+from confsave.registry import FileRegistry
+from confsave.results import LinkResult
+
+
+class TestFleet(object):
+
+    @fixture
+    def root(self):
+        return mkdtemp()
+
+    @fixture
+    def app(self, root):
+        app = Application()
+        app.update_settings(repo_path=join(root, 'repo'), home_path=join(root, 'admin'))
+        makedirs(join(root, 'repo', '.config', 'nvim'))
+        with open(join(root, 'repo', '.vimrc'), 'w') as file:
+            file.write('set nu')
+        app._repo = MagicMock()
+        files = FileRegistry([join(root, 'admin', '.config', 'nvim'), join(root, 'admin', '.vimrc')])
+        app._repo.config = {'files': files}
+        return app
+
+    def test_expand_homes(self, root):
+        """
+        expand_homes should expand globs and keep only existing folders, sorted and unique
+        """
+        for name in ['bob', 'alice']:
+            makedirs(join(root, 'home', name))
+        open(join(root, 'home', 'file'), 'w').close()
+
+        homes = expand_homes([join(root, 'home', '*'), join(root, 'home', 'alice'), join(root, 'missing')])
+
+        assert homes == [join(root, 'home', 'alice'), join(root, 'home', 'bob')]
+
+    def test_get_home_app(self, app, root):
+        """
+        get_home_app should return application with the home and the backup folder of the home
+        """
+        home_app = get_home_app(app, join(root, 'home', 'alice'))
+
+        assert home_app.get_home_path() == join(root, 'home', 'alice')
+        assert home_app.get_backup_path().startswith(app.get_backup_path() + '/')
+        assert home_app.get_backup_path().endswith('_home_alice')
+        assert app.get_home_path() == join(root, 'admin')
+        assert home_app.get_variables_path() == join(root, 'home', 'alice', '.confsave.vars')
+        assert home_app.get_rendered_path().startswith(app.get_rendered_path() + '/')
+        assert home_app.get_render_index_path() != app.get_render_index_path()
+
+    def test_run(self, app, root):
+        """
+        .run should link tracked paths in every home (with missing parent folders) and store the old files in the
+        backup folders of the homes
+        """
+        alice = join(root, 'home', 'alice')
+        bob = join(root, 'home', 'bob')
+        makedirs(alice)
+        makedirs(bob)
+        with open(join(bob, '.vimrc'), 'w') as file:
+            file.write('old')
+        app._repo.create_backup.side_effect = lambda: makedirs(app.get_backup_path(), exist_ok=True)
+
+        homes = sorted(FleetPopulate(app, 2).run([alice, bob]))
+
+        bob_backup = get_home_app(app, bob).get_backup_path()
+        assert homes[0].home == alice
+        assert homes[0].results == [
+            LinkResult(join(alice, '.config', 'nvim'), True, None),
+            LinkResult(join(alice, '.vimrc'), True, None),
+        ]
+        assert homes[0].error is None
+        assert homes[1].results[1] == LinkResult(join(bob, '.vimrc'), True, join(bob_backup, '.vimrc'))
+        assert readlink(join(alice, '.config', 'nvim')) == join(root, 'repo', '.config', 'nvim')
+        assert readlink(join(alice, '.vimrc')) == join(root, 'repo', '.vimrc')
+        assert readlink(join(bob, '.vimrc')) == join(root, 'repo', '.vimrc')
+        assert open(join(bob_backup, '.vimrc')).read() == 'old'
+        assert not exists(get_home_app(app, alice).get_backup_path())
+
+    def test_run_render(self, app, root):
+        """
+        .run should render templates with the variables of every home and link them to the outputs of the home
+        """
+        gitconfig = join(root, 'admin', '.gitconfig')
+        app._repo.config = {'files': FileRegistry([gitconfig], {gitconfig: {'render': True}})}
+        with open(join(root, 'repo', '.gitconfig'), 'w') as file:
+            file.write('$home $email')
+        homes = [join(root, 'home', name) for name in ['alice', 'bob']]
+        for home in homes:
+            makedirs(home)
+            with open(join(home, '.confsave.vars'), 'w') as file:
+                file.write('email: {}@example.com\n'.format(home[-3:]))
+        app._repo.create_backup.side_effect = lambda: makedirs(app.get_backup_path(), exist_ok=True)
+
+        results = sorted(FleetPopulate(app, 2).run(homes))
+
+        assert [home.error for home in results] == [None, None]
+        for home in homes:
+            link = join(home, '.gitconfig')
+            assert readlink(link).startswith(app.get_rendered_path() + '/')
+            assert open(link).read() == '{0} {1}@example.com'.format(home, home[-3:])
+
+    def test_run_through_symlink(self, app, root):
+        """
+        .run should not touch files outside of the home when a folder of the tracked path is a symlink leading outside
+        """
+        home = join(root, 'home', 'alice')
+        victim = join(root, 'victim')
+        makedirs(home)
+        makedirs(join(victim, 'nvim'))
+        with open(join(victim, 'nvim', 'init.vim'), 'w') as file:
+            file.write('secret')
+        symlink(victim, join(home, '.config'))
+        app._repo.create_backup.side_effect = lambda: makedirs(app.get_backup_path(), exist_ok=True)
+
+        homes = list(FleetPopulate(app, 1).run([home]))
+
+        assert homes[0].error == 'Path {0} leads outside of the home {1}'.format(join(home, '.config'), home)
+        assert listdir(join(victim, 'nvim')) == ['init.vim']
+        assert not islink(join(victim, 'nvim'))
+
+    def test_run_invalid_variables(self, app, root):
+        """
+        .run should report the home with invalid variables as failed and populate the other homes
+        """
+        gitconfig = join(root, 'admin', '.gitconfig')
+        app._repo.config = {'files': FileRegistry([gitconfig], {gitconfig: {'render': True}})}
+        with open(join(root, 'repo', '.gitconfig'), 'w') as file:
+            file.write('$home')
+        alice = join(root, 'home', 'alice')
+        bob = join(root, 'home', 'bob')
+        makedirs(alice)
+        makedirs(bob)
+        with open(join(alice, '.confsave.vars'), 'w') as file:
+            file.write('- a\n')
+        app._repo.create_backup.side_effect = lambda: makedirs(app.get_backup_path(), exist_ok=True)
+
+        homes = sorted(FleetPopulate(app, 2).run([alice, bob]))
+
+        assert 'variables are not a YAML mapping' in homes[0].error
+        assert homes[1].error is None
+        assert open(join(bob, '.gitconfig')).read() == bob
+
+    def test_run_error(self, app, root):
+        """
+        .run should report the error of the home and remove the empty backup folder of the run
+        """
+        home = join(root, 'home', 'alice')
+        makedirs(home)
+        open(join(home, '.config'), 'w').close()
+        app._repo.config = {'files': FileRegistry([join(root, 'admin', '.config', 'nvim')])}
+        app._repo.create_backup.side_effect = lambda: makedirs(app.get_backup_path(), exist_ok=True)
+
+        homes = list(FleetPopulate(app, 1).run([home]))
+
+        assert homes[0].home == home
+        assert homes[0].error is not None
+        assert not exists(app.get_backup_path())
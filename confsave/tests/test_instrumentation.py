@@ -0,0 +1,120 @@
+from mock import MagicMock
+from pytest import raises
+from pytest import yield_fixture
+
+from confsave import instrumentation
+from confsave.instrumentation import Aggregator
+from confsave.instrumentation import Histogram
+from confsave.instrumentation import instrumented
+from confsave.instrumentation import span
+
+
+class TestSpan(object):
+
+    @yield_fixture
+    def observer(self):
+        observer = instrumentation.register(MagicMock())
+        yield observer
+        instrumentation.unregister(observer)
+
+    def test_span_without_observers(self):
+        """
+        span should return the shared no-op span when no observer is registered
+        """
+        with span('anything', path='/home') as current:
+            current.set(size=1)
+
+        assert current is instrumentation.NO_SPAN
+
+    def test_span(self, observer):
+        """
+        span should report start and end of the operation with its attributes to the observers
+        """
+        with span('git.push', remote='origin') as current:
+            observer.on_start.assert_called_once_with(current)
+            assert not observer.on_end.called
+            current.set(pushed=1)
+
+        observer.on_end.assert_called_once_with(current)
+        assert current.name == 'git.push'
+        assert current.attributes == dict(remote='origin', pushed=1)
+        assert current.duration >= 0
+        assert current.error is None
+
+    def test_span_error(self, observer):
+        """
+        span should report the type of the raised exception
+        """
+        with raises(OSError):
+            with span('fs.move') as current:
+                raise OSError()
+
+        assert current.error is OSError
+        observer.on_end.assert_called_once_with(current)
+
+    def test_unregister_during_span(self, observer):
+        """
+        span should report the end to the observers which were notified about the start
+        """
+        with span('fs.mkdir') as current:
+            instrumentation.unregister(observer)
+
+        observer.on_end.assert_called_once_with(current)
+
+    def test_instrumented_generator(self, observer):
+        """
+        instrumented should keep the span of the generator running until it is exhausted
+        """
+        @instrumented('items')
+        def items():
+            yield 1
+            yield 2
+
+        generator = items()
+        assert next(generator) == 1
+        assert not observer.on_end.called
+
+        assert list(generator) == [2]
+        assert observer.on_end.call_args[0][0].name == 'items'
+
+
+class TestAggregator(object):
+
+    def test_histogram(self):
+        """
+        Histogram should count durations in the buckets and report the quantiles
+        """
+        histogram = Histogram()
+        for duration in [0.0001, 0.0001, 0.003, 20.0]:
+            histogram.add(duration)
+        histogram.add(0.0002, OSError)
+
+        cumulative = dict(histogram.cumulative())
+        assert cumulative[0.0005] == 3
+        assert cumulative[0.005] == 4
+        assert cumulative[float('inf')] == 5
+        assert histogram.count == 5
+        assert histogram.errors == 1
+        assert histogram.quantile(0.5) == 0.0005
+        assert histogram.quantile(1.0) == 20.0
+        assert Histogram().quantile(0.5) is None
+
+    def test_aggregator(self):
+        """
+        Aggregator should collect histograms of the spans by the name
+        """
+        aggregator = instrumentation.register(Aggregator())
+        try:
+            for _ in range(3):
+                with span('fs.symlink'):
+                    pass
+            with span('git.push'):
+                pass
+        finally:
+            instrumentation.unregister(aggregator)
+
+        assert aggregator.histograms['fs.symlink'].count == 3
+        assert aggregator.histograms['git.push'].count == 1
+        table = aggregator.format_table().splitlines()
+        assert table[1].startswith('fs.symlink')
+        assert table[2].startswith('git.push')
@@ -0,0 +1,141 @@
+from os import listdir
+from os.path import exists
+from os.path import join
+from tempfile import mkdtemp
+
+from mock import patch
+from pytest import fixture
+
+from confsave.journal import ConfigJournal
+from confsave.journal import atomic_write
+from confsave.registry import FileRegistry
+
+
+class TestConfigJournal(object):
+
+    @fixture
+    def journal(self):
+        return ConfigJournal(join(mkdtemp(), 'confsave.journal'))
+
+    def test_replay_when_missing(self, journal):
+        """
+        .replay should do nothing when there is no journal
+        """
+        registry = FileRegistry(['/a'])
+
+        assert journal.replay(registry) == 0
+        assert list(registry) == ['/a']
+
+    def test_flush_and_replay(self, journal):
+        """
+        .flush should append recorded changes and .replay should apply them in order
+        """
+        journal.record(ConfigJournal.ADD, '/b', mode=1)
+        journal.record(ConfigJournal.REMOVE, '/a')
+        assert journal.flush() == 2
+        journal.record(ConfigJournal.ADD, '/c')
+        assert journal.flush() == 1
+        registry = FileRegistry(['/a'])
+
+        assert ConfigJournal(journal.path).replay(registry) == 3
+        assert list(registry) == ['/b', '/c']
+        assert registry.get_metadata('/b') == {'mode': 1}
+
+    def test_flush_uses_one_fsync(self, journal):
+        """
+        .flush should write all recorded changes with a single fsync
+        """
+        journal.record(ConfigJournal.ADD, '/a')
+        journal.record(ConfigJournal.ADD, '/b')
+
+        with patch('confsave.journal.fsync') as mfsync:
+            journal.flush()
+
+        mfsync.assert_called_once()
+        assert journal.pending == []
+        assert journal.entries == 2
+
+    def test_replay_torn_entry(self, journal):
+        """
+        .replay should skip the entry which was not written completely and removals of not tracked paths
+        """
+        with open(journal.path, 'w') as file:
+            file.write('{"op": "remove", "path": "/x"}\n{"op": "add", "path": "/a"}\n{"op": "add", "pa')
+        registry = FileRegistry()
+
+        journal.replay(registry)
+
+        assert list(registry) == ['/a']
+
+    def test_flush_after_torn_entry(self, journal):
+        """
+        .flush should not glue new entries to the torn entry of the previous append
+        """
+        with open(journal.path, 'w') as file:
+            file.write('{"op": "add", "path": "/a"}\n{"op": "add", "pa')
+        journal.record(ConfigJournal.ADD, '/b')
+        journal.flush()
+        registry = FileRegistry()
+
+        assert journal.replay(registry) == 2
+        assert sorted(registry) == ['/a', '/b']
+
+    def test_clear(self, journal):
+        """
+        .clear should remove the journal and the not written changes
+        """
+        journal.record(ConfigJournal.ADD, '/a')
+        journal.flush()
+        journal.record(ConfigJournal.ADD, '/b')
+
+        journal.clear()
+
+        assert journal.is_empty()
+        assert journal.entries == 0
+
+
+class TestAtomicWrite(object):
+
+    def test_atomic_write(self):
+        """
+        atomic_write should replace the file and leave no temporary files
+        """
+        folder = mkdtemp()
+        path = join(folder, 'config.yaml')
+        atomic_write(path, b'old')
+
+        atomic_write(path, b'new')
+
+        with open(path, 'rb') as file:
+            assert file.read() == b'new'
+        assert listdir(folder) == ['config.yaml']
+
+    def test_atomic_write_on_error(self):
+        """
+        atomic_write should keep the old file when the write has failed
+        """
+        folder = mkdtemp()
+        path = join(folder, 'config.yaml')
+        atomic_write(path, b'old')
+
+        with patch('confsave.journal.fsync', side_effect=OSError):
+            try:
+                atomic_write(path, b'new')
+            except OSError:
+                pass
+
+        with open(path, 'rb') as file:
+            assert file.read() == b'old'
+        assert listdir(folder) == ['config.yaml']
+        assert exists(path)
+
+    def test_atomic_write_relative_path(self, monkeypatch):
+        """
+        atomic_write should write the file given by the name only into the current folder
+        """
+        folder = mkdtemp()
+        monkeypatch.chdir(folder)
+
+        atomic_write('cs.prom', b'data')
+
+        assert listdir(folder) == ['cs.prom']
@@ -0,0 +1,160 @@
+from multiprocessing import get_context
+from os.path import join
+from tempfile import mkdtemp
+from time import sleep
+
+from mock import MagicMock
+from pytest import fixture
+from pytest import raises
+
+from confsave.lock import EXCLUSIVE
+from confsave.lock import SHARED
+from confsave.lock import LockTimeout
+from confsave.lock import RepoLock
+from confsave.lock import locked
+
+
+def hold_lock(path, mode, started, release):
+    with RepoLock(path).hold(mode):
+        started.set()
+        release.wait(10)
+
+
+class TestRepoLock(object):
+
+    @fixture
+    def path(self):
+        return join(mkdtemp(), '.confsave.lock')
+
+    @fixture
+    def lock(self, path):
+        return RepoLock(path, timeout=0.2, poll=0.01)
+
+    @fixture
+    def holder(self, path):
+        """
+        Start other process holding the lock.
+        """
+        context = get_context('fork')
+        processes = []
+        release = context.Event()
+
+        def start(mode):
+            started = context.Event()
+            process = context.Process(target=hold_lock, args=(path, mode, started, release))
+            process.start()
+            started.wait(10)
+            processes.append(process)
+
+        yield start
+        release.set()
+        for process in processes:
+            process.join()
+
+    def test_reentrant(self, lock):
+        """
+        .acquire should reuse already held lock and .release should unlock only the outermost one
+        """
+        lock.acquire(EXCLUSIVE)
+        lock.acquire(SHARED)
+        lock.release()
+
+        assert lock.fd is not None
+
+        lock.release()
+
+        assert lock.fd is None
+        assert lock.stats.acquired == 1
+
+    def test_upgrade(self, lock):
+        """
+        .acquire should not upgrade held shared lock to the exclusive one
+        """
+        with lock.hold(SHARED):
+            with raises(RuntimeError):
+                lock.acquire(EXCLUSIVE)
+
+    def test_shared_with_other_reader(self, lock, holder):
+        """
+        .acquire should not wait for the shared lock held by other process
+        """
+        holder(SHARED)
+
+        with lock.hold(SHARED):
+            assert lock.stats.contended == 0
+
+    def test_exclusive_timeout(self, lock, holder):
+        """
+        .acquire should raise LockTimeout when other process holds the lock for too long
+        """
+        holder(SHARED)
+
+        with raises(LockTimeout):
+            lock.acquire(EXCLUSIVE)
+
+        assert lock.fd is None
+        assert lock.depth == 0
+
+    def test_contention_stats(self, path, lock, capsys):
+        """
+        .hold should wait for the other process and report the wait on the stderr
+        """
+        context = get_context('fork')
+        started = context.Event()
+        release = context.Event()
+        process = context.Process(target=hold_lock, args=(path, EXCLUSIVE, started, release))
+        process.start()
+        started.wait(10)
+        lock.timeout = 10
+
+        def release_later():
+            sleep(0.1)
+            release.set()
+        releaser = context.Process(target=release_later)
+        releaser.start()
+        with lock.hold(SHARED):
+            pass
+        process.join()
+        releaser.join()
+
+        assert lock.stats.contended == 1
+        assert lock.stats.waited >= 0.05
+        assert lock.stats.max_wait == lock.stats.waited
+        assert lock.stats.format().startswith('repo lock: acquired 1 times, contended 1 times (waited ')
+        assert 'for the lock {}'.format(path) in capsys.readouterr().err
+
+    def test_locked(self):
+        """
+        locked should run the method with the lock of the app held
+        """
+        class Sample(object):
+            app = MagicMock()
+
+            @locked(EXCLUSIVE)
+            def method(self, value):
+                """doc"""
+                return value
+
+        assert Sample().method(1) == 1
+        assert Sample.method.__doc__ == 'doc'
+        Sample.app.get_lock.return_value.hold.assert_called_once_with(EXCLUSIVE)
+
+    def test_locked_prepare(self):
+        """
+        locked should run the prepare method before the lock is taken
+        """
+        calls = []
+
+        class Sample(object):
+            app = MagicMock()
+
+            def prepare(self):
+                calls.append(('prepare', self.app.get_lock.return_value.hold.called))
+
+            @locked(SHARED, prepare=prepare)
+            def method(self):
+                yield 'value'
+
+        assert list(Sample().method()) == ['value']
+        assert calls == [('prepare', False)]
+        Sample.app.get_lock.return_value.hold.assert_called_once_with(SHARED)
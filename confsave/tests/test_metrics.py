@@ -0,0 +1,112 @@
+import json
+from os import mkdir
+from os import unlink
+from os.path import join
+from tempfile import mkdtemp
+
+from mock import MagicMock
+from pytest import fixture
+
+from confsave.api import get_commands
+from confsave.metrics import Metric
+from confsave.metrics import MetricsRecorder
+from confsave.metrics import format_metrics
+
+
+def parse(path):
+    with open(path) as file:
+        lines = [line for line in file if not line.startswith('#')]
+    return {line.split('{')[0]: float(line.split()[-1]) for line in lines}
+
+
+class TestMetrics(object):
+
+    @fixture
+    def commands(self):
+        home = mkdtemp()
+        for name in ['.vimrc', '.bashrc']:
+            with open(join(home, name), 'w') as file:
+                file.write('data')
+        mkdir(join(home, '.config'))
+        commands = get_commands(home_path=home, repo_path=join(home, '.confsave'))
+        commands.add(join(home, '.vimrc'))
+        commands.add(join(home, '.bashrc'))
+        return commands
+
+    def test_format_metrics(self):
+        """
+        format_metrics should format gauges with the escaped labels
+        """
+        data = format_metrics([Metric('confsave_pack_bytes', 'Size.', 10)], repo='/home/"x"')
+
+        assert data == (
+            '# HELP confsave_pack_bytes Size.\n'
+            '# TYPE confsave_pack_bytes gauge\n'
+            'confsave_pack_bytes{repo="/home/\\"x\\""} 10\n')
+
+    def test_on_end(self):
+        """
+        .on_end should record durations of the successful commit and push
+        """
+        recorder = MetricsRecorder(MagicMock())
+
+        recorder.on_end(MagicMock(error=None, duration=2.0))
+        recorder.on_end(MagicMock(error=OSError, duration=3.0))
+        span = MagicMock(error=None, duration=1.0)
+        span.name = 'git.push'
+        recorder.on_end(span)
+
+        assert recorder.commit_duration is None
+        assert recorder.push_duration == 1.0
+        assert recorder.pushed_at is not None
+
+    def test_write(self, commands):
+        """
+        .write should write metrics of the repo and keep durations of the last commit in the state
+        """
+        app = commands.app
+        path = join(mkdtemp(), 'cs.prom')
+        recorder = MetricsRecorder(app)
+        recorder.commit_duration = 0.5
+        unlink(join(app.get_home_path(), '.vimrc'))
+
+        recorder.write(path)
+        MetricsRecorder(app).write(path)
+
+        metrics = parse(path)
+        assert metrics['confsave_last_commit_duration_seconds'] == 0.5
+        assert 'confsave_last_push_timestamp_seconds' not in metrics
+        assert metrics['confsave_tracked_entries'] == 2
+        assert metrics['confsave_drifted_entries'] == 1
+        assert metrics['confsave_untracked_entries'] == 1
+        assert metrics['confsave_lock_acquired'] == app.get_lock().stats.acquired > 0
+        assert metrics['confsave_lock_contended'] == 0
+
+    def test_backup_sizes(self, commands):
+        """
+        .write should measure only backups which are not in the state yet
+        """
+        app = commands.app
+        path = join(mkdtemp(), 'cs.prom')
+        backup = join(app.get_repo_path(), 'backup_17_01_01_000000_000000')
+        mkdir(backup)
+        with open(join(backup, '.vimrc'), 'w') as file:
+            file.write('x' * 10)
+        with open(app.get_metrics_state_path(), 'w') as file:
+            json.dump(dict(backup_sizes={'backup_17_01_01_000000_000000': 100}), file)
+
+        MetricsRecorder(app).write(path)
+
+        assert parse(path)['confsave_backup_bytes'] == 100
+
+    def test_write_without_repo(self):
+        """
+        .write should write empty metrics file when the repo does not exist
+        """
+        home = mkdtemp()
+        path = join(home, 'cs.prom')
+        app = get_commands(home_path=home, repo_path=join(home, '.confsave')).app
+
+        MetricsRecorder(app).write(path)
+
+        assert parse(path) == {}
@@ -1,11 +1,13 @@
 from datetime import datetime
 from os import mkdir
+from os import readlink
 from os import symlink
 from os.path import dirname
 from os.path import exists
 from os.path import join
 from os.path import realpath
 from tempfile import NamedTemporaryFile
+from tempfile import mkdtemp
 
 from freezegun import freeze_time
 from mock import MagicMock
@@ -53,6 +55,12 @@ class TestEndpoint(object):
         with patch.object(Endpoint, 'is_link') as mock:
             yield mock
 
+    @yield_fixture
+    def mis_stale_link(self):
+        with patch.object(Endpoint, 'is_stale_link') as mock:
+            mock.return_value = False
+            yield mock
+
     @yield_fixture
     def mis_ignored(self):
         with patch.object(Endpoint, 'is_ignored') as mock:
@@ -307,6 +315,7 @@ class TestEndpoint(object):
         mbackup_local_file,
         msymlink,
         mget_repo_path,
+        mis_stale_link,
     ):
         """
         .make_link should create symlink un user directory of a repo file.
@@ -331,6 +340,73 @@ class TestEndpoint(object):
             assert not msymlink.called
             assert not result['populated']
 
+    def test_make_link_when_linked_to_other_profile(self, app):
+        """
+        .make_link should replace symlink to the file of other profile (without the backup)
+        """
+        root = mkdtemp()
+        app.get_home_path.return_value = join(root, 'home')
+        app.get_main_repo_path.return_value = join(root, 'repo')
+        app.get_repo_path.return_value = join(root, 'repo', '.git', 'profiles', 'web')
+        for folder in ['home', 'repo', 'other']:
+            mkdir(join(root, folder))
+        symlink(join(root, 'repo', '.vimrc'), join(root, 'home', '.vimrc'))
+        symlink(join(root, 'other', '.bashrc'), join(root, 'home', '.bashrc'))
+        profile_link = Endpoint(app, join(root, 'home', '.vimrc'))
+        user_link = Endpoint(app, join(root, 'home', '.bashrc'))
+
+        assert profile_link.is_stale_link()
+        assert not user_link.is_stale_link()
+        assert profile_link.make_link() == dict(populated=True, backuped=False)
+        assert user_link.make_link() == dict(populated=False, backuped=False)
+
+        assert readlink(profile_link.path) == join(root, 'repo', '.git', 'profiles', 'web', '.vimrc')
+        assert not profile_link.is_stale_link()
+        assert not app.repo.create_backup.called
+
+    def test_remove_link(self, app):
+        """
+        .remove_link should remove only the symlink to the repo and move back the newest backup of the file
+        """
+        root = mkdtemp()
+        app.get_home_path.return_value = join(root, 'home')
+        app.get_main_repo_path.return_value = join(root, 'repo')
+        for folder in ['home', 'repo', 'other', 'backup_1', 'backup_2', 'backup_3']:
+            mkdir(join(root, folder))
+        for folder in ['backup_1', 'backup_2']:
+            with open(join(root, folder, '.zshrc'), 'w') as file:
+                file.write(folder)
+        symlink(join(root, 'repo', '.git', 'profiles', 'web', '.zshrc'), join(root, 'home', '.zshrc'))
+        symlink(join(root, 'other', '.bashrc'), join(root, 'home', '.bashrc'))
+        backups = [MagicMock(path=join(root, folder)) for folder in ['backup_1', 'backup_2', 'backup_3']]
+
+        assert Endpoint(app, join(root, 'home', '.zshrc')).remove_link(backups) is True
+        assert Endpoint(app, join(root, 'home', '.bashrc')).remove_link(backups) is False
+
+        with open(join(root, 'home', '.zshrc')) as file:
+            assert file.read() == 'backup_2'
+        assert not exists(join(root, 'backup_2', '.zshrc'))
+        assert readlink(join(root, 'home', '.bashrc')) == join(root, 'other', '.bashrc')
+
+    def test_make_link_to_target(self, app):
+        """
+        .make_link should link the file to the target and replace the link to the file in the repo
+        """
+        root = mkdtemp()
+        app.get_home_path.return_value = join(root, 'home')
+        app.get_main_repo_path.return_value = join(root, 'repo')
+        app.get_repo_path.return_value = join(root, 'repo')
+        app.get_rendered_path.return_value = join(root, 'repo', '.git', 'rendered')
+        mkdir(join(root, 'home'))
+        symlink(join(root, 'repo', '.gitconfig'), join(root, 'home', '.gitconfig'))
+        endpoint = Endpoint(app, join(root, 'home', '.gitconfig'))
+        target = endpoint.get_rendered_path()
+
+        assert target == join(root, 'repo', '.git', 'rendered', '.gitconfig')
+        assert endpoint.make_link(target) == dict(populated=True, backuped=False)
+        assert endpoint.make_link(target) == dict(populated=False, backuped=False)
+        assert readlink(endpoint.path) == target
+
     @mark.parametrize(
         'user_path, path, is_in_userpath',
         [
@@ -397,13 +473,18 @@ class TestEndpoint(object):
         'path, result',
         [
             ['/home/mymegahome/.confsave', True],
+            ['/home/mymegahome/.confsave.lock', True],
+            ['/home/mymegahome/.confsave.sock', True],
             ['/home/mymegahome/somethingelse', False],
         ]
     )
     def test_is_repo(self, app, path, result):
         """
-        .is_repo should return True if endpoint's path is a confsave's repo path.
+        .is_repo should return True if endpoint's path is a confsave's repo path or its lock, variables or socket file.
         """
-        app.get_repo_path.return_value = '/home/mymegahome/.confsave'
+        app.get_main_repo_path.return_value = '/home/mymegahome/.confsave'
+        app.get_lock_path.return_value = '/home/mymegahome/.confsave.lock'
+        app.get_variables_path.return_value = '/home/mymegahome/.confsave.vars'
+        app.get_daemon_socket_path.return_value = '/home/mymegahome/.confsave.sock'
 
         assert Endpoint(app, path).is_repo() is result
@@ -0,0 +1,78 @@
+from os import listdir
+from os import stat
+from os.path import join
+from stat import S_ISGID
+from tempfile import mkdtemp
+
+from git import Repo
+from pytest import fixture
+
+from confsave.objectstore import SharedObjectStore
+
+
+class TestSharedObjectStore(object):
+
+    @fixture
+    def store(self):
+        return SharedObjectStore(join(mkdtemp(), 'store.git'))
+
+    def _make_repo(self, data):
+        path = mkdtemp()
+        repo = Repo.init(path)
+        with open(join(path, 'config'), 'w') as file:
+            file.write(data)
+        repo.index.add(['config'])
+        repo.index.commit('first')
+        return repo
+
+    def test_link(self, store):
+        """
+        .link should create the store and add it to the alternates only once
+        """
+        repo = self._make_repo('data')
+
+        store.link(repo.git_dir)
+        store.link(repo.git_dir)
+
+        assert store.is_linked(repo.git_dir) is True
+        alternates = open(join(repo.git_dir, 'objects', 'info', 'alternates')).read()
+        assert alternates == store.get_objects_path() + '\n'
+        assert Repo(store.path).git.config('core.sharedRepository') == '1'
+        assert stat(store.get_objects_path()).st_mode & S_ISGID
+
+    def test_share(self, store):
+        """
+        .share should move objects to the store, so the common objects are stored only once
+        """
+        data = 'x' * 100000
+        first = self._make_repo(data)
+        second = self._make_repo(data)
+
+        assert store.share(first) > 0
+        assert store.share(second) > 0
+
+        blob = first.head.commit.tree / 'config'
+        assert second.head.commit.tree['config'].hexsha == blob.hexsha
+        assert second.git.cat_file('-p', blob.hexsha) == data
+        # commits of the other repo (made in another second) are in the store, so they are dangling for this one
+        assert first.git.fsck('--no-dangling') == ''
+
+    def test_seed(self, store):
+        """
+        .seed should make the new repo with branches of the template without copying the objects
+        """
+        template = self._make_repo('x' * 100000)
+        refs, head = store.add_template(template.working_tree_dir)
+        path = join(mkdtemp(), 'new.git')
+        Repo.init(path, bare=True)
+        store.link(path)
+
+        store.seed(path, refs, head)
+
+        repo = Repo(path)
+        assert refs == {head: template.head.commit.hexsha}
+        assert repo.head.commit.hexsha == template.head.commit.hexsha
+        assert repo.git.fsck('--no-dangling') == ''
+        assert not listdir(join(path, 'objects', 'pack'))
+        clone = Repo.clone_from(path, join(mkdtemp(), 'clone'))
+        assert open(join(clone.working_tree_dir, 'config')).read() == 'x' * 100000
@@ -0,0 +1,78 @@
+import subprocess
+import sys
+from os.path import exists
+from os.path import join
+from tempfile import mkdtemp
+
+from pytest import yield_fixture
+
+from confsave import instrumentation
+from confsave import profiling
+from confsave.instrumentation import instrumented
+from confsave.instrumentation import span
+from confsave.lock import LockStats
+
+
+class TestProfiling(object):
+
+    @yield_fixture
+    def profiler(self):
+        profiler = profiling.start()
+        yield profiler
+        if profiling._profiler is not None:
+            profiling.stop()
+
+    def test_start_and_stop(self):
+        """
+        Profiler should observe the spans only while profiling is enabled
+        """
+        profiler = profiling.start()
+        assert profiler in instrumentation._observers
+
+        profiling.stop()
+        assert profiler not in instrumentation._observers
+
+    def test_nested_phases(self, profiler):
+        """
+        phases should be named with the path of the nested phases and listed in order of the first call
+        """
+        @instrumented('inner')
+        def inner():
+            return 1
+
+        with span('outer'):
+            assert inner() == 1
+            inner()
+
+        profiling.stop()
+
+        assert list(profiler.phases) == ['outer', 'outer/inner']
+        assert profiler.phases['outer/inner'].calls == 2
+        assert profiler.phases['outer'].wall >= profiler.phases['outer/inner'].wall
+        assert profiler.aggregator.histograms['inner'].count == 2
+        assert 'outer/inner' in profiler.format_table()
+        assert 'repo lock: acquired 0 times' in profiler.format_table(LockStats())
+
+    def test_subprocesses(self, profiler):
+        """
+        Profiler should count spawned subprocesses and git subprocesses
+        """
+        subprocess.run(['git', '--version'], stdout=subprocess.PIPE)
+        subprocess.run([sys.executable, '-c', ''])
+
+        profiling.stop()
+        subprocess.run(['git', '--version'], stdout=subprocess.PIPE)
+
+        assert profiler.subprocesses == 2
+        assert profiler.git_subprocesses == 1
+
+    def test_cprofile_output(self):
+        """
+        Profiler should write cProfile stats when the output is set
+        """
+        output = join(mkdtemp(), 'cs.prof')
+
+        profiling.start(output)
+        profiling.stop()
+
+        assert exists(output)
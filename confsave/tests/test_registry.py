@@ -0,0 +1,83 @@
+from pytest import fixture
+
+from confsave.registry import FileRegistry
+
+
+class TestFileRegistry(object):
+
+    @fixture
+    def registry(self):
+        return FileRegistry(
+            [
+                '/home/user/.vimrc',
+                '/home/user/.config/nvim/init.vim',
+                '/home/user/.config/nvim-qt',
+                '/home/user/.config/nvim',
+                '/home/user/.config/nvim/lua/plugins.lua',
+                '/home/user/.vimrc',
+            ],
+            {'/home/user/.vimrc': {'mode': 33188}},
+        )
+
+    def test_init(self, registry):
+        """
+        FileRegistry should keep paths unique and sorted
+        """
+        assert list(registry) == [
+            '/home/user/.config/nvim',
+            '/home/user/.config/nvim-qt',
+            '/home/user/.config/nvim/init.vim',
+            '/home/user/.config/nvim/lua/plugins.lua',
+            '/home/user/.vimrc',
+        ]
+        assert len(registry) == 5
+        assert '/home/user/.vimrc' in registry
+        assert '/home/user/.bashrc' not in registry
+
+    def test_add(self, registry):
+        """
+        .add should insert new path in order or only update metadata of an existing one
+        """
+        assert registry.add('/home/user/.bashrc', mode=1) is True
+        assert registry.add('/home/user/.vimrc', tags=['vim']) is False
+
+        assert list(registry)[0] == '/home/user/.bashrc'
+        assert len(registry) == 6
+        assert registry.get_metadata('/home/user/.vimrc') == {'mode': 33188, 'tags': ['vim']}
+
+    def test_remove(self, registry):
+        """
+        .remove should remove the path and its metadata
+        """
+        registry.remove('/home/user/.vimrc')
+
+        assert '/home/user/.vimrc' not in registry
+        assert len(registry) == 4
+
+    def test_under(self, registry):
+        """
+        .under should return the path and all paths inside of it, but not paths only starting with the same name
+        """
+        assert list(registry.under('/home/user/.config/nvim/')) == [
+            '/home/user/.config/nvim',
+            '/home/user/.config/nvim/init.vim',
+            '/home/user/.config/nvim/lua/plugins.lua',
+        ]
+        assert list(registry.under('/home/user/.config')) == [
+            '/home/user/.config/nvim',
+            '/home/user/.config/nvim-qt',
+            '/home/user/.config/nvim/init.vim',
+            '/home/user/.config/nvim/lua/plugins.lua',
+        ]
+
+    def test_config(self, registry):
+        """
+        .to_config and .from_config should use the plain "files" list and the optional "files_meta" mapping
+        """
+        config = registry.to_config()
+
+        assert config['files'] == list(registry)
+        assert config['files_meta'] == {'/home/user/.vimrc': {'mode': 33188}}
+        assert list(FileRegistry.from_config(config)) == list(registry)
+        assert FileRegistry.from_config({'files': ['/a']}).to_config() == {'files': ['/a']}
+        assert len(FileRegistry.from_config({'files': None})) == 0
@@ -0,0 +1,124 @@
+from os import chmod
+from os import stat
+from os.path import join
+from stat import S_IMODE
+
+from mock import MagicMock
+from mock import patch
+from pytest import fixture
+from pytest import mark
+from pytest import raises
+from pytest import yield_fixture
+
+from confsave.journal import atomic_write
+from confsave.models import Endpoint
+from confsave.render import RenderError
+from confsave.render import Renderer
+from confsave.render import get_blob_hash
+
+
+def test_get_blob_hash():
+    """
+    get_blob_hash should return the same hash as git
+    """
+    assert get_blob_hash(b'hello\n') == 'ce013625030ba8dba906f756967f9e9ca394464a'
+
+
+class TestRenderer(object):
+
+    @fixture
+    def app(self, tmpdir):
+        app = MagicMock()
+        app.DEFAULT_PROFILE = 'default'
+        app.get_profile.return_value = None
+        app.get_home_path.return_value = str(tmpdir.mkdir('home'))
+        app.get_repo_path.return_value = str(tmpdir.mkdir('repo'))
+        app.get_rendered_path.return_value = str(tmpdir.join('repo', '.git', 'rendered'))
+        app.get_render_index_path.return_value = str(tmpdir.join('index.json'))
+        app.get_variables_path.return_value = str(tmpdir.join('vars'))
+        return app
+
+    @fixture
+    def endpoint(self, app):
+        with open(join(app.get_repo_path(), '.gitconfig'), 'w') as file:
+            file.write('[user]\n  name = $user on ${hostname} $$HOME $unknown\n')
+        return Endpoint(app, join(app.get_home_path(), '.gitconfig'))
+
+    @yield_fixture
+    def matomic_write(self):
+        with patch('confsave.render.atomic_write', wraps=atomic_write) as mock:
+            yield mock
+
+    def _write_variables(self, app, data):
+        with open(app.get_variables_path(), 'w') as file:
+            file.write(data)
+
+    def test_render(self, app, endpoint):
+        """
+        .render should substitute the host variables (the variables file overrides the builtin ones) keeping the mode
+        of the template
+        """
+        self._write_variables(app, 'user: alice\n')
+        chmod(endpoint.get_repo_path(), 0o600)
+
+        with patch('confsave.render.gethostname', return_value='web'):
+            path = Renderer(app).render(endpoint)
+
+        assert path == join(app.get_rendered_path(), '.gitconfig')
+        assert open(path).read() == '[user]\n  name = alice on web $HOME $unknown\n'
+        assert S_IMODE(stat(path).st_mode) == 0o600
+
+    @mark.parametrize('data', ['- a\n', 'user: [\n', 'text\n'])
+    def test_get_variables_invalid(self, app, data):
+        """
+        .get_variables should raise RenderError when the variables file is not a YAML mapping
+        """
+        self._write_variables(app, data)
+
+        with raises(RenderError):
+            Renderer(app).get_variables()
+
+    def test_render_not_text(self, app, endpoint):
+        """
+        .render should raise RenderError when the template is not an UTF-8 text
+        """
+        with open(endpoint.get_repo_path(), 'wb') as file:
+            file.write(b'\xff\xfe')
+
+        with raises(RenderError):
+            Renderer(app).render(endpoint)
+
+    def test_get_variables_of_user(self, app):
+        """
+        .get_variables should use the given user instead of the current one
+        """
+        assert Renderer(app, 'bob').get_variables()['user'] == 'bob'
+
+    def test_render_only_changed(self, app, endpoint, matomic_write):
+        """
+        .render should write the output only when the template or the variables changed since the last render
+        """
+        renderer = Renderer(app)
+        renderer.render(endpoint)
+        renderer.save()
+        assert matomic_write.call_count == 2
+
+        renderer = Renderer(app)
+        renderer.render(endpoint)
+        renderer.save()
+        assert matomic_write.call_count == 2
+
+        self._write_variables(app, 'user: bob\n')
+        renderer = Renderer(app)
+        renderer.render(endpoint)
+        renderer.save()
+        assert matomic_write.call_count == 4
+        assert 'bob' in open(endpoint.get_rendered_path()).read()
+
+        with open(endpoint.get_repo_path(), 'a') as file:
+            file.write('# new line\n')
+        renderer = Renderer(app)
+        renderer.render(endpoint)
+        renderer.save()
+        assert matomic_write.call_count == 6
+        assert open(endpoint.get_rendered_path()).read().endswith('# new line\n')
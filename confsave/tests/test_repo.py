@@ -1,7 +1,10 @@
+import tarfile
 from collections import OrderedDict
+from io import BytesIO
 from os import mkdir
 from os.path import exists
 from os.path import join
+from stat import S_ISREG
 from tempfile import NamedTemporaryFile
 
 from mock import MagicMock
@@ -11,10 +14,17 @@ from pytest import fixture
 from pytest import mark
 from pytest import yield_fixture
 from yaml import dump
-from yaml import load
+from yaml import safe_load
 
+from git import InvalidGitRepositoryError
+from git import NoSuchPathError
+from git import Repo
+
+from confsave.backups import BackupSession
 from confsave.models import Endpoint
+from confsave.registry import FileRegistry
 from confsave.repo import LocalRepo
+from confsave.results import DriftEntry
 
 
 class TestLocalRepo(object):
@@ -32,17 +42,16 @@ class TestLocalRepo(object):
     def app(self, repo_path):
         mock = MagicMock()
         mock.get_repo_path.return_value = repo_path
+        mock.get_config_cache_path.return_value = None
+        mock.get_journal_path.return_value = repo_path + '.journal'
+        mock.settings.JOURNAL_LIMIT = 100
+        mock.get_profile.return_value = None
         return mock
 
     @fixture
     def repo(self, app):
         return LocalRepo(app)
 
-    @yield_fixture
-    def mis_created(self, repo):
-        with patch.object(repo, 'is_created') as mock:
-            yield mock
-
     @yield_fixture
     def mrepo(self):
         with patch('confsave.repo.Repo') as mock:
@@ -78,6 +87,11 @@ class TestLocalRepo(object):
         with patch.object(repo, 'write_config') as mock:
             yield mock
 
+    @yield_fixture
+    def mcompact_config(self, repo):
+        with patch.object(repo, 'compact_config') as mock:
+            yield mock
+
     @yield_fixture
     def madd_ignore(self, repo):
         with patch.object(repo, 'add_ignore') as mock:
@@ -89,51 +103,67 @@ class TestLocalRepo(object):
         """
         assert repo.app == app
 
-    def test_is_created_when_path_not_exists(self, repo):
+    def test_is_initialized(self, repo, app):
         """
-        .is_created should return False if the folder is not existing
+        .is_initialized should return True only when the repo is created with the initial commit
         """
-        assert repo.is_created() is False
+        app.get_shared_object_store.return_value = None
+        assert repo.is_initialized() is False
 
-    def test_is_created_when_path_exists(self, repo):
-        """
-        .is_created should return False if the folder is existing, but it is
-        not a git repo
-        """
-        mkdir(repo.app.get_repo_path())
-        assert repo.is_created() is False
+        repo.init_git_repo()
+        assert LocalRepo(app).is_initialized() is False
 
-    def test_is_created_when_git_is_initalized(self, repo):
+        self._commit_file(repo, 'first', 'first')
+        ready = LocalRepo(app)
+        assert ready.is_initialized() is True
+        assert ready.git.working_dir == app.get_repo_path()
+
+    def test_is_initialized_without_store_link(self, repo, app):
         """
-        .is_created should return True if the folder is existing and the git
-        is initalized
+        .is_initialized should return False when the repo is not linked to the shared object store yet
         """
         repo.init_git_repo()
-        assert repo.is_created() is True
+        self._commit_file(repo, 'first', 'first')
+        app.get_shared_object_store.return_value.path = app.get_repo_path()
+        app.get_shared_object_store.return_value.is_linked.return_value = False
+
+        assert LocalRepo(app).is_initialized() is False
 
-    def test_init_git_repo_when_created(self, repo, mis_created, mrepo, repo_path):
+    def test_init_git_repo_when_created(self, repo, mrepo, repo_path):
         """"
-        .init_git_repo should do nothing if git repo is existing
+        .init_git_repo should only open the git repo if it is existing
         """
-        mis_created.return_value = True
-
         repo.init_git_repo()
 
         assert repo.git == mrepo.return_value
         mrepo.assert_called_once_with(repo_path)
+        assert not mrepo.init.called
 
-    def test_init_git_repo_when_not_created(self, repo, mis_created, mrepo, repo_path):
+    @mark.parametrize('error', [InvalidGitRepositoryError, NoSuchPathError])
+    def test_init_git_repo_when_not_created(self, repo, mrepo, repo_path, error):
         """"
         .init_git_repo should init git repo if not existing
         """
-        mis_created.return_value = False
+        mrepo.side_effect = error
 
         repo.init_git_repo()
 
-        assert repo.git == mrepo.return_value
+        assert repo.git == mrepo.init.return_value
         mrepo.init.assert_called_once_with(repo_path, mkdir=True)
         mrepo.assert_called_once_with(repo_path)
 
+    def test_init_git_repo_real(self, repo, repo_path):
+        """"
+        .init_git_repo should create the repo only once
+        """
+        repo.init_git_repo()
+        first = repo.git
+        repo.git = None
+
+        repo.init_git_repo()
+
+        assert repo.git.git_dir == first.git_dir
+
     def test_read_config_if_not_existing(self, repo, existing_repo_path, app):
         """
         .read_config should only flush the .config field if no config file exists
@@ -144,7 +174,8 @@ class TestLocalRepo(object):
 
         repo.read_config()
 
-        assert repo.config == {'files': []}
+        assert repo.config.keys() == {'files'}
+        assert list(repo.config['files']) == []
 
     def test_read_config_if_existing(self, repo, existing_repo_path, app):
         """
@@ -153,27 +184,135 @@ class TestLocalRepo(object):
         conf_path = join(existing_repo_path, '.conf.yaml')
         app.get_config_path.return_value = conf_path
         repo.config = {'garbage': 10}
-        expected_data = {'true': 'data'}
+        expected_data = {'true': 'data', 'files': ['/home/user/.vimrc'], 'files_meta': {'/home/user/.vimrc': {'a': 1}}}
         with open(conf_path, 'w') as file:
             dump(expected_data, file, default_flow_style=False)
 
         repo.read_config()
 
-        assert repo.config == expected_data
+        assert repo.config['true'] == 'data'
+        assert list(repo.config['files']) == ['/home/user/.vimrc']
+        assert repo.config['files'].get_metadata('/home/user/.vimrc') == {'a': 1}
+        assert 'files_meta' not in repo.config
+
+    def test_read_config_when_not_changed(self, repo, existing_repo_path, app, mwrite_config):
+        """
+        .read_config should not parse the config again when the file has not changed (long-lived daemon)
+        """
+        conf_path = join(existing_repo_path, '.conf.yaml')
+        app.get_config_path.return_value = conf_path
+        open(conf_path, 'w').close()
+        repo._update_config_signature()
+        repo.config = {'files': FileRegistry(['cached'])}
+
+        repo.read_config()
+
+        assert list(repo.config['files']) == ['cached']
+
+    def test_init_git_repo_when_already_opened(self, repo, mrepo, repo_path):
+        """
+        .init_git_repo should reuse already opened repo (long-lived daemon)
+        """
+        repo.git = MagicMock()
+        repo.git.working_dir = repo_path
+
+        repo.init_git_repo()
+
+        assert not mrepo.called
 
     def test_write_config(self, repo, existing_repo_path, app):
         """
-        .write_config should save config to a file
+        .write_config should save config to a file if it does not exist yet
+        """
+        conf_path = join(existing_repo_path, '.conf.yaml')
+        app.get_config_path.return_value = conf_path
+        repo.config = {'true': 10, 'files': FileRegistry(['/b', '/a'], {'/a': {'mode': 1}})}
+        expected_data = {'true': 10, 'files': ['/a', '/b'], 'files_meta': {'/a': {'mode': 1}}}
+
+        repo.write_config()
+
+        with open(conf_path, 'r') as file:
+            assert safe_load(file) == expected_data
+
+    def test_write_config_to_journal(self, repo, existing_repo_path, app):
+        """
+        .write_config should append changes to the journal instead of rewriting the config file, and .read_config
+        should replay the journal on the config file
         """
         conf_path = join(existing_repo_path, '.conf.yaml')
         app.get_config_path.return_value = conf_path
-        expected_data = {'true': 10}
-        repo.config = expected_data
+        repo.config = {'files': FileRegistry(['/a'])}
+        repo.write_config()
 
+        repo.track('/b', mode=1)
+        repo.track('/c')
+        repo.untrack('/a')
         repo.write_config()
 
         with open(conf_path, 'r') as file:
-            assert load(file) == expected_data
+            assert safe_load(file) == {'files': ['/a']}
+        other = LocalRepo(app)
+        other.read_config()
+        assert list(other.config['files']) == ['/b', '/c']
+        assert other.config['files'].get_metadata('/b') == {'mode': 1}
+
+    def test_write_config_when_journal_is_too_long(self, repo, existing_repo_path, app):
+        """
+        .write_config should compact the journal into the config file when the journal is too long
+        """
+        conf_path = join(existing_repo_path, '.conf.yaml')
+        app.get_config_path.return_value = conf_path
+        app.settings.JOURNAL_LIMIT = 1
+        repo.write_config()
+
+        repo.track('/a')
+        repo.write_config()
+        assert exists(app.get_journal_path())
+
+        repo.track('/b')
+        repo.write_config()
+
+        assert not exists(app.get_journal_path())
+        with open(conf_path, 'r') as file:
+            assert safe_load(file) == {'files': ['/a', '/b']}
+
+    def test_read_config_when_journal_changed(self, repo, existing_repo_path, app):
+        """
+        .read_config should read the config again when only the journal has changed (long-lived daemon)
+        """
+        conf_path = join(existing_repo_path, '.conf.yaml')
+        app.get_config_path.return_value = conf_path
+        repo.write_config()
+        repo.read_config()
+
+        other = LocalRepo(app)
+        other.track('/a')
+        other.write_config()
+        repo.read_config()
+
+        assert list(repo.config['files']) == ['/a']
+
+    def test_read_config_from_cache(self, repo, existing_repo_path, app):
+        """
+        .read_config should use the binary cache when it was made for the same config file
+        """
+        conf_path = join(existing_repo_path, '.conf.yaml')
+        app.get_config_path.return_value = conf_path
+        app.get_config_cache_path.return_value = join(existing_repo_path, 'config.cache')
+        repo.config = {'files': FileRegistry(['/home/user/.vimrc'])}
+        repo.write_config()
+
+        with patch('confsave.repo.load') as mload:
+            LocalRepo(app).read_config()
+            assert not mload.called
+
+        with open(conf_path, 'a') as file:
+            file.write('new: value\n')
+        other = LocalRepo(app)
+        other.read_config()
+
+        assert list(other.config['files']) == ['/home/user/.vimrc']
+        assert other.config['new'] == 'value'
 
     def test_add_endpoint_to_repo(self, existing_repo_path, repo, app):
         """
@@ -191,8 +330,12 @@ class TestLocalRepo(object):
 
         repo.init_git_repo()
         repo.add_endpoint_to_repo(endpoint)
+        repo.add_endpoint_to_repo(endpoint)
 
-        assert repo.config['files'] == [local_path]
+        assert list(repo.config['files']) == [local_path]
+        metadata = repo.config['files'].get_metadata(local_path)
+        assert metadata['hash'] == repo.git.git.hash_object(endpoint.get_repo_path())
+        assert S_ISREG(metadata['mode'])
 
     def test_set_remote_branch(self, repo, remote, mgit):
         """
@@ -306,25 +449,25 @@ class TestLocalRepo(object):
         mcreate_remote_branch.assert_called_once_with(remote)
         mset_remote_branch.assert_called_once_with(remote)
 
-    def test_init_branch_when_branch_already_initalized(self, repo, mgit, mwrite_config):
+    def test_init_branch_when_branch_already_initalized(self, repo, mgit, mcompact_config):
         """
         .init_branch should do nothing when the branch is already initalized.
         """
-        mgit.refs = [1]
+        mgit.head.is_valid.return_value = True
 
         repo.init_branch()
 
-        assert not mwrite_config.called
+        assert not mcompact_config.called
 
-    def test_init_branch_when_branch_not_initalized(self, repo, mgit, mwrite_config, app):
+    def test_init_branch_when_branch_not_initalized(self, repo, mgit, mcompact_config, app):
         """
         .init_branch should initalize branch when non has been initalized
         """
-        mgit.refs = []
+        mgit.head.is_valid.return_value = False
 
         repo.init_branch()
 
-        mwrite_config.assert_called_once_with()
+        mcompact_config.assert_called_once_with()
         app.get_config_path.assert_called_once_with()
 
         index = mgit.index
@@ -340,7 +483,7 @@ class TestLocalRepo(object):
 
         mget_remote.assert_called_once_with(None)
         mgit.index.commit.assert_called_once_with(sentinel.message)
-        remote.push.assert_called_once_with()
+        remote.push.assert_called_once_with('master:master')
 
     def test_commit_when_no_repo(self, repo, mget_remote, mgit):
         """
@@ -366,6 +509,30 @@ class TestLocalRepo(object):
         mgit.index.diff.assert_called_once_with(None)
         mgit.index.add.assert_called_once_with([diff1.a_path, diff2.a_path])
 
+    def test_iter_status(self, repo, existing_repo_path, app):
+        """
+        .iter_status should yield fields of the porcelain status, also when they are split between the chunks
+        """
+        repo.init_git_repo()
+        for name in ['first', 'second file', 'third']:
+            with open(join(existing_repo_path, name), 'w') as file:
+                file.write(name)
+        repo.git.index.add(['first'])
+
+        fields = list(repo.iter_status(chunk_size=3))
+
+        assert fields == ['A  first', '?? second file', '?? third']
+
+    def test_commit_compacts_journal(self, repo, mget_remote, mgit, mcompact_config):
+        """
+        .commit should compact the journal before the commit, so the config file in the commit is complete
+        """
+        repo.track('/a')
+
+        repo.commit(None)
+
+        mcompact_config.assert_called_once_with()
+
     def test_add_ignore_when_file_not_exists(self, repo, app, existing_repo_path, mgit):
         """
         .add_ignore should create proper .gitignore file
@@ -400,7 +567,7 @@ class TestLocalRepo(object):
 
         mgit.index.add.assert_called_once_with([gitignore_path])
 
-    def test_create_backup(self, repo, app, existing_repo_path, madd_ignore):
+    def test_create_backup(self, repo, app, existing_repo_path, madd_ignore, mgit):
         """
         .create_backup should create backup dir only once
         """
@@ -408,6 +575,7 @@ class TestLocalRepo(object):
         path = join(existing_repo_path, name)
         app.settings.BACKUP_NAME = name
         app.get_backup_path.return_value = path
+        app.get_backup_session.return_value = BackupSession(name)
 
         repo.create_backup()
         repo.create_backup()
@@ -415,6 +583,226 @@ class TestLocalRepo(object):
         madd_ignore.assert_called_once_with(name + '_*')
         assert exists(app.get_backup_path.return_value)
 
+    def test_create_backup_without_git(self, repo, app, existing_repo_path, madd_ignore):
+        """
+        .create_backup should create backup dir without touching the .gitignore when there is no git repo (import)
+        """
+        path = join(existing_repo_path, 'not', 'existing', 'backup')
+        app.get_backup_path.return_value = path
+        app.get_backup_session.return_value = BackupSession('backup')
+
+        repo.create_backup()
+
+        assert not madd_ignore.called
+        assert exists(path)
+
+    def test_export_archive(self, repo, app, existing_repo_path):
+        """
+        .export_archive should write only tracked files from the commit into the stream
+        """
+        app.get_home_path.return_value = '/home/user'
+        app.settings.CONFIG_FILENAME = '.conf.yaml'
+        repo.init_git_repo()
+        for name in ['.vimrc', '.untracked']:
+            with open(join(existing_repo_path, name), 'w') as file:
+                file.write(name)
+        repo.git.index.add(['.vimrc', '.untracked'])
+        repo.git.index.commit('first')
+        stream = BytesIO()
+
+        with patch.object(repo, 'get_config_at') as mget_config_at:
+            mget_config_at.return_value = {'files': ['/home/user/.vimrc', '/home/user/.missing']}
+            assert repo.export_archive(stream, 'HEAD') == ['.vimrc']
+
+        stream.seek(0)
+        with tarfile.open(fileobj=stream, mode='r:gz') as archive:
+            assert archive.getnames() == ['.vimrc']
+            assert archive.extractfile('.vimrc').read() == b'.vimrc'
+
+    def test_export_archive_without_files(self, repo, mgit):
+        """
+        .export_archive should write an empty archive when there is nothing to export
+        """
+        stream = BytesIO()
+        with patch.object(repo, 'get_tracked_paths_at') as mget_tracked_paths_at:
+            mget_tracked_paths_at.return_value = []
+            repo.export_archive(stream)
+
+        assert not mgit.archive.called
+        stream.seek(0)
+        with tarfile.open(fileobj=stream, mode='r:gz') as archive:
+            assert archive.getnames() == []
+
+    def _commit_file(self, repo, name, data):
+        with open(join(repo.app.get_repo_path(), name), 'w') as file:
+            file.write(data)
+        repo.git.index.add([name])
+        repo.git.index.commit(name)
+        repo.git.active_branch.rename(repo.BRANCH_NAME, force=True)
+
+    def test_bundles(self, repo, existing_repo_path):
+        """
+        .create_bundle should bundle only commits not yet bundled for the peer, and .apply_bundle should pull them
+        """
+        repo.init_git_repo()
+        self._commit_file(repo, 'first', 'first')
+        other = LocalRepo(MagicMock())
+        other.app.get_repo_path.return_value = NamedTemporaryFile().name
+        other.app.get_profile.return_value = None
+        other.git = Repo.clone_from(existing_repo_path, other.app.get_repo_path())
+        bundle_path = NamedTemporaryFile().name
+        assert repo.get_bundled_commit('other') is None
+
+        assert repo.create_bundle(bundle_path, 'other', since=other.git.head.commit.hexsha) is False
+        assert repo.create_bundle(bundle_path, 'other') is True  # nothing bundled yet, so whole branch
+        first = repo.git.head.commit.hexsha
+        assert repo.get_bundled_commit('other') == first
+
+        self._commit_file(repo, 'second', 'second')
+        assert repo.create_bundle(bundle_path, 'other') is True
+        assert repo.get_bundled_commit('other') == repo.git.head.commit.hexsha
+        with open(bundle_path, 'rb') as file:
+            header = file.read().split(b'\n\n')[0]
+        assert ('-' + first).encode() in header  # the first commit is only a prerequisite of the bundle
+        assert repo.create_bundle(bundle_path, 'other') is False
+
+        other.apply_bundle(bundle_path)
+        assert other.git.head.commit.hexsha == repo.git.head.commit.hexsha
+        assert open(join(other.app.get_repo_path(), 'second')).read() == 'second'
+
+    def test_init_profile(self, repo, app, existing_repo_path):
+        """
+        .init_profile should create the branch of the profile from the default one and its worktree only once
+        """
+        repo.init_git_repo()
+        self._commit_file(repo, 'first', 'first')
+        profile_path = join(existing_repo_path, '.git', 'profiles', 'web')
+        app.get_main_repo_path.return_value = existing_repo_path
+        app.get_profile_path.return_value = profile_path
+
+        assert repo.init_profile('web') is True
+        assert repo.init_profile('web') is False
+
+        assert open(join(profile_path, 'first')).read() == 'first'
+        app.get_profile.return_value = 'web'
+        app.get_repo_path.return_value = profile_path
+        repo.init_git_repo()
+        assert repo.get_branch_name() == 'profile/web'
+        assert repo.git.active_branch.name == 'profile/web'
+        assert repo.git.working_dir == profile_path
+
+    def test_get_drift(self, repo, app, existing_repo_path):
+        """
+        .get_drift should report tracked paths which differ on the branches of the other profiles
+        """
+        repo.init_git_repo()
+        self._commit_file(repo, 'first', 'first')
+        self._commit_file(repo, 'second', 'second')
+        profile_path = join(existing_repo_path, '.git', 'profiles', 'web')
+        app.DEFAULT_PROFILE = 'default'
+        app.get_main_repo_path.return_value = existing_repo_path
+        app.get_profile_path.return_value = profile_path
+        app.get_home_path.return_value = '/home/user'
+        repo.init_profile('web')
+        with open(join(profile_path, 'first'), 'w') as file:
+            file.write('changed')
+        web = Repo(profile_path)
+        web.index.add(['first'])
+        web.index.commit('changed')
+        repo.config = {'files': ['/home/user/first', '/home/user/second']}
+
+        report = repo.get_drift()
+
+        assert report.reference == 'default'
+        assert report.hosts == ['default', 'web']
+        assert report.entries == [DriftEntry('first', ('.', 'M'))]
+
+    def test_get_drift_remote_only_path(self, repo, app, existing_repo_path):
+        """
+        .get_drift should report paths tracked only by the config of other hosts and parse their shared config once
+        """
+        repo.init_git_repo()
+        app.settings.CONFIG_FILENAME = '.confsave.yaml'
+        self._commit_file(repo, 'first', 'first')
+        app.DEFAULT_PROFILE = 'default'
+        app.get_main_repo_path.return_value = existing_repo_path
+        app.get_profile_path.side_effect = lambda profile: join(existing_repo_path, '.git', 'profiles', profile)
+        app.get_home_path.return_value = '/home/user'
+        for profile in ['lab', 'web']:
+            repo.init_profile(profile)
+            profile_path = app.get_profile_path(profile)
+            with open(join(profile_path, 'zshrc'), 'w') as file:
+                file.write(profile)
+            with open(join(profile_path, '.confsave.yaml'), 'w') as file:
+                file.write('files:\n- /home/user/first\n- /home/user/zshrc\n')
+            git = Repo(profile_path)
+            git.index.add(['zshrc', '.confsave.yaml'])
+            git.index.commit('zsh')
+        repo.config = {'files': ['/home/user/first']}
+
+        with patch.object(repo, '_load_config_blob', wraps=repo._load_config_blob) as mload_config_blob:
+            report = repo.get_drift()
+
+        assert report.hosts == ['default', 'lab', 'web']
+        assert report.entries == [DriftEntry('zshrc', ('.', 'A', 'A'))]
+        assert mload_config_blob.call_count == 1
+
+    def _make_backup(self, repo_path, name, size):
+        path = join(repo_path, name)
+        mkdir(path)
+        with open(join(path, 'file'), 'w') as file:
+            file.write('x' * size)
+        return path
+
+    def test_get_backups(self, repo, app, existing_repo_path):
+        """
+        .get_backups should return backup folders sorted from the oldest one
+        """
+        app.settings.BACKUP_NAME = 'backup'
+        second = self._make_backup(existing_repo_path, 'backup_17_06_02', 1)
+        first = self._make_backup(existing_repo_path, 'backup_17_06_01', 1)
+        self._make_backup(existing_repo_path, 'other_17_06_01', 1)
+        open(join(existing_repo_path, 'backup_file'), 'w').close()
+
+        assert [backup.path for backup in repo.get_backups()] == [first, second]
+
+    def test_prune_backups(self, repo, app, existing_repo_path):
+        """
+        .prune_backups should remove backups out of the limits, but never the backup of the current run
+        """
+        app.settings.BACKUP_NAME = 'backup'
+        app.settings.BACKUP_KEEP_LAST = 1
+        app.settings.BACKUP_MAX_AGE = None
+        app.settings.BACKUP_MAX_SIZE = None
+        first = self._make_backup(existing_repo_path, 'backup_17_06_01', 10)
+        second = self._make_backup(existing_repo_path, 'backup_17_06_02', 20)
+        app.get_backup_path.return_value = first
+
+        assert repo.prune_backups() == 20
+
+        assert exists(first)
+        assert not exists(second)
+
+    def test_backup_retention(self, repo, app, mcompact_config):
+        """
+        .store_backup_retention should store limits from the settings in the config only when they changed, and
+        .get_backup_retention should use them unless the settings override them
+        """
+        app.settings.BACKUP_KEEP_LAST = 3
+        app.settings.BACKUP_MAX_AGE = None
+        app.settings.BACKUP_MAX_SIZE = 0
+
+        assert repo.store_backup_retention() is True
+        assert repo.store_backup_retention() is False
+
+        mcompact_config.assert_called_once_with()
+        assert repo.config['backup_retention'] == dict(keep_last=3, max_size=0)
+
+        app.settings.BACKUP_KEEP_LAST = None
+        app.settings.BACKUP_MAX_AGE = 7
+
+        assert repo.get_backup_retention() == dict(keep_last=3, max_age=7, max_size=0)
+
     @mark.parametrize(
         'filedata, name, result',
         [
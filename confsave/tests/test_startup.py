@@ -0,0 +1,50 @@
+import sys
+from os.path import abspath
+from os.path import dirname
+from subprocess import PIPE
+from subprocess import run
+
+ROOT = dirname(dirname(dirname(abspath(__file__))))
+HEAVY_MODULES = ['git', 'yaml']
+IMPORT_BUDGET = 80000  # us, "import git" alone takes more then that
+
+
+class TestStartup(object):
+
+    def _run_help(self, *options):
+        code = (
+            'import sys\n'
+            'sys.argv = ["cs", "--help"]\n'
+            'from confsave.cmd import run\n'
+            'try:\n'
+            '    run()\n'
+            'except SystemExit:\n'
+            '    pass\n'
+            'sys.stderr.write(repr([name for name in {} if name in sys.modules]))\n'
+        ).format(HEAVY_MODULES)
+        return run(
+            [sys.executable] + list(options) + ['-c', code],
+            stdout=PIPE,
+            stderr=PIPE,
+            universal_newlines=True,
+            cwd=ROOT,
+        )
+
+    def test_help_does_not_import_heavy_modules(self):
+        """
+        cs --help should not import git nor yaml
+        """
+        process = self._run_help()
+
+        assert process.stderr == '[]'
+        assert 'usage: cs' in process.stdout
+
+    def test_help_import_budget(self):
+        """
+        Import of confsave.cmd should fit in the budget
+        """
+        process = self._run_help('-X', 'importtime')
+
+        line = [line for line in process.stderr.splitlines() if line.endswith('| confsave.cmd')][0]
+        cumulative = int(line.split('|')[1])
+        assert cumulative < IMPORT_BUDGET
@@ -0,0 +1,172 @@
+from os import mkdir
+from os.path import join
+from tempfile import mkdtemp
+
+from mock import MagicMock
+from pytest import fixture
+
+from confsave.lock import EXCLUSIVE
+from confsave.watch import IN_CLOSE_WRITE
+from confsave.watch import IN_CREATE
+from confsave.watch import IN_IGNORED
+from confsave.watch import IN_ISDIR
+from confsave.watch import IN_MOVED_TO
+from confsave.watch import IN_Q_OVERFLOW
+from confsave.watch import Inotify
+from confsave.watch import Watcher
+
+
+class TestInotify(object):
+
+    def test_read_events(self):
+        """
+        Inotify should report file saved by rename in the watched folder
+        """
+        path = mkdtemp()
+        inotify = Inotify()
+        wd = inotify.add_watch(path)
+        try:
+            assert inotify.read_events() == []
+
+            with open(join(path, '.vimrc.swp'), 'w') as file:
+                file.write('data')
+
+            events = inotify.read_events()
+        finally:
+            inotify.close()
+
+        assert (wd, IN_CREATE, '.vimrc.swp') in events
+        assert (wd, IN_CLOSE_WRITE, '.vimrc.swp') in events
+
+
+class TestWatcher(object):
+
+    @fixture
+    def home_path(self):
+        return mkdtemp()
+
+    @fixture
+    def repo_path(self):
+        path = mkdtemp()
+        mkdir(join(path, '.config'))
+        mkdir(join(path, '.config', 'nvim'))
+        open(join(path, '.vimrc'), 'w').close()
+        return path
+
+    @fixture
+    def app(self, home_path, repo_path):
+        mock = MagicMock()
+        mock.get_home_path.return_value = home_path
+        mock.get_repo_path.return_value = repo_path
+        mock.get_config_path.return_value = join(repo_path, '.confsave.yaml')
+        mock.get_journal_path.return_value = join(repo_path, '.git', 'confsave.journal')
+        mock.repo.config = {'files': [join(home_path, '.vimrc'), join(home_path, '.config', 'nvim')]}
+        return mock
+
+    @fixture
+    def inotify(self):
+        mock = MagicMock()
+        mock.add_watch.side_effect = lambda path: len(mock.add_watch.call_args_list)
+        return mock
+
+    @fixture
+    def watcher(self, app, inotify):
+        watcher = Watcher(app, debounce=2, inotify=inotify)
+        watcher.watch_tracked()
+        return watcher
+
+    def _wd(self, watcher, path):
+        return [wd for wd, watched in watcher.watches.items() if watched == path][0]
+
+    def test_watch_tracked(self, watcher, repo_path):
+        """
+        .watch_tracked should watch parent folders of the tracked paths, all folders inside tracked folders and the
+        folder of the journal
+        """
+        assert sorted(watcher.watches.values()) == [
+            repo_path,
+            join(repo_path, '.config'),
+            join(repo_path, '.config', 'nvim'),
+            join(repo_path, '.git'),
+        ]
+
+    def test_handle_events_debounce(self, watcher, repo_path):
+        """
+        .handle_events should start the burst for tracked paths only and .get_timeout should wait for the end of it
+        """
+        root = self._wd(watcher, repo_path)
+
+        assert watcher.handle_events([(root, IN_CREATE, 'untracked')], now=10) is False
+        assert watcher.get_timeout(10) is None
+
+        watcher.handle_events([(root, IN_MOVED_TO, '.vimrc')], now=10)
+        watcher.handle_events([(root, IN_CLOSE_WRITE, '.vimrc')], now=11)
+
+        assert watcher.get_timeout(12) == 1
+        assert watcher.get_timeout(14) == 0
+
+    def test_handle_events_new_folder(self, watcher, repo_path, inotify):
+        """
+        .handle_events should watch new folders created inside of the tracked folder
+        """
+        nvim = join(repo_path, '.config', 'nvim')
+        mkdir(join(nvim, 'plugins'))
+
+        watcher.handle_events([(self._wd(watcher, nvim), IN_CREATE | IN_ISDIR, 'plugins')], now=10)
+
+        assert join(nvim, 'plugins') in watcher.watches.values()
+        assert watcher.last_event == 10
+
+    def test_handle_events_config_changed(self, watcher, repo_path, app):
+        """
+        .handle_events should report config change (for example new path added)
+        """
+        assert watcher.handle_events([(self._wd(watcher, repo_path), IN_MOVED_TO, '.confsave.yaml')], now=10) is True
+
+    def test_handle_events_journal_changed(self, watcher, repo_path, app):
+        """
+        .handle_events should report config change when the journal has changed
+        """
+        git_dir = self._wd(watcher, join(repo_path, '.git'))
+
+        assert watcher.handle_events([(git_dir, IN_CREATE, 'index.lock')], now=10) is False
+        assert watcher.handle_events([(git_dir, IN_CLOSE_WRITE, 'confsave.journal')], now=10) is True
+
+    def test_handle_events_special(self, watcher, repo_path):
+        """
+        .handle_events should start the burst on queue overflow and forget removed watches
+        """
+        root = self._wd(watcher, repo_path)
+
+        watcher.handle_events([(-1, IN_Q_OVERFLOW, ''), (root, IN_IGNORED, '')], now=10)
+
+        assert watcher.last_event == 10
+        assert root not in watcher.watches
+
+    def test_flush(self, watcher, app):
+        """
+        .flush should end the burst and commit only when there are any changes
+        """
+        watcher.last_event = 10
+        app.repo.git.is_dirty.return_value = False
+
+        assert watcher.flush() is False
+        assert not app.repo.commit.called
+
+        app.repo.git.is_dirty.return_value = True
+
+        assert watcher.flush() is True
+        app.repo.commit.assert_called_once_with('automatic configuration stamp')
+        assert watcher.last_event is None
+
+    def test_flush_stages_tracked_paths(self, watcher, app, repo_path):
+        """
+        .flush should stage all changes (with the new files) of the existing tracked paths with the lock held
+        """
+        watcher.tracked.add(join(repo_path, '.removed'))
+
+        watcher.flush()
+
+        app.repo.git.git.add.assert_called_once_with(
+            '--all', '--', join(repo_path, '.config', 'nvim'), join(repo_path, '.vimrc'))
+        app.get_lock.return_value.hold.assert_called_with(EXCLUSIVE)
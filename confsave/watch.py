@@ -0,0 +1,221 @@
+import struct
+from ctypes import CDLL
+from ctypes import get_errno
+from ctypes.util import find_library
+from os import close
+from os import fsencode
+from os import read
+from os import strerror
+from os import walk
+from os.path import dirname
+from os.path import exists
+from os.path import isdir
+from os.path import join
+from select import select
+from time import monotonic
+
+from confsave.lock import EXCLUSIVE
+from confsave.models import Endpoint
+
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# editors which save by rename are reported by MOVED_TO/CREATE on the parent folder
+WATCH_MASK = IN_CLOSE_WRITE | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_ONLYDIR
+EVENT = struct.Struct('iIII')
+
+
+class InotifyError(Exception):
+    pass
+
+
+class Inotify(object):
+    """
+    Minimal inotify binding (Linux only).
+    """
+
+    def __init__(self):
+        self.libc = CDLL(find_library('c'), use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            self._raise()
+
+    def _raise(self):
+        raise InotifyError(strerror(get_errno()))
+
+    def fileno(self):
+        return self.fd
+
+    def add_watch(self, path, mask=WATCH_MASK):
+        """
+        Watch the folder. Return watch descriptor.
+        """
+        wd = self.libc.inotify_add_watch(self.fd, fsencode(path), mask)
+        if wd < 0:
+            self._raise()
+        return wd
+
+    def rm_watch(self, wd):
+        self.libc.inotify_rm_watch(self.fd, wd)
+
+    def read_events(self):
+        """
+        Read all pending events. Return list of (wd, mask, name).
+        """
+        try:
+            data = read(self.fd, 65536)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT.unpack_from(data, offset)
+            offset += EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0').decode('utf8', 'surrogateescape')
+            offset += length
+            events.append((wd, mask, name))
+        return events
+
+    def close(self):
+        close(self.fd)
+
+
+class Watcher(object):
+    """
+    Watch tracked files and make one commit for every burst of changes. Burst ends when there was no event for the
+    debounce time.
+    """
+
+    def __init__(self, app, debounce=2.0, inotify=None, message='automatic configuration stamp'):
+        self.app = app
+        self.debounce = debounce
+        self.inotify = inotify or Inotify()
+        self.message = message
+        self.watches = {}
+        self.watched = set()
+        self.tracked = set()
+        self.tracked_folders = set()
+        self.last_event = None
+
+    def watch_tracked(self):
+        """
+        Watch parent folders of all tracked paths, all folders inside the tracked folders and the config files.
+        """
+        for wd in list(self.watches):
+            self.inotify.rm_watch(wd)
+        self.watches = {}
+        self.watched = set()
+        self.tracked = set()
+        self.tracked_folders = set()
+
+        self._add_watch(self.app.get_repo_path())
+        self._add_watch(dirname(self.app.get_journal_path()))
+        for path in self.app.repo.config['files']:
+            target = Endpoint(self.app, path).get_repo_path()
+            self.tracked.add(target)
+            self._add_watch(dirname(target))
+            if isdir(target):
+                self.tracked_folders.add(target)
+                self._add_tree(target)
+
+    def _add_watch(self, path):
+        if path in self.watched:
+            return
+        try:
+            self.watches[self.inotify.add_watch(path)] = path
+            self.watched.add(path)
+        except InotifyError:
+            # folder has been removed in the meantime
+            pass
+
+    def _add_tree(self, path):
+        for root, dirs, files in walk(path):
+            self._add_watch(root)
+
+    def is_tracked(self, path):
+        """
+        Is this path tracked (or inside of a tracked folder)?
+        """
+        if path in self.tracked:
+            return True
+        return any(path.startswith(folder + '/') for folder in self.tracked_folders)
+
+    def handle_events(self, events, now):
+        """
+        Update watches and the burst state. Return True if the config has changed.
+        """
+        config_changed = False
+        for wd, mask, name in events:
+            if mask & IN_Q_OVERFLOW:
+                self.last_event = now
+                continue
+            if mask & IN_IGNORED:
+                self.watched.discard(self.watches.pop(wd, None))
+                continue
+            folder = self.watches.get(wd)
+            if folder is None:
+                continue
+            path = join(folder, name)
+            if path in (self.app.get_config_path(), self.app.get_journal_path()):
+                config_changed = True
+            elif not self.is_tracked(path):
+                continue
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                self._add_tree(path)
+            self.last_event = now
+        return config_changed
+
+    def get_timeout(self, now):
+        """
+        Time to wait for the next event. None means no burst is pending.
+        """
+        if self.last_event is None:
+            return None
+        return max(0, self.last_event + self.debounce - now)
+
+    def flush(self):
+        """
+        End the burst and commit the changes (with the repo lock held, like the commit command). All changes of the
+        tracked paths are staged first, so new files in the tracked folders are commited too.
+        """
+        self.last_event = None
+        with self.app.get_lock().hold(EXCLUSIVE):
+            git = self.app.repo.git
+            paths = sorted(path for path in self.tracked if exists(path))
+            if paths:
+                git.git.add('--all', '--', *paths)
+            if git.is_dirty():
+                self.app.repo.commit(self.message)
+                return True
+        return False
+
+    def step(self):
+        """
+        Wait for the events or for the end of the burst. Return True if commit was made.
+        """
+        ready, _, _ = select([self.inotify], [], [], self.get_timeout(monotonic()))
+        if ready:
+            if self.handle_events(self.inotify.read_events(), monotonic()):
+                self.app.repo.read_config()
+                self.watch_tracked()
+            return False
+        return self.flush()
+
+    def run(self):
+        """
+        Watch the tracked files forever.
+        """
+        self.watch_tracked()
+        while True:
+            if self.step():
+                yield
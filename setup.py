@@ -18,7 +18,7 @@ if __name__ == '__main__':
         description='Configuration Saver',
         url='https://github.com/socek/confsave',
         license='Apache License 2.0',
-        packages=find_packages('.'),
+        packages=find_packages('.', exclude=['benchmarks', 'benchmarks.*']),
         package_dir={'': '.'},
         install_requires=install_requires,
         entry_points={